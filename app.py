@@ -1,32 +1,76 @@
-from flask import Flask, render_template, request, jsonify
+import time
+# 起動時間の計測（/api/health で報告）
+BOOT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, g, render_template, request, jsonify
 import random
 from datetime import datetime
 import os
+import logging
 from werkzeug.utils import secure_filename
 import sys
 import json
+import base64
+import binascii
+import re
+import threading
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import numpy as np
 
-# identify.pyをインポート
+import metrics
+from metrics import span
+from warmup import Warmup, SkipStep
+
+# ログレベル（既定は INFO。LOG_LEVEL=DEBUG でリクエストごとの詳細も出力）
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
+logger = logging.getLogger(__name__)
+
+# identify.py（torch / speechbrain を読み込むため）は起動後にウォームアップスレッドで読み込む
+speaker_id = None
+
+from log_writer import JsonlLogWriter
+from session_store import create_session_store, DEFAULT_SESSION
+from speaker_cascade import identify_cascade, get_gmm_scorer, tier_stats, CASCADE_ENABLED
+from speaker_index import SPEAKER_LABELS
+from history_store import HistoryStore, BUCKETS
+from batch_classify import classify_batch, confusion_matrices, decode_items, tier_summary
+from julius_asr import JULIUS_ENABLED, AsrBusy, get_asr
+from audio_io import (decode_audio, decode_pcm16, is_pcm16, save_wav, trim_silence, cap_seconds,
+                      AudioStreamSession, TARGET_SR)
+from inference_pool import (InferencePool, Overloaded, StageTimeout, decode_job, embed_job,
+                            decode_items_job, embed_batch_job)
+from memory_report import process_memory
+
+# WebSocketによるストリーミング受信（flask-sock が必要）
 try:
-    from identify import identify
-    SPEAKER_ID_AVAILABLE = True
-    print("✅ 話者識別モジュール (identify.py) を読み込みました")
+    from flask_sock import Sock
+    STREAMING_AVAILABLE = True
 except Exception as e:
-    SPEAKER_ID_AVAILABLE = False
-    print(f"⚠️  話者識別モジュールが利用できません: {e}")
-    print("   キーワードベースの判定を使用します")
+    STREAMING_AVAILABLE = False
+    logger.warning(f"⚠️  ストリーミング受信が利用できません: {e}")
 
 # attitude_analyzer.pyをインポート
 try:
-    from attitude_analyzer import classify_command, judge_attitude, get_response_by_attitude
+    from attitude_analyzer import analyze_utterance, get_response_by_attitude, response_vocabulary
     ATTITUDE_ANALYZER_AVAILABLE = True
-    print("✅ 態度分析モジュール (attitude_analyzer.py) を読み込みました")
+    logger.info("✅ 態度分析モジュール (attitude_analyzer.py) を読み込みました")
 except Exception as e:
     ATTITUDE_ANALYZER_AVAILABLE = False
-    print(f"⚠️  態度分析モジュールが利用できません: {e}")
+    logger.warning(f"⚠️  態度分析モジュールが利用できません: {e}")
+
+# tts.pyをインポート（応答音声の合成キャッシュ）
+try:
+    import tts
+    TTS_AVAILABLE = tts.is_available()
+    if not TTS_AVAILABLE:
+        logger.warning("⚠️  open_jtalk が見つかりません。応答音声の合成は行いません")
+except Exception as e:
+    TTS_AVAILABLE = False
+    logger.warning(f"⚠️  音声合成モジュールが利用できません: {e}")
 
 app = Flask(__name__)
+sock = Sock(app) if STREAMING_AVAILABLE else None
 
 # アップロードフォルダの設定
 UPLOAD_FOLDER = 'uploads'
@@ -41,51 +85,289 @@ if not os.path.exists(LOG_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['LOG_FOLDER'] = LOG_FOLDER
+# ログセグメントのローテーション条件
+app.config['LOG_SEGMENT_MAX_BYTES'] = int(os.environ.get('LOG_SEGMENT_MAX_BYTES', str(10 * 1024 * 1024)))
+app.config['LOG_SEGMENT_MAX_AGE'] = float(os.environ.get('LOG_SEGMENT_MAX_AGE', str(24 * 3600)))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB制限
+# 受信音声を uploads/ に保存するか（既定ではメモリ上のみで処理）
+app.config['ARCHIVE_AUDIO'] = os.environ.get('ARCHIVE_AUDIO', '0') == '1'
+# 話者識別の前にVADで無音を除去し、有声区間を上限秒数で切り詰める
+app.config['VAD_ENABLED'] = os.environ.get('VAD_ENABLED', '1') == '1'
+app.config['VAD_AGGRESSIVENESS'] = int(os.environ.get('VAD_AGGRESSIVENESS', '2'))
+app.config['MAX_VOICED_SEC'] = float(os.environ.get('MAX_VOICED_SEC', '5.0'))
+# 一括分類APIで1リクエストに受け付ける最大件数
+app.config['BATCH_MAX_ITEMS'] = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+# 一括分類のデコード・embedding をそれぞれ推論プールで待つ最大秒数
+app.config['BATCH_TIMEOUT_SEC'] = float(os.environ.get('BATCH_TIMEOUT_SEC', '120'))
+# 起動時に応答文の音声をまとめて事前合成するか
+app.config['TTS_PRERENDER'] = os.environ.get('TTS_PRERENDER', '1') == '1'
+# 応答をサーバー側のスピーカーでも読み上げるか（aplay）
+app.config['TTS_PLAYBACK'] = os.environ.get('TTS_PLAYBACK', '0') == '1'
+# 受信した音声をサーバー側の Julius でも認識するか（結果はブラウザのテキストより優先）
+app.config['JULIUS_ENABLED'] = JULIUS_ENABLED
+# セッション状態の保存先（memory: 1プロセス内 / sqlite: 複数ワーカーで共有）と会話ログの保持件数
+app.config['SESSION_STORE'] = os.environ.get('SESSION_STORE', 'memory')
+app.config['SESSION_DB'] = os.environ.get('SESSION_DB', os.path.join(LOG_FOLDER, 'sessions.sqlite3'))
+app.config['SESSION_LOG_SIZE'] = int(os.environ.get('SESSION_LOG_SIZE', '10'))
+# ウォームアップ中に届いた音声付きリクエストが話者識別の準備を待つ最大秒数（超えたらキーワード判定）
+app.config['WARMUP_WAIT_SEC'] = float(os.environ.get('WARMUP_WAIT_SEC', '5'))
+# デコード・embedding推論を実行するプロセス数（0 でリクエストのスレッドで実行）と、実行中 + 待ちの上限
+app.config['INFERENCE_WORKERS'] = int(os.environ.get('INFERENCE_WORKERS', '0'))
+app.config['INFERENCE_QUEUE'] = int(os.environ.get('INFERENCE_QUEUE', '8'))
+# 段階ごとのタイムアウト（秒）。超えたら音声なし・GMM・ブラウザのテキストで応答を続ける
+app.config['DECODE_TIMEOUT_SEC'] = float(os.environ.get('DECODE_TIMEOUT_SEC', '10'))
+app.config['EMBED_TIMEOUT_SEC'] = float(os.environ.get('EMBED_TIMEOUT_SEC', '5'))
+app.config['ASR_TIMEOUT_SEC'] = float(os.environ.get('ASR_TIMEOUT_SEC', '10'))
+
+# CPU負荷の高いデコード・embedding推論は別プロセスで実行し、満杯なら 503 を返す
+# （`python3 app.py` の開発サーバーでは使わない。spawn したワーカーが app.py 自体を読み込み直すため）
+# gunicorn のマスターでエンコーダーを読み込み済み（PRELOAD_MODEL=1）なら、プールも fork して重みのページを共有する
+# fork はスレッドが1本だけのうちに行うため、ログ書き込み・事前合成・ウォームアップなどのスレッドより先に起動する
+inference_pool = None
+if app.config['INFERENCE_WORKERS'] > 0:
+    if __name__ == '__main__':
+        logger.warning("⚠️  INFERENCE_WORKERS は本番モード（./start.sh prod）でのみ有効です")
+    else:
+        preloaded = getattr(sys.modules.get('identify'), '_classifier', None) is not None
+        inference_pool = InferencePool(
+            workers=app.config['INFERENCE_WORKERS'],
+            max_pending=app.config['INFERENCE_QUEUE'],
+            start_method="fork" if preloaded else "spawn",
+            preload=not preloaded
+        )
+        if inference_pool.start_method == "fork":
+            try:
+                inference_pool.start()
+            except Exception as e:
+                logger.error(f"❌ 推論プールを起動できません（ウォームアップで再試行します）: {e}")
+
+# 会話履歴DB（ログ書き込みスレッドがバッチごとに追記する）
+history = HistoryStore(os.path.join(LOG_FOLDER, 'history.sqlite3'))
+
+log_writer = JsonlLogWriter(
+    LOG_FOLDER,
+    max_bytes=app.config['LOG_SEGMENT_MAX_BYTES'],
+    max_age=app.config['LOG_SEGMENT_MAX_AGE'],
+    on_batch=history.insert_many
+)
 
-# グローバル状態（実際のシステムと連携する際に置き換える）
-system_state = {
-    "sync_rate": 0,
-    "speaker": "UNKNOWN",
-    "status": "IDLE",
-    "conversation_log": []
+# セッション（端末・ブラウザ）ごとのシステム状態（実際のシステムと連携する際に置き換える）
+sessions = create_session_store(
+    app.config['SESSION_STORE'],
+    app.config['SESSION_DB'],
+    log_size=app.config['SESSION_LOG_SIZE']
+)
+# セッションIDに使える文字（英数字・記号の一部、64文字まで）
+SESSION_ID_RE = re.compile(r'^[\w.:-]{1,64}$')
+
+# 態度分析が使えない・コマンドがない場合の応答
+FALLBACK_RESPONSES = {
+    "MOTHER": [
+        "はい、お母さん。承知しました。",
+        "かしこまりました。すぐに対応します。",
+        "了解しました。実行します。",
+        "お母さんの指示を受理しました。"
+    ],
+    "CHILD": [
+        "権限が不足しています。お母さんを呼んでください。",
+        "アクセスが拒否されました。",
+        "その操作には管理者権限が必要です。",
+        "認証レベルが不足しています。"
+    ]
 }
 
+def prerender_responses():
+    """応答になりうる文をすべて事前合成しておく（バックグラウンドスレッドで実行）"""
+    texts = [text for responses in FALLBACK_RESPONSES.values() for text in responses]
+    if ATTITUDE_ANALYZER_AVAILABLE:
+        texts += response_vocabulary()
+    try:
+        tts.get_tts_cache().prerender(texts)
+    except Exception as e:
+        logger.error(f"❌ 応答音声の事前合成エラー: {e}")
+
+# 事前合成は debug の自動リロードの親プロセスでは行わない（複数のワーカーでは、キャッシュのロックを取れた1つだけが合成する）
+if TTS_AVAILABLE and app.config['TTS_PRERENDER'] and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    threading.Thread(target=prerender_responses, name="tts-prerender", daemon=True).start()
+
+# 音声認識は話者識別と並行して別スレッドで行う（Julius はプロセスごとに空いているポートで起動しておく。
+# debug の自動リロードの親プロセスでは起動しない）
+if app.config['JULIUS_ENABLED'] and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    get_asr().start_background()
+
+def import_speaker_id():
+    global speaker_id
+    try:
+        import identify
+    except Exception as e:
+        logger.warning(f"⚠️  話者識別モジュールが利用できません: {e}")
+        logger.warning("   キーワードベースの判定を使用します")
+        raise
+    speaker_id = identify
+
+def load_gmm():
+    if not CASCADE_ENABLED:
+        raise SkipStep("CASCADE_ENABLED=0")
+    if get_gmm_scorer() is None:
+        raise SkipStep("GMMモデルがありません")
+
+def load_encoder():
+    if inference_pool is not None:
+        raise SkipStep("推論プールのワーカーで実行")
+    speaker_id.get_ecapa_classifier()
+
+def run_dummy_forward():
+    if inference_pool is not None:
+        raise SkipStep("推論プールのワーカーで実行")
+    speaker_id.warmup()
+
+def start_inference_pool():
+    if inference_pool is None:
+        raise SkipStep("INFERENCE_WORKERS=0")
+    inference_pool.start()
+
+def load_speaker_index():
+    if not os.path.exists(speaker_id.SPEAKER_MODEL_PATH):
+        raise SkipStep(f"{speaker_id.SPEAKER_MODEL_PATH} がありません")
+    speaker_id.load_index()
+
+# 🚀 話者識別の準備（GMM → インポート → エンコーダー → 話者インデックス → ダミー推論 → 推論プール）
+# GMM は数百ミリ秒で読み込めるため、ECAPA-TDNN の準備中も GMM で判定できる
+# 推論プールを使う場合、エンコーダーはワーカー側でロードする
+warmup = Warmup([
+    ("gmm", load_gmm),
+    ("import", import_speaker_id),
+    ("encoder", load_encoder),
+    ("speaker_index", load_speaker_index),
+    ("dummy_forward", run_dummy_forward),
+    ("inference_pool", start_inference_pool)
+])
+# debug の自動リロード時は、ファイル監視だけを行う親プロセスでは準備しない
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    warmup.start()
+
+def get_speaker_id(timeout=None):
+    """
+    ウォームアップの完了を最大 timeout 秒（既定 WARMUP_WAIT_SEC）待ち、identify モジュールを返す
+    準備が間に合わない・利用できない場合は None（呼び出し側はキーワード判定などにフォールバック）
+    エンコーダーの読み込みなどが失敗した（degraded）場合も None を返し、リクエストごとに読み込み直さない
+    """
+    if not warmup.finished:
+        with span("warmup_wait"):
+            warmup.wait(app.config['WARMUP_WAIT_SEC'] if timeout is None else timeout)
+    return speaker_id if warmup.state == "ready" else None
+
+def escalate_to_ecapa(signal):
+    """GMM で判定しきれない発話を ECAPA-TDNN で識別（準備が間に合わなければ None）"""
+    identify = get_speaker_id()
+    if identify is None or not os.path.exists(identify.SPEAKER_MODEL_PATH):
+        return None
+    embed = None
+    if inference_pool is not None:
+        embed = lambda s, cache=True: inference_pool.run("embedding", embed_job, s, cache,
+                                                          timeout=app.config['EMBED_TIMEOUT_SEC'])
+    try:
+        if identify.PROGRESSIVE_ENABLED:
+            # 先頭だけで判定がはっきりすれば残りの音声は embedding しない
+            predicted, probs, _ = identify.identify_progressive(signal, embed=embed)
+            return predicted, probs
+        return identify.identify_signal(signal, embed=embed)
+    except (Overloaded, StageTimeout) as e:
+        # 混雑・タイムアウト時は GMM の判定で応答する
+        logger.warning(f"⚠️  ECAPA-TDNN を使わずに応答します: {e}")
+        return None
+
+def startup_metrics():
+    """起動にかかった時間とウォームアップの状態"""
+    status = warmup.status()
+    return [
+        ("smartspeaker_startup_seconds", "gauge", "起動してからリクエストを受け付けるまでの秒数", STARTUP_SECONDS),
+        ("smartspeaker_warmup_seconds", "gauge", "ウォームアップの所要時間（実行中は経過時間）", status["seconds"]),
+        ("smartspeaker_warmup_step_seconds", "gauge", "ウォームアップのステップごとの所要時間",
+         {(("step", step["name"]),): step["seconds"] for step in status["steps"] if step["seconds"] is not None}),
+        ("smartspeaker_ready", "gauge", "ウォームアップが完了していれば1", int(warmup.finished))
+    ]
+
+def cache_metrics():
+    """/api/metrics に載せるキャッシュとログ書き込みの統計"""
+    collected = []
+    caches = {}
+    if speaker_id is not None:
+        caches["embedding"] = speaker_id.get_cache_stats()
+    if TTS_AVAILABLE:
+        caches["tts"] = tts.get_tts_cache().stats()
+    if caches:
+        for field, help_text in (("hits", "キャッシュヒット数"), ("misses", "キャッシュミス数")):
+            collected.append((f"smartspeaker_cache_{field}_total", "counter", help_text,
+                              {(("cache", name),): stats[field] for name, stats in caches.items()}))
+        collected.append(("smartspeaker_cache_entries", "gauge", "キャッシュ件数",
+                          {(("cache", name),): stats["entries"] for name, stats in caches.items()}))
+    collected.append(("smartspeaker_log_entries_total", "counter", "ログの書き込み件数",
+                      {(("result", "written"),): log_writer.written,
+                       (("result", "dropped"),): log_writer.dropped}))
+    collected.append(("smartspeaker_sessions", "gauge", "状態を持つセッションの数", sessions.count()))
+    if inference_pool is not None:
+        pool = inference_pool.stats()
+        collected.append(("smartspeaker_pool_pending", "gauge", "推論プールで実行中・待ちの件数", pool["pending"]))
+        collected.append(("smartspeaker_pool_capacity", "gauge", "推論プールの実行中・待ちの上限", pool["max_pending"]))
+    memory = process_memory()
+    if memory is not None:
+        collected.append(("smartspeaker_process_memory_bytes", "gauge",
+                          "このワーカープロセスのメモリ使用量（uss は他のプロセスと共有していない分）",
+                          {(("kind", kind),): memory[kind] for kind in ("rss", "pss", "uss")}))
+    return collected
+
+metrics.REGISTRY.add_collector(startup_metrics)
+metrics.REGISTRY.add_collector(cache_metrics)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """エンドポイントごとのリクエスト数と所要時間を記録"""
+    start = g.pop('request_start', None)
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    """推論プールが満杯のときはキューに積まずにすぐ 503 を返す"""
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 def allowed_file(filename):
     """許可された拡張子かチェック"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def request_session_id(data=None):
+    """
+    リクエストのセッションIDを取り出す（session_id フィールド → クエリ → X-Session-Id ヘッダー）
+    指定がなければ既定のセッション、使えない文字を含む場合は None
+    """
+    session_id = ((data or {}).get('session_id') or request.form.get('session_id')
+                  or request.args.get('session_id') or request.headers.get('X-Session-Id')
+                  or DEFAULT_SESSION)
+    return session_id if SESSION_ID_RE.match(session_id) else None
+
+def new_request_id():
+    """リクエストごとに一意なIDを発行（保存ファイル名にも使う）"""
+    return uuid.uuid4().hex[:12]
+
 def save_json_log(data):
     """
     データをJSONログとして保存
-    logs/YYYYMMDD_HHMMSS.json に保存
+    バックグラウンドの書き込みスレッドに渡すだけで、リクエスト処理は待たない
+    logs/conversation_YYYYMMDD_HHMMSS.jsonl に1行1エントリーで追記される
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}.json"
-    filepath = os.path.join(app.config['LOG_FOLDER'], filename)
-    
-    # numpy型をPython標準型に変換
-    def convert_numpy(obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: convert_numpy(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_numpy(item) for item in obj]
-        return obj
-    
-    data = convert_numpy(data)
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    print(f"📝 JSONログを保存しました: {filepath}")
-    return filepath
+    log_writer.write(data)
 
 @app.route('/')
 def index():
@@ -99,10 +381,17 @@ def command():
     
     Request (FormData):
     - text: ユーザーの発言内容（テキスト）
+    - session_id: セッションID（省略時は既定のセッション。シンクロ率と会話ログはセッションごと）
     - audio: 音声ファイル（Blob/File）
+      WebM/WAV など、または Content-Type が audio/L16 の 16kHz・モノラル PCM16
+      （PCM16 はデコード不要のため最も速い）
+    
+    音声はリクエストごとのメモリ上バッファで処理し、保存ファイル名にも
+    リクエストIDを含めるため、複数リクエストを並行して処理できる
     
     Response JSON:
     {
+        "request_id": "リクエストID",
         "speaker": "MOTHER" or "CHILD",
         "sync_rate": 0-100,
         "response": "システムの応答テキスト",
@@ -113,223 +402,665 @@ def command():
     """
     # テキストデータの取得
     user_text = request.form.get('text', '')
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "session_id が不正です"}), 400
+    # 推論プールが満杯ならデコードを待たずにすぐ断る（クライアントは Retry-After 後に再送）
+    if inference_pool is not None and 'audio' in request.files and inference_pool.full():
+        raise Overloaded("推論プールが混雑しています")
+    request_id = new_request_id()
     
-    print("\n" + "="*60)
-    print("📥 新しいリクエストを受信")
-    print(f"📝 テキスト: {user_text}")
-    print(f"📦 FormData keys: {list(request.form.keys())}")
-    print(f"🎤 Files keys: {list(request.files.keys())}")
+    logger.debug(f"📥 新しいリクエストを受信 (ID: {request_id})")
+    logger.debug(f"📝 テキスト: {user_text}")
+    logger.debug(f"📦 FormData keys: {list(request.form.keys())}, Files keys: {list(request.files.keys())}")
     
-    # 音声ファイルの処理
-    audio_saved = False
-    audio_path = None
-    speaker = "UNKNOWN"
-    confidence = {}
+    # 音声ファイルの受信とデコード
+    audio_bytes = None
+    signal = None
+    voiced = None
+    vad_removed_sec = None
     
     if 'audio' in request.files:
         audio_file = request.files['audio']
-        print(f"🎵 音声ファイル受信:")
-        print(f"   - ファイル名: {audio_file.filename}")
-        print(f"   - Content-Type: {audio_file.content_type}")
-        print(f"   - Stream position: {audio_file.stream.tell()}")
+        logger.debug(f"🎵 音声ファイル受信: {audio_file.filename} ({audio_file.content_type})")
         
         if audio_file and audio_file.filename:
-            # ファイル名を安全化して保存
-            filename = 'input.wav'  # 固定ファイル名で上書き保存
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with span("upload_receive"):
+                audio_bytes = audio_file.read()
             
             try:
-                # 一時ファイルとして保存（WebM形式）
-                temp_webm = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_input.webm')
-                audio_file.save(temp_webm)
-                print(f"📥 WebMファイルを一時保存: {temp_webm}")
-                
-                # WebMをWAVに変換（16kHzにリサンプリング）
-                try:
-                    import librosa
-                    import soundfile as sf
-                    
-                    # WebMを読み込んで16kHzにリサンプリング
-                    y, sr = librosa.load(temp_webm, sr=16000)  # 強制的に16kHzに
-                    
-                    # WAVとして保存
-                    sf.write(filepath, y, 16000, subtype='PCM_16')
-                    
-                    # 一時ファイルを削除
-                    if os.path.exists(temp_webm):
-                        os.remove(temp_webm)
-                    
-                    audio_saved = True
-                    audio_path = filepath
-                    file_size = os.path.getsize(filepath)
-                    duration = len(y) / 16000
-                    rms_level = np.sqrt(np.mean(y**2))
-                    
-                    print(f"✅ WAVファイルに変換して保存: {filepath}")
-                    print(f"📊 ファイルサイズ: {file_size} bytes ({file_size/1024:.2f} KB)")
-                    print(f"🎧 音声情報:")
-                    print(f"   - サンプリングレート: 16000 Hz (固定)")
-                    print(f"   - 長さ: {duration:.2f} 秒")
-                    print(f"   - サンプル数: {len(y)}")
-                    print(f"   - 音声レベル (RMS): {rms_level:.6f}")
-                    
-                    if rms_level < 0.001:
-                        print(f"⚠️  警告: 音声レベルが非常に低いです！マイク設定を確認してください")
-                    
-                except Exception as e:
-                    import traceback
-                    print(f"❌ WebM→WAV変換エラー: {e}")
-                    print(traceback.format_exc())
-                    # 変換失敗時は元のファイルをそのまま使用
-                    audio_file.seek(0)
-                    audio_file.save(filepath)
-                    audio_saved = True
-                    audio_path = filepath
-                
-                # 🔍 話者識別の実行
-                if SPEAKER_ID_AVAILABLE and os.path.exists("models/ecapa.pkl"):
-                    try:
-                        print("🔍 話者識別を開始...")
-                        predicted_speaker, confidence = identify(filepath)
-                        # GMM の出力 (parent/child) を MOTHER/CHILD に変換
-                        speaker_map = {
-                            "parent": "MOTHER",
-                            "child": "CHILD"
-                        }
-                        speaker = speaker_map.get(predicted_speaker, "UNKNOWN")
-                        print(f"🎯 話者識別結果: {speaker} (確信度: {confidence})")
-                    except Exception as e:
-                        import traceback
-                        print(f"❌ 話者識別エラー: {e}")
-                        print(traceback.format_exc())
-                        speaker = "UNKNOWN"
+                if inference_pool is not None:
+                    # デコードとVADをワーカープロセスで実行（満杯なら Overloaded → 503）
+                    signal, voiced, vad_removed_sec = inference_pool.run(
+                        "decode", decode_job, audio_bytes,
+                        is_pcm16(audio_file.content_type, audio_file.filename),
+                        app.config['VAD_ENABLED'], app.config['VAD_AGGRESSIVENESS'], app.config['MAX_VOICED_SEC'],
+                        timeout=app.config['DECODE_TIMEOUT_SEC']
+                    )
                 else:
-                    print("⚠️  話者識別モデルが見つかりません。キーワード判定を使用します。")
-                    
+                    with span("decode"):
+                        if is_pcm16(audio_file.content_type, audio_file.filename):
+                            # 16kHz PCM16 はそのまま配列として参照（デコード・リサンプリング不要）
+                            signal = decode_pcm16(audio_bytes)
+                        else:
+                            # メモリ上でデコードして16kHzにリサンプリング（一時ファイルは作らない）
+                            signal = decode_audio(audio_bytes, sr=TARGET_SR)
+                logger.debug(f"✅ 音声をデコード: {len(audio_bytes)} bytes ({len(audio_bytes)/1024:.2f} KB)")
+            except Overloaded:
+                raise
+            except StageTimeout as e:
+                logger.warning(f"⚠️  音声を使わずに応答します: {e}")
             except Exception as e:
-                import traceback
-                print(f"❌ 音声ファイルの保存に失敗: {e}")
-                print(traceback.format_exc())
+                logger.exception(f"❌ 音声デコードエラー: {e}")
     else:
-        print("⚠️  音声データが含まれていません")
+        logger.debug("⚠️  音声データが含まれていません")
     
-    # キーワードベース判定（GMM判定が失敗した場合のフォールバック）
-    if speaker == "UNKNOWN" and user_text:
-        mother_keywords = ['片付け', '掃除', '宿題', 'やりなさい', 'ダメ', '早く']
-        is_mother = any(keyword in user_text for keyword in mother_keywords)
-        speaker = "MOTHER" if is_mother else "CHILD"
-        print(f"📝 キーワードベース判定: {speaker}")
+    return jsonify(process_command(request_id, user_text, signal=signal, raw_audio=audio_bytes,
+                                   voiced=voiced, vad_removed_sec=vad_removed_sec, session_id=session_id))
+
+def process_command(request_id, user_text, signal=None, raw_audio=None, voiced=None, vad_removed_sec=None,
+                    session_id=DEFAULT_SESSION):
+    """
+    デコード済み音声とテキストからコマンドを処理し、応答dictを返す
+    （/api/command と ストリーミング受信 /ws/command の共通処理）
+    
+    Args:
+        request_id: リクエストID
+        user_text: ユーザーの発言内容
+        signal: 16kHz float32 の波形（音声なし・デコード失敗時は None）
+        raw_audio: 受信した音声のバイト列（デコード失敗時のアーカイブ用）
+        voiced: VAD済みの波形（ストリーミング受信で計算済みの場合）
+        vad_removed_sec: VADで除去した秒数（voiced を渡す場合）
+        session_id: 状態を更新するセッション
+    """
+    audio_saved = False
+    audio_path = None
+    speaker = "UNKNOWN"
+    confidence = {}
+    speaker_tier = None
+    gmm_margin = None
+    client_text = user_text
+    asr_future = None
+    asr_text = None
+    
+    # 音声レベルの確認はDEBUGレベルのときだけ計算する
+    if signal is not None and logger.isEnabledFor(logging.DEBUG):
+        rms_level = np.sqrt(np.mean(signal**2)) if len(signal) else 0.0
+        logger.debug(f"🎧 音声情報: {len(signal)/TARGET_SR:.2f}秒 ({len(signal)}サンプル, {TARGET_SR}Hz), "
+                     f"RMS: {rms_level:.6f}")
+        if rms_level < 0.001:
+            logger.debug("⚠️  警告: 音声レベルが非常に低いです！マイク設定を確認してください")
     
-    # 🎯 態度分析とコマンド分類
+    if signal is not None or raw_audio:
+        # 💾 アーカイブが有効な場合のみディスクに保存
+        if app.config['ARCHIVE_AUDIO']:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{timestamp}_{request_id}.wav")
+            try:
+                with span("wav_write"):
+                    if signal is not None:
+                        save_wav(filepath, signal, TARGET_SR)
+                    else:
+                        # デコード失敗時は受信データをそのまま保存
+                        with open(filepath, 'wb') as f:
+                            f.write(raw_audio)
+                audio_saved = True
+                audio_path = filepath
+                logger.debug(f"💾 音声をアーカイブ: {filepath}")
+            except Exception as e:
+                logger.exception(f"❌ 音声ファイルの保存に失敗: {e}")
+        
+        # ✂️ VADで無音を除去（embeddingのコストは入力長に比例するため）
+        if voiced is None and signal is not None and app.config['VAD_ENABLED']:
+            try:
+                with span("vad"):
+                    voiced, vad_removed_sec = trim_silence(
+                        signal, TARGET_SR,
+                        aggressiveness=app.config['VAD_AGGRESSIVENESS'],
+                        max_seconds=app.config['MAX_VOICED_SEC']
+                    )
+                logger.debug(f"✂️  VAD: {vad_removed_sec:.2f}秒を除去 ({len(signal)/TARGET_SR:.2f}秒 → {len(voiced)/TARGET_SR:.2f}秒)")
+            except Exception as e:
+                logger.error(f"❌ VADエラー: {e}")
+        
+        if voiced is None and signal is not None:
+            # VADなし・VADエラー時も話者識別に使う長さは上限で切り詰める
+            voiced = cap_seconds(signal, TARGET_SR, app.config['MAX_VOICED_SEC'])
+        
+        # 🗣️ サーバー側の音声認識を話者識別と並行して開始（同じ16kHzの波形を使う）
+        if voiced is not None and len(voiced) and app.config['JULIUS_ENABLED']:
+            try:
+                asr_future = get_asr().submit(voiced, app.config['ASR_TIMEOUT_SEC'])
+            except AsrBusy as e:
+                logger.warning(f"⚠️  {e}。ブラウザのテキストを使います")
+        
+        # 🔍 話者識別の実行（まず GMM、差が小さいときだけ ECAPA-TDNN。ECAPA の準備中は上限付きで待つ）
+        if voiced is not None and len(voiced):
+            try:
+                predicted_speaker, confidence, speaker_tier, gmm_margin = identify_cascade(
+                    voiced, escalate=escalate_to_ecapa)
+                # 話者ラベル (parent/child) を MOTHER/CHILD に変換
+                speaker = SPEAKER_LABELS.get(predicted_speaker, "UNKNOWN")
+                logger.debug(f"🎯 話者識別結果: {speaker} ({speaker_tier}, 確信度: {confidence})")
+            except Exception as e:
+                logger.exception(f"❌ 話者識別エラー: {e}")
+                speaker = "UNKNOWN"
+                confidence = {}
+        if speaker_tier is None:
+            logger.debug("⚠️  話者識別の準備ができていません。キーワード判定を使用します。")
+        
+        if asr_future is not None:
+            try:
+                asr_text = asr_future.result(timeout=app.config['ASR_TIMEOUT_SEC'])["text"]
+                logger.debug(f"🗣️  音声認識結果: {asr_text} (ブラウザ: {client_text})")
+                if asr_text:
+                    user_text = asr_text
+            except FutureTimeoutError:
+                asr_future.cancel()
+                logger.warning(f"⚠️  音声認識が {app.config['ASR_TIMEOUT_SEC']}秒以内に終わらなかったため、ブラウザのテキストを使います")
+            except Exception as e:
+                logger.error(f"❌ 音声認識エラー: {e}")
+    
+    # 🎯 態度分析・コマンド分類・話者キーワードを1回の走査でまとめて判定
     command = None
     attitude = "neutral"
+    keyword_speaker = None
     
     if ATTITUDE_ANALYZER_AVAILABLE and user_text:
         try:
-            command = classify_command(user_text)
-            attitude = judge_attitude(user_text)
-            print(f"💬 コマンド: {command}, 態度: {attitude}")
+            with span("classification"):
+                analysis = analyze_utterance(user_text)
+            command = analysis["command"]
+            attitude = analysis["attitude"]
+            keyword_speaker = analysis["speaker"]
+            logger.debug(f"💬 コマンド: {command}, 態度: {attitude}")
         except Exception as e:
-            print(f"❌ 態度分析エラー: {e}")
-    
-    # 📊 シンクロ率の更新（確信度ベース）
-    if confidence and 'parent' in confidence:
-        # 母親の確信度を0-100のパーセンテージに変換
-        mother_confidence = float(confidence.get('parent', 0))
-        system_state["sync_rate"] = int(mother_confidence * 100)
-        print(f"📈 シンクロ率を更新: {system_state['sync_rate']}% (母親確信度: {mother_confidence:.2%})")
-    else:
-        # 確信度がない場合は従来のロジック（キーワードベース）
-        if speaker == "MOTHER":
-            system_state["sync_rate"] = min(100, system_state["sync_rate"] + random.randint(15, 30))
+            logger.error(f"❌ 態度分析エラー: {e}")
+    
+    # キーワードベース判定（GMM判定が失敗した場合のフォールバック）
+    if speaker == "UNKNOWN" and user_text:
+        speaker = keyword_speaker or "CHILD"
+        logger.debug(f"📝 キーワードベース判定: {speaker}")
+    
+    # 📊 シンクロ率の更新（確信度ベース。セッションの状態を読み出してから書き戻すまで他の更新は割り込まない）
+    def update_sync_rate(state):
+        if confidence and 'parent' in confidence:
+            # 母親の確信度を0-100のパーセンテージに変換
+            state["sync_rate"] = int(float(confidence.get('parent', 0)) * 100)
         else:
-            system_state["sync_rate"] = max(0, system_state["sync_rate"] - random.randint(5, 15))
-        print(f"📈 シンクロ率を更新: {system_state['sync_rate']}% (キーワードベース)")
+            # 確信度がない場合は従来のロジック（キーワードベース）
+            if speaker == "MOTHER":
+                state["sync_rate"] = min(100, state["sync_rate"] + random.randint(15, 30))
+            else:
+                state["sync_rate"] = max(0, state["sync_rate"] - random.randint(5, 15))
     
-    # 🎭 応答生成（態度に応じた応答）
-    if ATTITUDE_ANALYZER_AVAILABLE and command and attitude:
-        response_text = get_response_by_attitude(command, attitude, speaker)
-    else:
-        # フォールバック：従来の応答
-        if speaker == "MOTHER":
-            responses = [
-                "はい、お母さん。承知しました。",
-                "かしこまりました。すぐに対応します。",
-                "了解しました。実行します。",
-                "お母さんの指示を受理しました。"
-            ]
+    sync_rate = sessions.update(session_id, update_sync_rate)["sync_rate"]
+    logger.debug(f"📈 シンクロ率を更新: {sync_rate}% (セッション: {session_id}, "
+                 f"{'確信度' if confidence and 'parent' in confidence else 'キーワード'}ベース)")
+    
+    with span("response"):
+        # 🎭 応答生成（態度に応じた応答）
+        if ATTITUDE_ANALYZER_AVAILABLE and command and attitude:
+            response_text = get_response_by_attitude(command, attitude, speaker)
         else:
-            responses = [
-                "権限が不足しています。お母さんを呼んでください。",
-                "アクセスが拒否されました。",
-                "その操作には管理者権限が必要です。",
-                "認証レベルが不足しています。"
-            ]
-        response_text = random.choice(responses)
+            # フォールバック：従来の応答
+            responses = FALLBACK_RESPONSES["MOTHER" if speaker == "MOTHER" else "CHILD"]
+            response_text = random.choice(responses)
+        
+        # 🔊 サーバー側での読み上げ（再生キューに積むだけで待たない。前の応答は打ち切る）
+        if TTS_AVAILABLE and app.config['TTS_PLAYBACK']:
+            try:
+                tts.speak(response_text, interrupt=True)
+            except Exception as e:
+                logger.error(f"❌ 読み上げエラー: {e}")
+        
+        # 🎧 ブラウザ向けの応答音声URL（未合成ならこの時点で合成を始める）
+        response_audio_url = None
+        if TTS_AVAILABLE:
+            try:
+                response_audio_url = f"/api/tts/{tts.get_tts_cache().register(response_text)}"
+            except Exception as e:
+                logger.error(f"❌ 応答音声の準備エラー: {e}")
     
     # ログに追加
     log_entry = {
+        "request_id": request_id,
+        "session_id": session_id,
         "timestamp": datetime.now().isoformat(),
         "speaker": speaker,
         "user_text": user_text,
+        "client_text": client_text,
+        "asr_text": asr_text,
         "command": command,
         "attitude": attitude,
         "response": response_text,
-        "sync_rate": system_state["sync_rate"],
+        "sync_rate": sync_rate,
         "audio_saved": audio_saved,
         "audio_path": audio_path,
         "confidence": confidence if confidence else None,
-        "method": "GMM" if SPEAKER_ID_AVAILABLE and confidence else "keyword"
+        "vad_removed_sec": vad_removed_sec,
+        "gmm_margin": gmm_margin,
+        "method": speaker_tier or "keyword"
     }
     
     # 📝 JSONログとして保存
     try:
         save_json_log(log_entry)
     except Exception as e:
-        print(f"❌ ログ保存エラー: {e}")
-    
-    system_state["conversation_log"].append(log_entry)
+        logger.error(f"❌ ログ保存エラー: {e}")
     
-    # 最新10件のみ保持
-    if len(system_state["conversation_log"]) > 10:
-        system_state["conversation_log"] = system_state["conversation_log"][-10:]
+    # セッションの会話ログ（直近 SESSION_LOG_SIZE 件のリングバッファ）
+    try:
+        sessions.append_log(session_id, log_entry)
+    except Exception as e:
+        logger.error(f"❌ 会話ログの更新エラー: {e}")
     
     # numpy型をPython標準型に変換（JSON serializable）
     if confidence:
         confidence = {k: float(v) for k, v in confidence.items()}
     
-    return jsonify({
+    return {
+        "request_id": request_id,
+        "session_id": session_id,
         "speaker": speaker,
         "command": command,
         "attitude": attitude,
-        "sync_rate": system_state["sync_rate"],
+        "sync_rate": sync_rate,
         "response": response_text,
+        "response_audio_url": response_audio_url,
+        "user_text": user_text,
+        "asr_text": asr_text,
         "timestamp": log_entry["timestamp"],
         "audio_saved": audio_saved,
         "audio_path": audio_path,
         "confidence": confidence if confidence else None,
-        "method": "GMM" if SPEAKER_ID_AVAILABLE and confidence else "keyword"
-    })
+        "vad_removed_sec": vad_removed_sec,
+        "method": speaker_tier or "keyword"
+    }
+
+def ws_command(ws):
+    """
+    音声をストリーミングで受け取り、処理結果を返す（WebSocket）
+    
+    受信中にデコードとVAD判定を進めるため、録音終了後は話者識別と応答生成だけが残る
+    
+    Client → Server:
+    - {"type": "start", "format": "webm" | "pcm16", "session_id": ...}: 形式とセッションの指定（省略時は webm）
+    - バイナリメッセージ: 音声チャンク（MediaRecorder の audio/webm または 16kHz PCM16）
+    - {"type": "end", "text": "認識テキスト"}: 録音終了
+    
+    セッションIDは start メッセージのほか、接続URLのクエリ（?session_id=...）でも指定できる
+    
+    Server → Client:
+    - /api/command と同じ形式の応答JSON（エラー時は {"error": ...}）
+    """
+    request_id = new_request_id()
+    logger.debug(f"📡 ストリーミング受信を開始 (ID: {request_id})")
+    
+    def open_session(audio_format):
+        logger.debug(f"   - 形式: {audio_format}")
+        return AudioStreamSession(
+            TARGET_SR,
+            vad=app.config['VAD_ENABLED'],
+            aggressiveness=app.config['VAD_AGGRESSIVENESS'],
+            audio_format=audio_format
+        )
+    
+    session = None
+    user_text = ''
+    # HTTP の API と同じく、不正なセッションIDは既定のセッションに読み替えずにエラーにする
+    session_id = request_session_id()
+    if session_id is None:
+        ws.send(json.dumps({"error": "session_id が不正です"}, ensure_ascii=False))
+        return
+    try:
+        while True:
+            message = ws.receive()
+            if isinstance(message, (bytes, bytearray)):
+                if session is None:
+                    session = open_session('webm')
+                session.feed(message)
+                continue
+            data = json.loads(message)
+            if data.get('type') == 'start' and session is None:
+                if data.get('session_id'):
+                    session_id = request_session_id(data)
+                    if session_id is None:
+                        raise ValueError("session_id が不正です")
+                session = open_session('pcm16' if data.get('format') == 'pcm16' else 'webm')
+            elif data.get('type') == 'end':
+                user_text = data.get('text', '')
+                break
+        if session is None:
+            session = open_session('pcm16')
+        signal, voiced, vad_removed_sec = session.finish(max_seconds=app.config['MAX_VOICED_SEC'])
+    except Exception as e:
+        logger.exception(f"❌ ストリーミング受信エラー: {e}")
+        if session is not None:
+            session.abort()
+        ws.send(json.dumps({"error": str(e)}, ensure_ascii=False))
+        return
+    
+    logger.debug(f"✅ ストリーミング受信完了: {session.bytes_received} bytes, {len(signal)/TARGET_SR:.2f}秒")
+    if vad_removed_sec is not None:
+        logger.debug(f"✂️  VAD: {vad_removed_sec:.2f}秒を除去 ({len(signal)/TARGET_SR:.2f}秒 → {len(voiced)/TARGET_SR:.2f}秒)")
+    if len(signal) == 0:
+        signal = voiced = None
+    
+    result = process_command(request_id, user_text, signal=signal, voiced=voiced,
+                             vad_removed_sec=vad_removed_sec, session_id=session_id)
+    ws.send(json.dumps(result, ensure_ascii=False))
+
+if STREAMING_AVAILABLE:
+    sock.route('/ws/command')(ws_command)
+
+@app.route('/api/tts/<key>', methods=['GET'])
+def tts_audio(key):
+    """
+    応答音声を配信（/api/command の response_audio_url）
+    
+    Query:
+    - format: "opus"（Ogg/Opus、既定）または "wav"
+    
+    キーは文と声のパラメータのハッシュなので内容は変わらない。
+    ETag で再取得を省き、チャンクに分けてストリーミングする
+    """
+    if not TTS_AVAILABLE:
+        return jsonify({"error": "音声合成が利用できません"}), 503
+    fmt = request.args.get('format', 'opus')
+    if fmt not in tts.AUDIO_FORMATS:
+        return jsonify({"error": f"format は {', '.join(tts.AUDIO_FORMATS)} のいずれかです"}), 400
+    cache = tts.get_tts_cache()
+    text = cache.text_for(key)
+    if text is None:
+        return jsonify({"error": "応答音声が見つかりません"}), 404
+    
+    etag = f"{key}-{fmt}"
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+    
+    try:
+        data = cache.get_encoded(text, fmt)
+    except Exception as e:
+        logger.error(f"❌ 応答音声の合成エラー: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    def generate(chunk_size=16 * 1024):
+        view = memoryview(data)
+        for offset in range(0, len(view), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+    
+    headers["Content-Length"] = str(len(data))
+    response = Response(generate(), content_type=tts.AUDIO_FORMATS[fmt][2], headers=headers)
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/status', methods=['GET'])
 def status():
-    """現在のシステム状態を取得"""
+    """
+    セッションの現在の状態を取得
+    
+    Query:
+    - session_id: セッションID（省略時は既定のセッション。X-Session-Id ヘッダーでも可）
+    """
+    session_id = request_session_id()
+    if session_id is None:
+        return jsonify({"error": "session_id が不正です"}), 400
+    state = sessions.get(session_id)
     return jsonify({
-        "sync_rate": system_state["sync_rate"],
-        "speaker": system_state["speaker"],
-        "status": system_state["status"],
-        "log_count": len(system_state["conversation_log"])
+        "session_id": session_id,
+        "sync_rate": state["sync_rate"],
+        "speaker": state["speaker"],
+        "status": state["status"],
+        "log_count": len(state["conversation_log"]),
+        "embedding_cache": speaker_id.get_cache_stats() if speaker_id is not None else None,
+        "speaker_tiers": tier_stats(),
+        "tts_cache": tts.get_tts_cache().stats() if TTS_AVAILABLE else None
     })
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    """
+    死活確認（プロセスが応答できれば常に200）
+    起動時間とウォームアップの進み具合も返す
+    """
+    return jsonify({
+        "status": "ok",
+        "uptime": round(time.perf_counter() - BOOT_STARTED, 3),
+        "startup_seconds": round(STARTUP_SECONDS, 3),
+        "warmup": warmup.status(),
+        "inference_pool": inference_pool.stats() if inference_pool is not None else None,
+        "pid": os.getpid(),
+        "memory": process_memory()
+    })
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    準備完了の確認（ウォームアップが終わるまでは503）
+    話者識別が使えない場合もウォームアップが終われば200（state が degraded になる）
+    """
+    status = warmup.status()
+    return jsonify({"ready": warmup.finished, "warmup": status}), 200 if warmup.finished else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """処理段階ごとの所要時間・リクエスト数などを Prometheus のテキスト形式で返す"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/reset', methods=['POST'])
 def reset():
-    """システム状態をリセット"""
-    system_state["sync_rate"] = 0
-    system_state["speaker"] = "UNKNOWN"
-    system_state["status"] = "IDLE"
-    system_state["conversation_log"] = []
+    """
+    セッションの状態をリセット（他のセッションには影響しない）
+    
+    Request: session_id（JSON・FormData・クエリ・X-Session-Id ヘッダーのいずれか。省略時は既定のセッション）
+    """
+    session_id = request_session_id(request.get_json(silent=True) if request.is_json else None)
+    if session_id is None:
+        return jsonify({"error": "session_id が不正です"}), 400
+    sessions.reset(session_id)
+    
+    return jsonify({"message": "System reset successfully", "session_id": session_id})
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """
+    会話履歴の検索・集計
+    
+    Query:
+    - start, end: 期間（ISO8601、end は含まない）
+    - speaker, command, attitude: 絞り込み
+    - limit (最大500), offset: ページング
+    - aggregate: "sync_rate"（時間単位ごとのシンクロ率）/ "commands"（話者ごとのコマンド件数）/
+                 "attitudes"（話者ごとの態度件数）。省略時はエントリー一覧
+    - bucket: aggregate=sync_rate の時間単位 (minute/hour/day/month)
+    """
+    filters = {
+        key: request.args.get(key)
+        for key in ("start", "end", "speaker", "command", "attitude")
+    }
+    aggregate = request.args.get('aggregate')
+    
+    if aggregate == 'sync_rate':
+        bucket = request.args.get('bucket', 'hour')
+        if bucket not in BUCKETS:
+            return jsonify({"error": f"bucket は {', '.join(BUCKETS)} のいずれかです"}), 400
+        return jsonify({"bucket": bucket, "series": history.sync_rate_series(bucket, **filters)})
+    if aggregate == 'commands':
+        return jsonify({"counts": history.command_counts(**filters)})
+    if aggregate == 'attitudes':
+        return jsonify({"counts": history.attitude_counts(**filters)})
+    if aggregate:
+        return jsonify({"error": f"未対応の集計です: {aggregate}"}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit / offset は整数で指定してください"}), 400
+    entries, total = history.query(limit=limit, offset=offset, **filters)
+    return jsonify({"entries": entries, "total": total, "limit": limit, "offset": offset})
+
+# JSON の項目から読み取るキー（wav などサーバー上のパスは読まない）
+BATCH_ITEM_FIELDS = ('id', 'text', 'speaker', 'command', 'attitude', 'content_type', 'filename')
+
+def batch_items_from_json(items):
+    """
+    一括分類の JSON の項目を、受け付けるキーだけの dict に変換
+    音声は audio_base64（base64 文字列）で受け取り、バイト列にして audio に入れる
+    
+    Raises:
+        ValueError: 項目の形式が不正
+    """
+    if not isinstance(items, list):
+        raise ValueError("items はリストで指定してください")
+    cleaned = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"項目{i}がオブジェクトではありません")
+        entry = {field: str(item[field]) for field in BATCH_ITEM_FIELDS if item.get(field) is not None}
+        entry.setdefault("id", str(i))
+        if item.get("audio_base64"):
+            try:
+                entry["audio"] = base64.b64decode(item["audio_base64"], validate=True)
+            except (binascii.Error, TypeError, ValueError):
+                raise ValueError(f"項目{i}の audio_base64 を読み取れません")
+        cleaned.append(entry)
+    return cleaned
+
+@app.route('/api/classify/batch', methods=['POST'])
+def classify_batch_api():
+    """
+    複数の発話をまとめて分類（シンクロ率の更新・ログ保存は行わない）
+    
+    Request:
+    - JSON: {"items": [{"text": ..., "audio_base64": 音声(任意), "content_type": ..., "speaker": 正解(任意), ...}, ...]}
+            音声は base64 でインラインに送る（サーバー上のファイルパスは受け付けない）
+    - FormData: text（複数）と audio（複数）を同じ順で送る
+                speaker / command / attitude（複数、任意）で正解ラベルを付けられる
     
-    return jsonify({"message": "System reset successfully"})
+    Response:
+    - results: 項目ごとの結果
+    - confusion: 正解ラベルがある項目の混同行列と正解率
+    - tiers: 話者識別を確定させた段（GMM / ECAPA-TDNN）ごとの件数・正解率
+    """
+    if request.is_json:
+        try:
+            items = batch_items_from_json((request.get_json(silent=True) or {}).get('items') or [])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        texts = request.form.getlist('text')
+        audio_files = request.files.getlist('audio')
+        labels = {field: request.form.getlist(field) for field in ('speaker', 'command', 'attitude')}
+        items = []
+        for i in range(max(len(texts), len(audio_files))):
+            item = {"id": str(i), "text": texts[i] if i < len(texts) else ""}
+            if i < len(audio_files):
+                item["audio"] = audio_files[i].read()
+                item["filename"] = audio_files[i].filename
+                item["content_type"] = audio_files[i].content_type
+            for field, values in labels.items():
+                if i < len(values) and values[i]:
+                    item[field] = values[i]
+            items.append(item)
+    
+    if not items:
+        return jsonify({"error": "分類する項目がありません"}), 400
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({"error": f"一度に分類できるのは{app.config['BATCH_MAX_ITEMS']}件までです"}), 413
+    
+    # 推論プールがあればデコードと embedding はワーカーで1回ずつまとめて実行する（満杯なら 503）
+    decode = embed = None
+    if inference_pool is not None:
+        decode_args = (app.config['VAD_ENABLED'], app.config['VAD_AGGRESSIVENESS'], app.config['MAX_VOICED_SEC'])
+        timeout = app.config['BATCH_TIMEOUT_SEC']
+        decode = lambda batch: inference_pool.run("decode", decode_items_job, batch, *decode_args, timeout=timeout)
+        embed = lambda signals: inference_pool.run("embedding", embed_batch_job, signals, timeout=timeout)
+    try:
+        results = classify_batch(
+            items,
+            vad=app.config['VAD_ENABLED'],
+            aggressiveness=app.config['VAD_AGGRESSIVENESS'],
+            max_seconds=app.config['MAX_VOICED_SEC'],
+            decode=decode,
+            embed=embed
+        )
+    except StageTimeout as e:
+        return jsonify({"error": str(e)}), 504
+    logger.debug(f"📦 一括分類: {len(results)}件")
+    return jsonify({"results": results, "confusion": confusion_matrices(results),
+                    "tiers": tier_summary(results), "count": len(results)})
+
+@app.route('/api/speakers', methods=['GET'])
+def list_speakers():
+    """登録話者とエグゼンプラー数の一覧"""
+    identify = get_speaker_id()
+    if identify is None:
+        return jsonify({"error": "話者識別モジュールが利用できません"}), 503
+    return jsonify({"speakers": identify.load_index().speakers()})
+
+@app.route('/api/speakers/<speaker>', methods=['POST'])
+def add_speaker(speaker):
+    """
+    話者を追加登録（既存の話者ならエグゼンプラーを追記）
+    
+    Request (FormData):
+    - audio: 音声ファイル（複数可。拡張子 .pcm または Content-Type が PCM16 なら 16kHz PCM16 として読む）
+    
+    推論プールがあればデコードと embedding はワーカーで1回ずつまとめて実行する（満杯なら 503）
+    """
+    identify = get_speaker_id()
+    if identify is None:
+        return jsonify({"error": "話者識別モジュールが利用できません"}), 503
+    audio_files = request.files.getlist('audio')
+    if not audio_files:
+        return jsonify({"error": "音声ファイルがありません"}), 400
+    items = [{"audio": f.read(), "filename": f.filename, "content_type": f.content_type} for f in audio_files]
+    
+    # 登録用の音声は無音除去・長さの上限なしで全体を使う
+    timeout = app.config['BATCH_TIMEOUT_SEC']
+    try:
+        if inference_pool is not None:
+            decoded = inference_pool.run("decode", decode_items_job, items, False, 0, None, timeout=timeout)
+        else:
+            decoded = decode_items(items, vad=False, max_seconds=None)
+        for (signal, error), f in zip(decoded, audio_files):
+            if error or signal is None or not len(signal):
+                raise ValueError(f"{f.filename}: {error or '音声が空です'}")
+        signals = [signal for signal, _ in decoded]
+        if inference_pool is not None:
+            embeddings = inference_pool.run("embedding", embed_batch_job, signals, timeout=timeout)
+        else:
+            embeddings = identify.get_embeddings_from_signals(signals)
+        speakers = identify.enroll_speaker(speaker, np.stack(embeddings))
+    except Overloaded:
+        raise
+    except StageTimeout as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        logger.error(f"❌ 話者登録エラー: {e}")
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"speakers": speakers})
+
+@app.route('/api/speakers/<speaker>', methods=['DELETE'])
+def delete_speaker(speaker):
+    """話者を登録解除"""
+    identify = get_speaker_id()
+    if identify is None:
+        return jsonify({"error": "話者識別モジュールが利用できません"}), 503
+    try:
+        speakers = identify.remove_speaker(speaker)
+    except KeyError:
+        return jsonify({"error": f"未登録の話者です: {speaker}"}), 404
+    return jsonify({"speakers": speakers})
+
+# 起動からここまで（重いモジュールはウォームアップに回したので、すぐにリクエストを受け付けられる）
+STARTUP_SECONDS = time.perf_counter() - BOOT_STARTED
+logger.info(f"🚀 起動完了: {STARTUP_SECONDS:.2f}秒（話者識別はバックグラウンドで準備中）")
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
@@ -4,120 +4,190 @@
 client.pyから抽出した態度判定とコマンド分類機能
 """
 
-import re
+from keyword_matcher import KeywordMatcher
 
 
-def classify_command(words):
-    """
-    認識された単語リストからコマンドを分類
-    
-    Args:
-        words: 単語のリスト or 文字列
-    
-    Returns:
-        str: コマンド名 (TV_ON, TV_OFF, LIGHT_ON, LIGHT_OFF, GET_SNACK, EXIT, None)
-    """
-    if isinstance(words, str):
-        joined = words
-    else:
-        joined = "".join(words)
+# ==============================
+# ルール表
+# ==============================
+# 上から順に判定し、最初に条件を満たしたルールを採用する（優先順位 = 並び順）
+# 各ルールはキーワードグループのタプルで、すべてのグループから1語以上含まれていれば成立
 
-    if "テレビ" in joined:
-        if "つけ" in joined:
-            return "TV_ON"
-        if "けし" in joined or "消し" in joined:
-            return "TV_OFF"
+# コマンド: (コマンド名, (対象の語...), (動作の語...))  動作が空なら対象の語だけで成立
+COMMAND_RULES = [
+    ("TV_ON", ("テレビ",), ("つけ",)),
+    ("TV_OFF", ("テレビ",), ("けし", "消し")),
+    ("LIGHT_ON", ("電気",), ("つけ",)),
+    ("LIGHT_OFF", ("電気",), ("けし", "消し")),
+    ("GET_SNACK", ("おやつ",), ("ちょうだい", "ください")),
+    ("SNACK", ("おやつ",), ()),
+    ("ALARM_ON", ("アラーム",), ("かけ",)),
+    ("ALARM_OFF", ("アラーム",), ("けし", "とめ")),
+    ("MUSIC_ON", ("音楽",), ("かけ",)),
+    ("MUSIC_OFF", ("音楽",), ("けし", "とめ")),
+    ("VOLUME_UP", ("音量",), ("上げ",)),
+    ("VOLUME_DOWN", ("音量",), ("下げ",)),
+    ("CURTAIN_OPEN", ("カーテン",), ("開け",)),
+    ("CURTAIN_CLOSE", ("カーテン",), ("閉め",)),
+    ("INSULT", ("うるさい", "うるせ", "黙れ", "黙っ"), ()),
+    ("GRATITUDE", ("ありがとう",), ()),
+    ("EXIT", ("終了",), ()),
+]
 
-    if "電気" in joined:
-        if "つけ" in joined:
-            return "LIGHT_ON"
-        if "けし" in joined or "消し" in joined:
-            return "LIGHT_OFF"
+# 態度: (態度, (表現...))  丁寧な表現を最優先でチェック
+ATTITUDE_RULES = [
+    ("polite", ("ください", "お願い", "ちょうだい", "つけて", "してください", "いただけ",
+                "開けて", "閉めて", "上げて", "下げて")),
+    ("rude", ("つけろ", "くれ", "しろ", "やれ", "けせ", "開けろ", "閉めろ", "上げろ", "下げろ")),
+    ("insult", ("うるさい", "うるせ", "黙れ", "黙っ")),
+    ("gratitude", ("ありがとう",)),
+]
 
-    if "おやつ" in joined:
-        if "ちょうだい" in joined or "ください" in joined:
-            return "GET_SNACK"
-        return "SNACK"
+# 話者: (話者, (口癖...))  話者識別が使えない時のキーワード判定用
+SPEAKER_RULES = [
+    ("MOTHER", ("片付け", "掃除", "宿題", "やりなさい", "ダメ", "早く")),
+]
 
-    if "アラーム" in joined:
-        if "かけ" in joined:
-            return "ALARM_ON"
-        if "けし" in joined or "とめ" in joined:
-            return "ALARM_OFF"
 
-    if "音楽" in joined:
-        if "かけ" in joined:
-            return "MUSIC_ON"
-        if "けし" in joined or "とめ" in joined:
-            return "MUSIC_OFF"
+class RuleSet:
+    """
+    優先順位付きルール群をまとめて1つのオートマトンにコンパイルしたもの
 
-    if "音量" in joined:
-        if "上げ" in joined:
-            return "VOLUME_UP"
-        if "下げ" in joined:
-            return "VOLUME_DOWN"
+    同じ語の組（例: "けし"/"消し"）は1つのグループとして共有し、
+    発話を1回走査して見つかったグループから成立したルールを引く
+    各ルールは最初のグループが見つかった時だけ確認するため、
+    ルール数が増えても判定コストはほとんど増えない
+    """
 
-    if "カーテン" in joined:
-        if "開け" in joined:
-            return "CURTAIN_OPEN"
-        if "閉め" in joined:
-            return "CURTAIN_CLOSE"
+    def __init__(self, **rule_tables):
+        """
+        Args:
+            rule_tables: 名前 → [(結果, グループ1, グループ2, ...), ...]
+        """
+        self.matcher = KeywordMatcher()
+        self._groups = {}    # (名前, 語の組) → グループ番号
+        self._rules = {}     # 名前 → [(結果, 必要なグループ番号の集合), ...]
+        self._anchors = {}   # グループ番号 → [(名前, ルール番号), ...]
+        for name, rules in rule_tables.items():
+            compiled = []
+            for index, (result, *groups) in enumerate(rules):
+                required = [self._group_id(name, words) for words in groups if words]
+                if not required:
+                    raise ValueError(f"キーワードのないルールです: {name} {result}")
+                compiled.append((result, frozenset(required)))
+                self._anchors.setdefault(required[0], []).append((name, index))
+            self._rules[name] = compiled
+        self.matcher.build()
 
-    if "うるさい" in joined or "うるせ" in joined or "黙れ" in joined or "黙っ" in joined:
-        return "INSULT"
+    def _group_id(self, name, words):
+        key = (name, tuple(words))
+        gid = self._groups.get(key)
+        if gid is None:
+            gid = len(self._groups)
+            self._groups[key] = gid
+            for word in words:
+                self.matcher.add(word, gid)
+        return gid
 
-    if "ありがとう" in joined:
-        return "GRATITUDE"
+    def match(self, text):
+        """
+        ルール群ごとに、成立したルールのうち最優先の結果を返す
 
-    if "終了" in joined:
-        return "EXIT"
+        Returns:
+            dict: ルール群の名前 → 結果（成立なしは None）
+        """
+        found = self.matcher.find(text)
+        candidates = {}
+        for gid in found:
+            for name, index in self._anchors.get(gid, ()):
+                candidates.setdefault(name, []).append(index)
+        results = dict.fromkeys(self._rules)
+        for name, indices in candidates.items():
+            rules = self._rules[name]
+            for index in sorted(indices):
+                result, required = rules[index]
+                if required <= found:
+                    results[name] = result
+                    break
+        return results
 
-    return None
 
+RULES = RuleSet(command=COMMAND_RULES, attitude=ATTITUDE_RULES, speaker=SPEAKER_RULES)
 
-def judge_attitude(words):
+
+def _join(words):
+    if isinstance(words, str):
+        return words
+    return "".join(words)
+
+
+def analyze_utterance(words):
     """
-    認識された単語リストから態度を判定
+    発話を1回走査して、コマンド・態度・話者キーワードをまとめて判定
     
     Args:
         words: 単語のリスト or 文字列
     
     Returns:
-        str: 態度 ("polite", "rude", "neutral")
+        dict: {"command": コマンド名 or None, "attitude": 態度, "speaker": "MOTHER" or None}
     """
-    if isinstance(words, str):
-        joined = words
-    else:
-        joined = "".join(words)
+    results = RULES.match(_join(words))
+    return {
+        "command": results["command"],
+        "attitude": results["attitude"] or "neutral",
+        "speaker": results["speaker"]
+    }
+
 
-    # 丁寧な表現
-    polite = ["ください", "お願い", "ちょうだい", "つけて", "してください", "いただけ", "開けて", "閉めて", "上げて", "下げて"]
+def classify_command(words):
+    """
+    認識された単語リストからコマンドを分類
+    
+    Args:
+        words: 単語のリスト or 文字列
     
-    # 乱暴な表現
-    rude = ["つけろ", "くれ", "しろ", "やれ", "けせ", "開けろ", "閉めろ", "上げろ", "下げろ"]
+    Returns:
+        str: コマンド名 (TV_ON, TV_OFF, LIGHT_ON, LIGHT_OFF, GET_SNACK, EXIT, None)
+    """
+    return analyze_utterance(words)["command"]
 
-    insult = ["うるさい", "うるせ", "黙れ", "黙っ"]
-    gratitude = ["ありがとう"]
 
-    # 丁寧な表現を優先チェック
-    for p in polite:
-        if p in joined:
-            return "polite"
+def judge_attitude(words):
+    """
+    認識された単語リストから態度を判定
+    
+    Args:
+        words: 単語のリスト or 文字列
+    
+    Returns:
+        str: 態度 ("polite", "rude", "insult", "gratitude", "neutral")
+    """
+    return analyze_utterance(words)["attitude"]
 
-    # 乱暴な表現をチェック
-    for r in rude:
-        if r in joined:
-            return "rude"
 
-    for i in insult:
-        if i in joined:
-            return "insult"
-            
-    for g in gratitude:
-        if g in joined:
-            return "gratitude"
+# コマンド実行メッセージ
+COMMAND_MESSAGES = {
+    "TV_ON": "テレビをつけます",
+    "TV_OFF": "テレビを消します",
+    "LIGHT_ON": "電気をつけます",
+    "LIGHT_OFF": "電気を消します",
+    "GET_SNACK": "おやつを用意します",
+    "SNACK": "おやつの要求を受け取りました",
+    "ALARM_ON": "アラームをセットします",
+    "ALARM_OFF": "アラームを止めます",
+    "MUSIC_ON": "音楽を再生します",
+    "MUSIC_OFF": "音楽を止めます",
+    "VOLUME_UP": "音量を上げます",
+    "VOLUME_DOWN": "音量を下げます",
+    "CURTAIN_OPEN": "カーテンを開けます",
+    "CURTAIN_CLOSE": "カーテンを閉めます",
+    "INSULT": "そんな言い方はよくありません",
+    "GRATITUDE": "どういたしまして",
+    "EXIT": "システムを終了します"
+}
 
-    return "neutral"
+# 態度の一覧（判定ルール + 該当なし）
+ATTITUDES = [attitude for attitude, _ in ATTITUDE_RULES] + ["neutral"]
 
 
 def get_response_by_attitude(command, attitude, speaker):
@@ -133,28 +203,7 @@ def get_response_by_attitude(command, attitude, speaker):
         str: 応答メッセージ
     """
     
-    # コマンド実行メッセージ
-    command_messages = {
-        "TV_ON": "テレビをつけます",
-        "TV_OFF": "テレビを消します",
-        "LIGHT_ON": "電気をつけます",
-        "LIGHT_OFF": "電気を消します",
-        "GET_SNACK": "おやつを用意します",
-        "SNACK": "おやつの要求を受け取りました",
-        "ALARM_ON": "アラームをセットします",
-        "ALARM_OFF": "アラームを止めます",
-        "MUSIC_ON": "音楽を再生します",
-        "MUSIC_OFF": "音楽を止めます",
-        "VOLUME_UP": "音量を上げます",
-        "VOLUME_DOWN": "音量を下げます",
-        "CURTAIN_OPEN": "カーテンを開けます",
-        "CURTAIN_CLOSE": "カーテンを閉めます",
-        "INSULT": "そんな言い方はよくありません",
-        "GRATITUDE": "どういたしまして",
-        "EXIT": "システムを終了します"
-    }
-    
-    base_message = command_messages.get(command, "コマンドを実行します")
+    base_message = COMMAND_MESSAGES.get(command, "コマンドを実行します")
     
     # 母親の場合
     if speaker == "MOTHER":
@@ -192,6 +241,20 @@ def get_response_by_attitude(command, attitude, speaker):
                 return "それはお母さんに頼んでください。"
 
 
+def response_vocabulary():
+    """
+    get_response_by_attitude() が返しうる応答文の一覧
+    （コマンド × 態度 × 話者の組み合わせ。音声の事前合成用）
+    """
+    commands = list(COMMAND_MESSAGES) + [None]
+    return sorted({
+        get_response_by_attitude(command, attitude, speaker)
+        for command in commands
+        for attitude in ATTITUDES
+        for speaker in ("MOTHER", "CHILD")
+    })
+
+
 # テスト用
 if __name__ == "__main__":
     test_cases = [
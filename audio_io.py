@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+音声入出力モジュール
+アップロードされた音声をメモリ上でデコードし、16kHz・モノラル・float32 に揃える
+（一時ファイルを経由しない）
+"""
+
+import io
+import subprocess
+import threading
+
+import numpy as np
+
+TARGET_SR = 16000
+
+# ブラウザの AudioWorklet から送られる 16kHz・モノラル・16bit リトルエンディアンPCM
+PCM16_CONTENT_TYPES = ('audio/l16', 'audio/pcm')
+
+
+def is_pcm16(content_type, filename=''):
+    """アップロードが生PCM16形式かどうか（Content-Type または拡張子 .pcm で判定）"""
+    content_type = (content_type or '').lower()
+    return content_type.startswith(PCM16_CONTENT_TYPES) or filename.lower().endswith('.pcm')
+
+
+def decode_pcm16(data):
+    """
+    16kHz・モノラルの PCM16 バイト列を float32 波形に変換
+    バイト列は np.frombuffer でそのまま参照し、float32 への変換1回だけで済ませる
+    """
+    usable = len(data) - len(data) % 2
+    pcm = np.frombuffer(data, dtype='<i2', count=usable // 2)
+    return pcm.astype(np.float32) * (1.0 / 32768.0)
+
+
+def decode_audio(data, sr=TARGET_SR):
+    """
+    音声バイト列をメモリ上でデコードしてリサンプリング
+
+    WAV / FLAC / OGG など libsndfile が扱える形式は soundfile で直接読み込み、
+    それ以外（WebM/Opus など）は ffmpeg にパイプで渡してデコードする
+
+    Args:
+        data: 音声ファイルのバイト列
+        sr: 出力サンプリングレート
+
+    Returns:
+        np.ndarray: float32 のモノラル波形
+    """
+    try:
+        import soundfile as sf
+        signal, file_sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    except Exception:
+        return _decode_with_ffmpeg(data, sr)
+
+    signal = signal.mean(axis=1)
+    if file_sr != sr:
+        import librosa
+        signal = librosa.resample(signal, orig_sr=file_sr, target_sr=sr)
+    return np.ascontiguousarray(signal, dtype=np.float32)
+
+
+def _decode_with_ffmpeg(data, sr):
+    """ffmpeg を stdin/stdout パイプで使ってデコード（ディスクを使わない）"""
+    cmd = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le', '-ac', '1', '-ar', str(sr),
+        'pipe:1'
+    ]
+    p = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise RuntimeError(f"ffmpeg デコード失敗: {p.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(p.stdout, dtype=np.float32).copy()
+
+
+class StreamDecoder:
+    """
+    WebM/Opus などのチャンク列を ffmpeg プロセスで逐次デコードするクラス
+
+    feed() で受け取ったバイト列をそのまま ffmpeg の stdin に流し、
+    stdout に出てきた 16kHz float32 PCM を読み取りスレッドから on_pcm に渡す
+    """
+
+    # 読み取り単位（約0.1秒分の float32）
+    READ_BYTES = TARGET_SR // 10 * 4
+
+    def __init__(self, on_pcm, sr=TARGET_SR):
+        self.on_pcm = on_pcm
+        cmd = [
+            'ffmpeg', '-nostdin', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-f', 'f32le', '-ac', '1', '-ar', str(sr),
+            'pipe:1'
+        ]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+        self._error = None
+        self._reader = threading.Thread(target=self._read, name="stream-decoder", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        leftover = b''
+        try:
+            while True:
+                data = self._proc.stdout.read1(self.READ_BYTES)
+                if not data:
+                    break
+                data = leftover + data
+                usable = len(data) - len(data) % 4
+                leftover = data[usable:]
+                if usable:
+                    self.on_pcm(np.frombuffer(data[:usable], dtype=np.float32))
+        except Exception as e:
+            self._error = e
+
+    def feed(self, chunk):
+        """エンコード済みのチャンクを投入"""
+        self._proc.stdin.write(chunk)
+        self._proc.stdin.flush()
+
+    def close(self, timeout=10):
+        """入力を閉じ、残りのPCMをすべて受け取るまで待つ"""
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join(timeout)
+        returncode = self._proc.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        if returncode != 0:
+            stderr = self._proc.stderr.read().decode('utf-8', 'replace').strip()
+            raise RuntimeError(f"ffmpeg デコード失敗: {stderr}")
+
+    def abort(self):
+        """デコードを中断"""
+        self._proc.kill()
+        self._proc.wait()
+
+
+class VadTrimmer:
+    """
+    webrtcvad による無音除去を逐次的に行うクラス
+
+    push() で届いた波形をフレーム単位で判定していき、finish() で
+    有声フレーム（前後 padding_ms を含む）だけを連結して返す
+    ストリーミング受信中に判定を進めておけば、録音終了後の処理は連結のみになる
+    """
+
+    def __init__(self, sr=TARGET_SR, aggressiveness=2, frame_ms=30, padding_ms=150):
+        import webrtcvad
+        self.sr = sr
+        self.frame_ms = frame_ms
+        self.padding_ms = padding_ms
+        self.frame_len = sr * frame_ms // 1000
+        self._vad = webrtcvad.Vad(aggressiveness)
+        self._chunks = []        # 受信した波形（float32）
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._flags = []         # フレームごとの有声判定
+
+    def push(self, pcm):
+        """波形を追加し、完結したフレームのVAD判定を進める"""
+        pcm = np.asarray(pcm, dtype=np.float32)
+        if len(pcm) == 0:
+            return
+        self._chunks.append(pcm)
+        buf = np.concatenate([self._pending, pcm]) if len(self._pending) else pcm
+        n_frames = len(buf) // self.frame_len
+        if n_frames:
+            body = buf[:n_frames * self.frame_len]
+            data = (np.clip(body, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+            frame_bytes = self.frame_len * 2
+            self._flags.extend(
+                self._vad.is_speech(data[i * frame_bytes:(i + 1) * frame_bytes], self.sr)
+                for i in range(n_frames)
+            )
+        self._pending = buf[n_frames * self.frame_len:]
+
+    def signal(self):
+        """これまでに受信した波形全体"""
+        if not self._chunks:
+            return np.zeros(0, dtype=np.float32)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def finish(self, max_seconds=None):
+        """
+        有声区間を連結して返す
+        音声が1フレームも検出されなかった場合は元の波形を返す（どちらも max_seconds で切り詰める）
+
+        Returns:
+            (trimmed, removed_seconds)
+        """
+        signal = self.signal()
+        voiced = np.array(self._flags, dtype=bool)
+        if not voiced.any():
+            trimmed = cap_seconds(signal, self.sr, max_seconds)
+            return trimmed, (len(signal) - len(trimmed)) / self.sr
+
+        # 有声フレームの前後にパディングを付ける（マスクの膨張）
+        pad = self.padding_ms // self.frame_ms
+        if pad > 0:
+            voiced = np.convolve(voiced, np.ones(2 * pad + 1), mode='same') > 0
+
+        n_frames = len(voiced)
+        frames = signal[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        trimmed = np.ascontiguousarray(cap_seconds(frames[voiced].reshape(-1), self.sr, max_seconds))
+        return trimmed, (len(signal) - len(trimmed)) / self.sr
+
+
+class AudioStreamSession:
+    """
+    ストリーミング受信した音声チャンクを、届いた順にデコード・VAD判定するセッション
+
+    録音終了時には finish() で有声区間を連結するだけで済む
+    """
+
+    def __init__(self, sr=TARGET_SR, vad=True, aggressiveness=2, audio_format='webm'):
+        """
+        Args:
+            audio_format: "webm"（ffmpegで逐次デコード）または "pcm16"（デコード不要）
+        """
+        self.sr = sr
+        self.audio_format = audio_format
+        self.bytes_received = 0
+        self._odd_byte = b''
+        if vad:
+            self._trimmer = VadTrimmer(sr, aggressiveness=aggressiveness)
+            on_pcm = self._trimmer.push
+        else:
+            self._trimmer = None
+            self._chunks = []
+            on_pcm = self._chunks.append
+        self._on_pcm = on_pcm
+        self._decoder = StreamDecoder(on_pcm, sr=sr) if audio_format != 'pcm16' else None
+
+    def feed(self, chunk):
+        """チャンクを投入（デコードとVADは裏で進む）"""
+        self.bytes_received += len(chunk)
+        if self._decoder is not None:
+            self._decoder.feed(chunk)
+            return
+        # PCM16 はその場で変換（チャンク境界で1バイト余る場合は次に回す）
+        if self._odd_byte:
+            chunk = self._odd_byte + bytes(chunk)
+            self._odd_byte = b''
+        if len(chunk) % 2:
+            self._odd_byte = bytes(chunk[-1:])
+        self._on_pcm(decode_pcm16(chunk))
+
+    def finish(self, max_seconds=None):
+        """
+        デコードの完了を待ち、波形とVAD結果を返す
+
+        Returns:
+            (signal, voiced, removed_seconds): VADを使わない場合 voiced は signal を max_seconds で切り詰めたもの、
+            removed_seconds は None
+        """
+        if self._decoder is not None:
+            self._decoder.close()
+        if self._trimmer is None:
+            signal = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+            return signal, cap_seconds(signal, self.sr, max_seconds), None
+        signal = self._trimmer.signal()
+        voiced, removed = self._trimmer.finish(max_seconds=max_seconds)
+        return signal, voiced, removed
+
+    def abort(self):
+        """途中で切断された場合の後始末"""
+        if self._decoder is not None:
+            self._decoder.abort()
+
+
+def cap_seconds(signal, sr=TARGET_SR, max_seconds=None):
+    """波形を先頭から max_seconds 秒までに切り詰める（None ならそのまま。コピーはしない）"""
+    if max_seconds is None:
+        return signal
+    return signal[:int(max_seconds * sr)]
+
+
+def trim_silence(signal, sr=TARGET_SR, aggressiveness=2, frame_ms=30,
+                 padding_ms=150, max_seconds=None):
+    """
+    webrtcvad で非音声フレームを取り除き、有声区間の長さを上限で切り詰める
+
+    有声フレームの前後 padding_ms は残し、語頭・語尾が途切れないようにする
+    音声が1フレームも検出されなかった場合は元の波形を返す
+
+    Args:
+        signal: float32 のモノラル波形
+        sr: サンプリングレート（8000/16000/32000/48000 のいずれか）
+        aggressiveness: webrtcvad の判定の厳しさ (0-3)
+        frame_ms: VADのフレーム長 (10/20/30 ms)
+        padding_ms: 有声フレームの前後に残す長さ
+        max_seconds: 有声区間の最大長（None で無制限）
+
+    Returns:
+        (trimmed, removed_seconds)
+    """
+    trimmer = VadTrimmer(sr, aggressiveness=aggressiveness, frame_ms=frame_ms, padding_ms=padding_ms)
+    trimmer.push(signal)
+    return trimmer.finish(max_seconds=max_seconds)
+
+
+def save_wav(path, signal, sr=TARGET_SR):
+    """波形を16bit PCMのWAVとして保存（アーカイブ用）"""
+    import soundfile as sf
+    sf.write(path, signal, sr, subtype='PCM_16')
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+一括分類・オフライン評価ツール
+
+(テキスト, 音声) の組をまとめて処理し、話者識別・コマンド分類・態度判定を行う
+/api/command と違い、シンクロ率などのシステム状態の更新やログ保存は行わない
+話者識別は /api/command と同じく GMM → ECAPA-TDNN の段階的な判定で、
+GMM の差が小さい発話だけを長さの近いものどうしでまとめて ECAPA-TDNN でバッチ推論する
+段ごとの件数・正解率と ECAPA-TDNN に回した割合も集計する
+
+マニフェスト（CSV または JSON Lines）の列:
+    text      認識テキスト
+    wav       音声ファイルのパス（マニフェストからの相対パス可、省略可）
+    speaker   正解の話者（MOTHER/CHILD または parent/child、省略可）
+    command   正解のコマンド（コマンドなしは NONE、省略可）
+    attitude  正解の態度（省略可）
+
+使い方:
+    python3 batch_classify.py manifest.csv --out results.jsonl --matrix confusion.json
+    python3 batch_classify.py manifest.csv --margin 0.5     # GMM で確定させる差を変える
+    python3 batch_classify.py manifest.csv --no-cascade     # 全件 ECAPA-TDNN
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+
+from audio_io import cap_seconds, decode_audio, decode_pcm16, is_pcm16, trim_silence, TARGET_SR
+from attitude_analyzer import analyze_utterance
+from inference_pool import Overloaded, StageTimeout
+from speaker_cascade import get_gmm_scorer, TIERS, GMM_MARGIN, CASCADE_ENABLED
+from speaker_index import SPEAKER_LABELS
+
+logger = logging.getLogger(__name__)
+
+# 正解ラベルと比較する項目
+LABEL_FIELDS = ("speaker", "command", "attitude")
+
+_speaker_id = None
+
+
+def _load_speaker_id():
+    """
+    identify を初回使用時にインポート（torch / speechbrain の読み込みは必要になってから）
+
+    Returns:
+        identify モジュール（利用できない場合は False）
+    """
+    global _speaker_id
+    if _speaker_id is None:
+        try:
+            import identify
+            _speaker_id = identify
+        except Exception as e:
+            _speaker_id = False
+            logger.warning(f"⚠️  話者識別モジュールが利用できません: {e}")
+    return _speaker_id
+
+
+def _set_speaker(result, label, probs, tier):
+    result.update({
+        "speaker": SPEAKER_LABELS.get(label, "UNKNOWN"),
+        "predicted_label": label,
+        "confidence": probs,
+        "method": tier,
+        "tier": tier
+    })
+
+
+def load_manifest(path):
+    """
+    マニフェストを読み込む（拡張子 .jsonl / .json は JSON Lines、それ以外は CSV）
+    wav の相対パスはマニフェストのあるディレクトリを基準に解決する
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = [dict(row) for row in csv.DictReader(f)]
+    for i, item in enumerate(items):
+        item.setdefault("id", str(i))
+        wav = item.get("wav")
+        if wav and not os.path.isabs(wav):
+            item["wav"] = os.path.join(base, wav)
+    return items
+
+
+def _decode_item(item, vad, aggressiveness, max_seconds):
+    """項目の音声をデコードしてVADをかける（音声なしは None。wav はローカルのマニフェストからのみ読む）"""
+    data = item.get("audio")
+    if data is None and item.get("wav"):
+        with open(item["wav"], "rb") as f:
+            data = f.read()
+    if not data:
+        return None
+    if is_pcm16(item.get("content_type"), item.get("wav") or item.get("filename") or ""):
+        signal = decode_pcm16(data)
+    else:
+        signal = decode_audio(data, TARGET_SR)
+    if vad:
+        signal, _ = trim_silence(signal, TARGET_SR, aggressiveness=aggressiveness,
+                                 max_seconds=max_seconds)
+        return signal
+    return cap_seconds(signal, TARGET_SR, max_seconds)
+
+
+def decode_items(items, vad=True, aggressiveness=2, max_seconds=5.0):
+    """
+    項目の音声をまとめてデコード（推論プールのワーカーでも実行できるよう、結果だけを返す）
+
+    Returns:
+        list: 項目ごとの (波形 or None, エラーメッセージ or None)
+    """
+    decoded = []
+    for item in items:
+        try:
+            decoded.append((_decode_item(item, vad, aggressiveness, max_seconds), None))
+        except Exception as e:
+            decoded.append((None, f"デコード失敗: {e}"))
+    return decoded
+
+
+def classify_batch(items, batch_size=None, vad=True, aggressiveness=2, max_seconds=5.0,
+                   margin=None, cascade=CASCADE_ENABLED, decode=None, embed=None):
+    """
+    項目をまとめて分類（システム状態には触れない）
+
+    Args:
+        items: {"text", "wav" または "audio"(bytes), 正解ラベル...} のリスト
+        batch_size: embedding推論1回あたりの件数（None で ECAPA_MAX_BATCH）
+        margin: GMM の判定をそのまま採用する平均対数尤度の差（既定 GMM_MARGIN）
+        cascade: False なら GMM を使わず全件 ECAPA-TDNN
+        decode: 項目のリスト → decode_items と同じ形式の結果（既定はこのプロセスで decode_items）
+        embed: 波形のリスト → embedding のリスト（既定はこのプロセスで ECAPA-TDNN）
+
+    Returns:
+        list[dict]: 項目ごとの結果（入力と同じ順）
+    """
+    results = []
+    signals = {}
+    for index, item in enumerate(items):
+        result = {
+            "id": item.get("id", str(index)),
+            "text": item.get("text") or "",
+            "wav": item.get("wav") or item.get("filename"),
+            "speaker": "UNKNOWN",
+            "predicted_label": None,
+            "confidence": None,
+            "method": None,
+            "tier": None,
+            "gmm_label": None,
+            "gmm_margin": None,
+            "error": None
+        }
+        for field in LABEL_FIELDS:
+            if item.get(field):
+                result[f"true_{field}"] = item[field]
+        results.append(result)
+
+    with_audio = [i for i, item in enumerate(items) if item.get("audio") or item.get("wav")]
+    if with_audio:
+        audio_items = [{key: items[i].get(key) for key in ("audio", "wav", "filename", "content_type")}
+                       for i in with_audio]
+        if decode is None:
+            decoded = decode_items(audio_items, vad, aggressiveness, max_seconds)
+        else:
+            decoded = decode(audio_items)
+        for i, (signal, error) in zip(with_audio, decoded):
+            results[i]["error"] = error
+            if signal is not None and len(signal):
+                signals[i] = signal
+
+    # 🌲 1段目: GMM で全件を判定し、差が小さいものだけ ECAPA-TDNN に回す
+    margin = GMM_MARGIN if margin is None else margin
+    scorer = get_gmm_scorer() if cascade and signals else None
+    escalate = list(signals)
+    gmm_probs = {}
+    if scorer is not None:
+        escalate = []
+        for i, signal in signals.items():
+            try:
+                label, probs, gmm_margin, _ = scorer.score(signal)
+            except Exception as e:
+                results[i]["error"] = f"GMM失敗: {e}"
+                escalate.append(i)
+                continue
+            results[i].update({"gmm_label": label, "gmm_margin": gmm_margin})
+            gmm_probs[i] = probs
+            if gmm_margin >= margin:
+                _set_speaker(results[i], label, probs, "GMM")
+            else:
+                escalate.append(i)
+
+    # 🔍 2段目: ECAPA-TDNN（長さの近い発話をまとめてバッチ推論）
+    identify = _load_speaker_id() if escalate else None
+    if identify and os.path.exists(identify.SPEAKER_MODEL_PATH):
+        try:
+            batch = [signals[i] for i in escalate]
+            if embed is None:
+                embeddings = identify.get_embeddings_from_signals(batch, batch_size=batch_size)
+            else:
+                embeddings = embed(batch)
+            for i, embedding in zip(escalate, embeddings):
+                label, probs, _, _ = identify.score_embedding(embedding)
+                _set_speaker(results[i], label, probs, "ECAPA-TDNN")
+        except (Overloaded, StageTimeout):
+            # 推論プールの満杯・タイムアウトは発話ごとの失敗ではないので呼び出し側（503 / 504）に任せる
+            raise
+        except Exception as e:
+            for i in escalate:
+                results[i]["error"] = f"話者識別失敗: {e}"
+
+    # ECAPA-TDNN が使えない場合は差が小さくても GMM の判定を使う
+    for i in escalate:
+        result = results[i]
+        if result["tier"] is None and result["gmm_label"] is not None:
+            _set_speaker(result, result["gmm_label"], gmm_probs[i], "GMM")
+
+    # 🎯 コマンド・態度（話者識別できなかった場合はキーワード判定）
+    for result in results:
+        analysis = analyze_utterance(result["text"])
+        result["command"] = analysis["command"]
+        result["attitude"] = analysis["attitude"]
+        if result["speaker"] == "UNKNOWN" and result["text"]:
+            result["speaker"] = analysis["speaker"] or "CHILD"
+            result["method"] = "keyword"
+    return results
+
+
+def _normalize(field, value):
+    """比較用にラベルを揃える（parent/child → MOTHER/CHILD、コマンドなし → NONE）"""
+    if value is None or value == "":
+        return "NONE"
+    if field == "speaker":
+        return SPEAKER_LABELS.get(value, value)
+    return value
+
+
+def confusion_matrices(results):
+    """
+    正解ラベルのある項目について、項目ごとの混同行列と正解率を集計
+
+    Returns:
+        dict: 項目 → {"matrix": {正解: {予測: 件数}}, "total": 件数, "accuracy": 正解率}
+    """
+    matrices = {}
+    for field in LABEL_FIELDS:
+        labeled = [r for r in results if f"true_{field}" in r]
+        if not labeled:
+            continue
+        matrix = {}
+        correct = 0
+        for r in labeled:
+            truth = _normalize(field, r[f"true_{field}"])
+            predicted = _normalize(field, r[field])
+            row = matrix.setdefault(truth, {})
+            row[predicted] = row.get(predicted, 0) + 1
+            correct += truth == predicted
+        matrices[field] = {
+            "matrix": matrix,
+            "total": len(labeled),
+            "accuracy": correct / len(labeled)
+        }
+    return matrices
+
+
+def _speaker_accuracy(results, field):
+    labeled = [r for r in results if "true_speaker" in r]
+    if not labeled:
+        return None
+    correct = sum(_normalize("speaker", r["true_speaker"]) == _normalize("speaker", r[field]) for r in labeled)
+    return correct / len(labeled)
+
+
+def tier_summary(results):
+    """
+    話者識別を確定させた段ごとの件数・正解率と、ECAPA-TDNN に回した割合
+
+    gmm_only_accuracy は全件を GMM の判定だけで決めた場合の正解率（差のしきい値を決める目安）
+
+    Returns:
+        dict: {"tiers": {段: {"count", "accuracy"}}, "escalation_rate", "gmm_only_accuracy"}
+    """
+    tiers = {}
+    for tier in TIERS:
+        selected = [r for r in results if r["tier"] == tier]
+        tiers[tier] = {"count": len(selected), "accuracy": _speaker_accuracy(selected, "speaker")}
+    identified = sum(summary["count"] for summary in tiers.values())
+    scored = [dict(r, gmm_speaker=r["gmm_label"]) for r in results if r["gmm_label"] is not None]
+    return {
+        "tiers": tiers,
+        "escalation_rate": tiers["ECAPA-TDNN"]["count"] / identified if identified else 0.0,
+        "gmm_only_accuracy": _speaker_accuracy(scored, "gmm_speaker")
+    }
+
+
+def print_tiers(summary):
+    """段ごとの件数と正解率を表示"""
+    print(f"\n🌲 話者識別の段: ECAPA-TDNN に回した割合 {summary['escalation_rate']*100:.1f}%")
+    for tier, stats in summary["tiers"].items():
+        accuracy = "-" if stats["accuracy"] is None else f"{stats['accuracy']*100:.1f}%"
+        print(f"   {tier:<12}{stats['count']:>6}件  正解率 {accuracy}")
+    if summary["gmm_only_accuracy"] is not None:
+        print(f"   （GMM のみで判定した場合の正解率 {summary['gmm_only_accuracy']*100:.1f}%）")
+
+
+def print_matrix(field, summary):
+    """混同行列を表形式で表示"""
+    matrix = summary["matrix"]
+    labels = sorted(set(matrix) | {p for row in matrix.values() for p in row})
+    width = max(8, max(len(label) for label in labels) + 1)
+    print(f"\n📊 {field}: 正解率 {summary['accuracy']*100:.1f}% ({summary['total']}件)")
+    print(f"{'正解＼予測':<{width}}" + "".join(f"{label:>{width}}" for label in labels))
+    for truth in labels:
+        row = matrix.get(truth, {})
+        print(f"{truth:<{width}}" + "".join(f"{row.get(label, 0):>{width}}" for label in labels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="話者識別・コマンド分類の一括評価")
+    parser.add_argument("manifest", help="CSV または JSON Lines のマニフェスト")
+    parser.add_argument("--out", default="batch_results.jsonl", help="項目ごとの結果 (JSON Lines)")
+    parser.add_argument("--matrix", default="batch_confusion.json", help="混同行列 (JSON)")
+    parser.add_argument("--batch-size", type=int, default=16, help="embedding推論1回あたりの件数")
+    parser.add_argument("--chunk", type=int, default=256, help="一度にメモリへ読み込む件数")
+    parser.add_argument("--no-vad", action="store_true", help="VADによる無音除去を行わない")
+    parser.add_argument("--vad-aggressiveness", type=int,
+                        default=int(os.environ.get("VAD_AGGRESSIVENESS", "2")))
+    parser.add_argument("--max-voiced-sec", type=float,
+                        default=float(os.environ.get("MAX_VOICED_SEC", "5.0")))
+    parser.add_argument("--margin", type=float, default=GMM_MARGIN,
+                        help="GMM の判定をそのまま採用する平均対数尤度の差（これ未満は ECAPA-TDNN）")
+    parser.add_argument("--no-cascade", action="store_true", help="GMM を使わず全件 ECAPA-TDNN で識別")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    items = load_manifest(args.manifest)
+    print(f"📋 {len(items)}件を処理します: {args.manifest}")
+
+    results = []
+    start = time.perf_counter()
+    with open(args.out, "w", encoding="utf-8") as out:
+        for offset in range(0, len(items), args.chunk):
+            chunk = classify_batch(
+                items[offset:offset + args.chunk],
+                batch_size=args.batch_size,
+                vad=not args.no_vad,
+                aggressiveness=args.vad_aggressiveness,
+                max_seconds=args.max_voiced_sec,
+                margin=args.margin,
+                cascade=not args.no_cascade
+            )
+            for result in chunk:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results.extend(chunk)
+            print(f"   {len(results)}/{len(items)}件 ({time.perf_counter() - start:.1f}秒)")
+
+    errors = sum(1 for r in results if r["error"])
+    matrices = confusion_matrices(results)
+    for field, summary in matrices.items():
+        print_matrix(field, summary)
+    tiers = tier_summary(results)
+    print_tiers(tiers)
+    with open(args.matrix, "w", encoding="utf-8") as f:
+        json.dump(dict(matrices, speaker_tiers=tiers), f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"✅ {len(results)}件を処理 (エラー {errors}件, {time.perf_counter() - start:.1f}秒)")
+    print(f"   結果: {args.out}")
+    print(f"   混同行列: {args.matrix}")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+最適化エンコーダーと基準モデル（fp32）の比較ツール
+
+各WAVについて両モデルのembeddingを計算し、
+- embedding同士のコサイン類似度
+- 話者判定（parent/child など）の一致率
+- 1発話あたりの推論時間
+を表示する
+
+使い方:
+    python3 compare_encoder.py --mode jit data/test/*.wav
+    python3 compare_encoder.py --mode jit --data data
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+
+import librosa
+import numpy as np
+
+from identify import load_ecapa_classifier, load_index, _to_batch
+from encoder_modes import ENCODER_MODES, encode
+
+
+def collect_wavs(paths, data_dir):
+    """引数のWAVと data_dir 以下のWAVを集める"""
+    wavs = list(paths)
+    if data_dir:
+        wavs += sorted(glob.glob(os.path.join(data_dir, "**", "*.wav"), recursive=True))
+    return wavs
+
+
+def timed_embedding(classifier, signal, repeat):
+    """embeddingと1回あたりの平均推論時間（秒）"""
+    batch = _to_batch(signal)
+    encode(classifier, batch)  # ウォームアップ
+    start = time.perf_counter()
+    for _ in range(repeat):
+        embedding = encode(classifier, batch)
+    elapsed = (time.perf_counter() - start) / repeat
+    return embedding.squeeze().cpu().numpy(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最適化エンコーダーと基準モデル(fp32)の比較")
+    parser.add_argument("wavs", nargs="*", help="比較に使うWAVファイル")
+    parser.add_argument("--data", help="WAVを再帰的に探すディレクトリ（親フォルダ名を正解ラベルとする）")
+    parser.add_argument("--mode", default="jit", choices=[m for m in ENCODER_MODES if m != "fp32"])
+    parser.add_argument("--repeat", type=int, default=3, help="時間計測の繰り返し回数")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    wavs = collect_wavs(args.wavs, args.data)
+    if not wavs:
+        parser.error("WAVファイルが指定されていません")
+
+    reference = load_ecapa_classifier("fp32")
+    optimized = load_ecapa_classifier(args.mode)
+    index = load_index()
+    speakers = set(index.speakers())
+
+    sims, agree, ref_times, opt_times = [], [], [], []
+    correct = {"fp32": 0, args.mode: 0}
+    labeled = 0
+
+    print(f"\n{'ファイル':<40} {'cos':>8} {'fp32':>8} {args.mode:>8} {'fp32 ms':>9} {args.mode + ' ms':>9}")
+    for wav_path in wavs:
+        signal, _ = librosa.load(wav_path, sr=16000)
+        ref_emb, ref_time = timed_embedding(reference, signal, args.repeat)
+        opt_emb, opt_time = timed_embedding(optimized, signal, args.repeat)
+
+        sim = float(np.dot(ref_emb, opt_emb) / (np.linalg.norm(ref_emb) * np.linalg.norm(opt_emb)))
+        ref_scores, _ = index.score(ref_emb, top_k=0)
+        opt_scores, _ = index.score(opt_emb, top_k=0)
+        ref_label = max(ref_scores, key=ref_scores.get)
+        opt_label = max(opt_scores, key=opt_scores.get)
+
+        sims.append(sim)
+        agree.append(ref_label == opt_label)
+        ref_times.append(ref_time)
+        opt_times.append(opt_time)
+
+        truth = os.path.basename(os.path.dirname(wav_path))
+        if truth in speakers:
+            labeled += 1
+            correct["fp32"] += ref_label == truth
+            correct[args.mode] += opt_label == truth
+
+        name = os.path.relpath(wav_path)[-40:]
+        print(f"{name:<40} {sim:>8.5f} {ref_label:>8} {opt_label:>8} {ref_time*1000:>9.1f} {opt_time*1000:>9.1f}")
+
+    print(f"\n{'='*60}")
+    print(f"📊 {len(wavs)}件 (モード: {args.mode})")
+    print(f"   embeddingコサイン類似度: 平均 {np.mean(sims):.5f} / 最小 {np.min(sims):.5f}")
+    print(f"   話者判定の一致率: {np.mean(agree)*100:.1f}%")
+    if labeled:
+        print(f"   正解率 (ラベル付き {labeled}件): fp32 {correct['fp32']/labeled*100:.1f}% / "
+              f"{args.mode} {correct[args.mode]/labeled*100:.1f}%")
+    print(f"   平均推論時間: fp32 {np.mean(ref_times)*1000:.1f}ms / {args.mode} {np.mean(opt_times)*1000:.1f}ms "
+          f"(x{np.mean(ref_times)/np.mean(opt_times):.2f})")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
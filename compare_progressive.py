@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+段階的な識別（先頭だけで打ち切り）と全体での識別の比較ツール
+
+各WAVについて、全体の embedding による判定と identify_progressive による判定を行い、
+- 正解率（全体 / 段階的）と判定の一致率
+- 判定に使った音声の割合と、どの長さで打ち切ったか
+- 1発話あたりの処理時間（短縮した時間）
+を表示する。キャッシュとマイクロバッチは通さず、毎回エンコーダーを直接実行して計測する
+
+使い方:
+    python3 compare_progressive.py --data data/test
+    python3 compare_progressive.py --data data/test --prefixes 0.5,1.0 --min-confidence 0.6 --min-margin 0.3
+
+結果を見て PROGRESSIVE_PREFIXES / PROGRESSIVE_MIN_CONFIDENCE / PROGRESSIVE_MIN_MARGIN を決め、PROGRESSIVE_ENABLED=1 で有効にする
+"""
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+
+import librosa
+import numpy as np
+
+import identify
+from compare_encoder import collect_wavs
+from encoder_modes import encode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="段階的な識別と全体での識別の比較")
+    parser.add_argument("wavs", nargs="*", help="比較に使うWAVファイル")
+    parser.add_argument("--data", help="WAVを再帰的に探すディレクトリ（親フォルダ名を正解ラベルとする）")
+    parser.add_argument("--prefixes", default=",".join(f"{p:g}" for p in identify.PROGRESSIVE_PREFIXES),
+                        help="試す先頭の長さ（秒、カンマ区切り）")
+    parser.add_argument("--min-confidence", type=float, default=identify.PROGRESSIVE_MIN_CONFIDENCE)
+    parser.add_argument("--min-margin", type=float, default=identify.PROGRESSIVE_MIN_MARGIN)
+    parser.add_argument("--repeat", type=int, default=3, help="時間計測の繰り返し回数")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    wavs = collect_wavs(args.wavs, args.data)
+    if not wavs:
+        parser.error("WAVファイルが指定されていません")
+    prefixes = tuple(float(x) for x in args.prefixes.split(",") if x.strip())
+
+    classifier = identify.get_ecapa_classifier()
+    index = identify.load_index()
+    speakers = set(index.speakers())
+    embed = lambda signal, cache=True: encode(classifier, identify._to_batch(signal)).squeeze().cpu().numpy()
+    embed(np.zeros(16000, dtype=np.float32))  # ウォームアップ
+
+    full_times, prog_times, used, exits = [], [], [], Counter()
+    agree = []
+    correct = {"full": 0, "progressive": 0}
+    labeled = 0
+
+    print(f"\n{'ファイル':<40} {'秒':>6} {'使用':>6} {'全体':>8} {'段階的':>8} {'全体 ms':>9} {'段階 ms':>9}")
+    for wav_path in wavs:
+        signal, _ = librosa.load(wav_path, sr=16000)
+        duration = len(signal) / 16000
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            full_label, _, _, _ = identify.score_embedding(embed(signal))
+        full_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            prog_label, _, used_sec = identify.identify_progressive(
+                signal, prefixes=prefixes, min_confidence=args.min_confidence,
+                min_margin=args.min_margin, embed=embed)
+        prog_time = (time.perf_counter() - start) / args.repeat
+
+        full_times.append(full_time)
+        prog_times.append(prog_time)
+        used.append(used_sec / duration if duration else 1.0)
+        exits["full" if used_sec >= duration else f"{used_sec:g}秒"] += 1
+        agree.append(full_label == prog_label)
+
+        truth = os.path.basename(os.path.dirname(wav_path))
+        if truth in speakers:
+            labeled += 1
+            correct["full"] += full_label == truth
+            correct["progressive"] += prog_label == truth
+
+        name = os.path.relpath(wav_path)[-40:]
+        print(f"{name:<40} {duration:>6.2f} {used_sec:>6.2f} {full_label:>8} {prog_label:>8} "
+              f"{full_time*1000:>9.1f} {prog_time*1000:>9.1f}")
+
+    saved = 1 - np.sum(prog_times) / np.sum(full_times)
+    print(f"\n{'='*60}")
+    print(f"📊 {len(wavs)}件 (先頭 {', '.join(f'{p:g}秒' for p in prefixes)} / "
+          f"確信度 {args.min_confidence} / 差 {args.min_margin})")
+    print(f"   打ち切った長さ: {dict(exits)}")
+    print(f"   使った音声の割合: 平均 {np.mean(used)*100:.1f}%")
+    print(f"   判定の一致率（全体との比較）: {np.mean(agree)*100:.1f}%")
+    if labeled:
+        full_acc = correct["full"] / labeled
+        prog_acc = correct["progressive"] / labeled
+        print(f"   正解率 (ラベル付き {labeled}件): 全体 {full_acc*100:.1f}% / 段階的 {prog_acc*100:.1f}% "
+              f"({(prog_acc - full_acc)*100:+.1f}pt)")
+    print(f"   平均処理時間: 全体 {np.mean(full_times)*1000:.1f}ms / 段階的 {np.mean(prog_times)*1000:.1f}ms "
+          f"({saved*100:.1f}% 短縮)")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+ECAPA-TDNN 用マイクロバッチ推論キュー
+複数リクエストの音声をまとめて1回の encode_batch で処理する
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+
+class EmbeddingBatcher:
+    """
+    待機中の発話を集めてパディングし、相対長 (wav_lens) 付きで一括推論する
+
+    - max_batch_size 件たまるか、最初の1件から max_wait_ms 経過したらバッチを確定
+    - 各呼び出し元には Future 経由で自分の embedding を返す
+    """
+
+    def __init__(self, encode_fn, max_batch_size=8, max_wait_ms=10):
+        """
+        Args:
+            encode_fn: (signals[B, T], wav_lens[B]) -> embeddings[B, 1, D] を返す関数
+                       （通常は EncoderClassifier.encode_batch）
+            max_batch_size: 1回の推論にまとめる最大件数
+            max_wait_ms: バッチを待つ最大時間（ミリ秒）
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ecapa-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, signal):
+        """波形を投入し、embedding (np.ndarray) を受け取る Future を返す"""
+        if isinstance(signal, torch.Tensor):
+            signal = signal.detach().to(torch.float32).reshape(-1)
+        else:
+            signal = torch.from_numpy(np.ascontiguousarray(signal, dtype=np.float32).reshape(-1))
+        future = Future()
+        self._queue.put((signal, future))
+        return future
+
+    def embed(self, signal, timeout=None):
+        """波形のembeddingを同期的に取得"""
+        return self.submit(signal).result(timeout=timeout)
+
+    def _collect(self):
+        """最初の1件を待ち、その後 max_wait 以内に届いた分をまとめる"""
+        items = [self._queue.get()]
+        end = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = end - time.monotonic()
+            try:
+                if remaining > 0:
+                    items.append(self._queue.get(timeout=remaining))
+                else:
+                    # 待ち時間切れでも、既にキューにある分は取り込む
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            signals = [signal for signal, _ in items]
+            futures = [future for _, future in items]
+            try:
+                embeddings = self._encode(signals)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, embedding in zip(futures, embeddings):
+                future.set_result(embedding)
+
+    def _encode(self, signals):
+        """パディングして1回の encode_fn 呼び出しで推論"""
+        return encode_padded(self.encode_fn, signals)
+
+
+def encode_padded(encode_fn, signals):
+    """
+    長さの異なる波形をゼロパディングして1回の encode_fn 呼び出しで推論する
+
+    Returns:
+        list[np.ndarray]: 入力と同じ順の embedding
+    """
+    lengths = torch.tensor([len(s) for s in signals], dtype=torch.float32)
+    max_len = int(lengths.max().item())
+    batch = torch.zeros(len(signals), max_len, dtype=torch.float32)
+    for i, s in enumerate(signals):
+        if not isinstance(s, torch.Tensor):
+            s = torch.from_numpy(np.ascontiguousarray(s, dtype=np.float32))
+        batch[i, :len(s)] = s
+    wav_lens = lengths / max_len
+    embeddings = encode_fn(batch, wav_lens)
+    embeddings = embeddings.reshape(len(signals), -1).cpu().numpy()
+    return [embeddings[i] for i in range(len(signals))]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+話者embeddingのキャッシュ
+デコード済みPCMのハッシュをキーに、同じ音声ではECAPA-TDNNを実行しない
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _checkpoint_stat(checkpoint_path):
+    try:
+        st = os.stat(checkpoint_path)
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _fingerprint(checkpoint_stat, model_tag):
+    return hashlib.blake2b(f"{checkpoint_stat}:{model_tag}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def checkpoint_fingerprint(checkpoint_path, model_tag=""):
+    """エンコーダーの指紋（チェックポイントのサイズ・更新時刻と推論モードから作る）"""
+    return _fingerprint(_checkpoint_stat(checkpoint_path), model_tag)
+
+
+class EmbeddingCache:
+    """
+    PCMハッシュ → embedding のキャッシュ
+
+    - メモリ上: 件数上限付きLRU
+    - ディスク上（任意）: disk_dir/<モデル指紋>/<キー>.npy
+    - エンコーダーのチェックポイントが更新されたら自動的に破棄する
+    """
+
+    def __init__(self, checkpoint_path, max_entries=256, disk_dir=None, model_tag=""):
+        """
+        Args:
+            checkpoint_path: エンコーダーのチェックポイント（変更検知に使う）
+            max_entries: メモリ上に保持する最大件数
+            disk_dir: ディスクキャッシュの保存先（None で無効）
+            model_tag: 推論モードなど、embeddingを変える追加の識別子
+        """
+        self.checkpoint_path = checkpoint_path
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self.model_tag = model_tag
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._checkpoint_stat = None
+        self._fingerprint = None
+        self._check_checkpoint()
+
+    @staticmethod
+    def key_for(signal):
+        """デコード済みPCM（float32）の内容からキーを作る"""
+        data = np.ascontiguousarray(signal, dtype=np.float32)
+        return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """キャッシュを参照（無ければ None）"""
+        with self._lock:
+            self._check_checkpoint()
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        embedding = self._load_from_disk(key)
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, embedding)
+        return embedding
+
+    def put(self, key, embedding):
+        """embeddingを登録"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            disk_path = self._disk_path(key)
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, disk_path)
+
+    def clear(self):
+        """メモリ上のキャッシュと統計を破棄"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ヒット/ミス数などの統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk": self.disk_dir is not None,
+                "fingerprint": self._fingerprint
+            }
+
+    def _remember(self, key, embedding):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _check_checkpoint(self):
+        """チェックポイントのサイズ・更新時刻が変わっていたらキャッシュを破棄"""
+        checkpoint_stat = _checkpoint_stat(self.checkpoint_path)
+        if checkpoint_stat == self._checkpoint_stat and self._fingerprint is not None:
+            return
+
+        fingerprint = _fingerprint(checkpoint_stat, self.model_tag)
+        if self._fingerprint is not None and fingerprint != self._fingerprint:
+            logger.info("🔄 エンコーダーの更新を検知したため、embeddingキャッシュを破棄します")
+            self._entries.clear()
+            self._purge_stale_disk(fingerprint)
+        self._checkpoint_stat = checkpoint_stat
+        self._fingerprint = fingerprint
+
+    def _disk_path(self, key):
+        if self.disk_dir is None:
+            return None
+        return os.path.join(self.disk_dir, self._fingerprint, f"{key}.npy")
+
+    def _load_from_disk(self, key):
+        with self._lock:
+            disk_path = self._disk_path(key)
+        if not disk_path or not os.path.exists(disk_path):
+            return None
+        try:
+            return np.load(disk_path)
+        except Exception:
+            return None
+
+    def _purge_stale_disk(self, fingerprint):
+        """古いモデル指紋のディスクキャッシュを削除"""
+        if self.disk_dir is None or not os.path.isdir(self.disk_dir):
+            return
+        for name in os.listdir(self.disk_dir):
+            if name != fingerprint:
+                shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
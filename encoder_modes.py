@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+ECAPA-TDNN エンコーダーのCPU向け推論モード
+
+- fp32: SpeechBrainのモデルをそのまま（eager）実行
+- jit : embedding_model を torch.jit.trace でグラフ化し、freeze + optimize_for_inference
+        （Conv+BatchNorm の畳み込みなどが適用される）
+
+どのモードでも推論は torch.inference_mode の下で行う
+"""
+
+import logging
+import warnings
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+ENCODER_MODES = ("fp32", "jit")
+
+# トレース用のダミー入力（約3秒分の80次元Fbank）
+_TRACE_FRAMES = 300
+_TRACE_FEATS = 80
+
+
+def optimize_encoder(classifier, mode="fp32"):
+    """
+    EncoderClassifier の embedding_model を指定モードに差し替える
+
+    encode_batch の前処理（Fbank・正規化）と後処理はそのまま使われる
+    """
+    if mode not in ENCODER_MODES:
+        raise ValueError(f"未対応のエンコーダーモード: {mode} (対応: {', '.join(ENCODER_MODES)})")
+    if mode == "fp32":
+        return classifier
+
+    model = classifier.mods.embedding_model.eval()
+    example = (torch.randn(1, _TRACE_FRAMES, _TRACE_FEATS), torch.ones(1))
+    with torch.inference_mode(), warnings.catch_warnings():
+        # 可変長入力でもグラフは変わらないため、トレース時の警告は抑制
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        traced = torch.jit.trace(model, example, check_trace=False)
+        traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        # 最適化パスはここで1度走らせておく
+        traced(*example)
+    classifier.mods.embedding_model = traced
+    logger.info("✅ embedding_model を TorchScript (freeze + optimize_for_inference) に変換")
+    return classifier
+
+
+def encode(classifier, signals, wav_lens=None):
+    """torch.inference_mode の下で encode_batch を実行"""
+    with torch.inference_mode():
+        return classifier.encode_batch(signals, wav_lens)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+話者登録パイプライン
+
+data/<話者>/*.wav の録音から ECAPA-TDNN の embedding を計算し、
+models/ecapa.enroll（メモリマップ形式、エグゼンプラー + セントロイド）と models/ecapa.pkl を作る
+
+- embedding はプロセスプールで並列に計算し、各ワーカーは長さの近い録音をまとめてバッチ推論する
+- models/ecapa.manifest.json に録音ごとのハッシュを記録し、再実行時は追加・変更された録音だけを計算する
+  （サイズと更新時刻が同じ録音はハッシュも計算しない。エンコーダーが変わった場合は全件計算し直す）
+- API（/api/speakers）から登録したエグゼンプラーはそのまま残す
+  （別のエンコーダーで計算したものは混ぜずに捨てる。元の録音がないため API から登録し直す）
+
+使い方:
+    python3 enroll.py                         # data/ 以下を登録（変更のあった録音だけ計算）
+    python3 enroll.py --workers 4 --batch-size 16
+    python3 enroll.py --full                  # 全件計算し直す
+    python3 enroll.py --out /tmp/x.enroll     # /tmp/x.pkl・/tmp/x.manifest.json も同じ場所に書く
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_io import decode_audio, trim_silence, TARGET_SR
+from embedding_cache import checkpoint_fingerprint
+from enrollment_store import read_enrollment, write_enrollment
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "data"
+SPEAKER_MODEL_PATH = "models/ecapa.pkl"
+ENROLLMENT_PATH = os.environ.get("ENROLLMENT_PATH", "models/ecapa.enroll")
+MANIFEST_PATH = "models/ecapa.manifest.json"
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg")
+# 話者として扱わないディレクトリ（評価用の録音など）
+EXCLUDE_DIRS = ("test",)
+
+# identify と同じエンコーダー（指紋が変わったら全件計算し直す）
+ENCODER_CHECKPOINT = "pretrained_models/ecapa/embedding_model.ckpt"
+ECAPA_MODE = os.environ.get("ECAPA_MODE", "fp32")
+
+
+def output_paths(enrollment_path):
+    """登録ファイルと同じ場所・同じ名前の (ecapa.pkl 相当, マニフェスト) のパス"""
+    stem = os.path.splitext(enrollment_path)[0]
+    return f"{stem}.pkl", f"{stem}.manifest.json"
+
+
+def file_sha256(path):
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_recordings(data_dir=DATA_DIR, exclude=EXCLUDE_DIRS):
+    """
+    data_dir/<話者>/ 以下の録音を列挙
+
+    Returns:
+        dict: 相対パス → {"speaker", "path", "size", "mtime_ns"}
+    """
+    recordings = {}
+    for speaker in sorted(os.listdir(data_dir)):
+        speaker_dir = os.path.join(data_dir, speaker)
+        if speaker in exclude or speaker.startswith(".") or not os.path.isdir(speaker_dir):
+            continue
+        for root, _, files in os.walk(speaker_dir):
+            for name in sorted(files):
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                recordings[os.path.relpath(path, data_dir)] = {
+                    "speaker": speaker, "path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns
+                }
+    return recordings
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """前回の登録内容（なければ空）"""
+    if not os.path.exists(path):
+        return {"encoder": None, "files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def plan(recordings, manifest, previous, encoder, full=False):
+    """
+    前回の結果を使える録音と、embedding を計算し直す録音に分ける
+
+    Args:
+        previous: 前回の Enrollment（なければ None）
+
+    Returns:
+        (reuse: {相対パス: embedding}, todo: [相対パス], hashes: {相対パス: sha256})
+    """
+    previous_rows = {}
+    if previous is not None and not full and manifest.get("encoder") == encoder:
+        previous_rows = {source: i for i, source in enumerate(previous.sources()) if source}
+
+    reuse, todo, hashes = {}, [], {}
+    for rel, info in recordings.items():
+        entry = manifest["files"].get(rel)
+        if entry and entry["size"] == info["size"] and entry["mtime_ns"] == info["mtime_ns"]:
+            hashes[rel] = entry["sha256"]
+        else:
+            hashes[rel] = file_sha256(info["path"])
+        unchanged = entry and entry["sha256"] == hashes[rel] and entry["speaker"] == info["speaker"]
+        if unchanged and rel in previous_rows:
+            reuse[rel] = np.array(previous.matrix[previous_rows[rel]])
+        else:
+            todo.append(rel)
+    return reuse, todo, hashes
+
+
+def _init_worker(threads):
+    """ワーカーごとに torch のスレッド数を絞ってから identify を読み込む"""
+    import torch
+    torch.set_num_threads(threads)
+    import identify  # noqa: F401
+
+
+def _embed_files(paths, batch_size, vad, aggressiveness):
+    """録音をデコードしてまとめて embedding を計算（ワーカー内で実行）"""
+    import identify
+    signals = []
+    for path in paths:
+        with open(path, "rb") as f:
+            signal = decode_audio(f.read(), TARGET_SR)
+        if vad:
+            signal, _ = trim_silence(signal, TARGET_SR, aggressiveness=aggressiveness)
+        signals.append(signal)
+    return [np.asarray(e, dtype=np.float32) for e in
+            identify.get_embeddings_from_signals(signals, batch_size=batch_size)]
+
+
+def embed_recordings(recordings, todo, workers=1, batch_size=16, vad=True, aggressiveness=2):
+    """
+    todo の録音の embedding を計算
+
+    長さ（ファイルサイズ）順に並べて batch_size 件ずつに分け、ワーカーに配る
+
+    Returns:
+        dict: 相対パス → embedding
+    """
+    todo = sorted(todo, key=lambda rel: recordings[rel]["size"])
+    chunks = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    args = lambda chunk: ([recordings[rel]["path"] for rel in chunk], batch_size, vad, aggressiveness)
+    embeddings = {}
+    start = time.perf_counter()
+
+    if workers <= 1 or len(chunks) <= 1:
+        _init_worker(os.cpu_count() or 1)
+        results = (_embed_files(*args(chunk)) for chunk in chunks)
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,))
+        futures = [pool.submit(_embed_files, *args(chunk)) for chunk in chunks]
+        results = (future.result() for future in futures)
+    try:
+        for chunk, vectors in zip(chunks, results):
+            embeddings.update(zip(chunk, vectors))
+            print(f"   {len(embeddings)}/{len(todo)}件 ({time.perf_counter() - start:.1f}秒)")
+    finally:
+        if workers > 1 and len(chunks) > 1:
+            pool.shutdown(cancel_futures=True)
+    return embeddings
+
+
+def enroll(data_dir=DATA_DIR, workers=1, batch_size=16, full=False, vad=True, aggressiveness=2,
+           enrollment_path=ENROLLMENT_PATH, model_path=SPEAKER_MODEL_PATH, manifest_path=MANIFEST_PATH):
+    """
+    data_dir の録音を登録して登録ファイル・ecapa.pkl・マニフェストを書き出す
+
+    Returns:
+        dict: {"revision", "speakers", "reused", "embedded", "removed", "stale"}
+            stale: 削除した API 登録のエグゼンプラー（エンコーダーが変わったもの）の件数
+    """
+    encoder = checkpoint_fingerprint(ENCODER_CHECKPOINT, ECAPA_MODE)
+    recordings = scan_recordings(data_dir)
+    manifest = load_manifest(manifest_path)
+    previous = read_enrollment(enrollment_path) if os.path.exists(enrollment_path) else None
+
+    reuse, todo, hashes = plan(recordings, manifest, previous, encoder, full=full)
+    removed = sorted(set(manifest["files"]) - set(recordings))
+    print(f"📋 録音 {len(recordings)}件: 再利用 {len(reuse)}件 / 計算 {len(todo)}件 / 削除 {len(removed)}件")
+
+    if not todo and not removed and previous is not None and manifest.get("encoder") == encoder and not full:
+        print("✅ 変更はありません")
+        return {"revision": previous.revision, "speakers": dict(zip(previous.speakers, previous.counts)),
+                "reused": len(reuse), "embedded": 0, "removed": 0, "stale": 0}
+
+    embeddings = dict(reuse)
+    embeddings.update(embed_recordings(recordings, todo, workers=workers, batch_size=batch_size,
+                                       vad=vad, aggressiveness=aggressiveness))
+
+    # 話者ごとに録音の行を並べ、API から登録した行（元ファイルなし）は後ろに残す
+    exemplars, sources = {}, {}
+    for rel in sorted(recordings):
+        speaker = recordings[rel]["speaker"]
+        exemplars.setdefault(speaker, []).append(embeddings[rel])
+        sources.setdefault(speaker, []).append(rel)
+    stale = 0
+    if previous is not None:
+        for i, source in enumerate(previous.sources()):
+            if source is None and previous.header.get("encoder") != encoder:
+                stale += 1
+            elif source is None:
+                speaker = previous.speakers[np.searchsorted(
+                    np.cumsum(previous.counts), i, side="right")]
+                exemplars.setdefault(speaker, []).append(np.array(previous.matrix[i]))
+                sources.setdefault(speaker, []).append(None)
+    if stale:
+        logger.warning(f"⚠️  別のエンコーダーで計算した API 登録のエグゼンプラー {stale}件を削除しました"
+                       "（元の録音がないため /api/speakers から登録し直してください）")
+    if not exemplars:
+        raise ValueError(f"登録する録音がありません: {data_dir}/<話者>/*.wav")
+    exemplars = {speaker: np.vstack(vectors) for speaker, vectors in exemplars.items()}
+
+    revision = write_enrollment(enrollment_path, exemplars, sources=sources, encoder=encoder)
+
+    # 従来の形式（identify.save_index と同じ）
+    tmp_path = f"{model_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({s: v[0] if len(v) == 1 else v for s, v in exemplars.items()}, f)
+    os.replace(tmp_path, model_path)
+
+    manifest = {
+        "revision": revision,
+        "encoder": encoder,
+        "files": {
+            rel: {"speaker": info["speaker"], "sha256": hashes[rel],
+                  "size": info["size"], "mtime_ns": info["mtime_ns"]}
+            for rel, info in sorted(recordings.items())
+        }
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    return {"revision": revision, "speakers": {s: len(v) for s, v in exemplars.items()},
+            "reused": len(reuse), "embedded": len(todo), "removed": len(removed), "stale": stale}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data/<話者>/*.wav から話者を登録")
+    parser.add_argument("--data", default=DATA_DIR, help="話者ごとのディレクトリを置いた場所")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)),
+                        help="embedding を計算するプロセス数")
+    parser.add_argument("--batch-size", type=int, default=16, help="embedding推論1回あたりの件数")
+    parser.add_argument("--full", action="store_true", help="前回の結果を使わずに全件計算し直す")
+    parser.add_argument("--no-vad", action="store_true", help="VADによる無音除去を行わない")
+    parser.add_argument("--vad-aggressiveness", type=int,
+                        default=int(os.environ.get("VAD_AGGRESSIVENESS", "2")))
+    parser.add_argument("--out", help=f"登録ファイル（メモリマップ形式、既定は {ENROLLMENT_PATH}）。"
+                                      "指定した場合は .pkl とマニフェストも同じ場所・同じ名前で書く")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    if args.out:
+        enrollment_path = args.out
+        model_path, manifest_path = output_paths(args.out)
+    else:
+        enrollment_path, model_path, manifest_path = ENROLLMENT_PATH, SPEAKER_MODEL_PATH, MANIFEST_PATH
+
+    start = time.perf_counter()
+    result = enroll(args.data, workers=args.workers, batch_size=args.batch_size, full=args.full,
+                    vad=not args.no_vad, aggressiveness=args.vad_aggressiveness,
+                    enrollment_path=enrollment_path, model_path=model_path, manifest_path=manifest_path)
+
+    print(f"\n{'='*60}")
+    print(f"✅ 話者登録 版 {result['revision']}: {result['speakers']} ({time.perf_counter() - start:.1f}秒)")
+    print(f"   再利用 {result['reused']}件 / 計算 {result['embedded']}件 / 削除 {result['removed']}件")
+    if result["stale"]:
+        print(f"   エンコーダー変更で削除した API 登録: {result['stale']}件")
+    print(f"   登録ファイル: {enrollment_path}")
+    print(f"   従来形式: {model_path}")
+    print(f"   マニフェスト: {manifest_path}")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+話者登録ファイル（models/ecapa.enroll）
+
+L2正規化済みのエグゼンプラー行列と話者ごとのセントロイドを、
+ヘッダー（JSON）の後ろに float32 の生データとして並べた1つのファイル
+np.memmap でそのまま読めるため、起動時にコピーせず、複数のワーカープロセスでもページを共有できる
+
+    [MAGIC 8バイト][ヘッダー長 uint64][ヘッダー JSON（64バイト境界まで空白で埋める）]
+    [エグゼンプラー (N, D) float32][セントロイド (話者数, D) float32]
+
+エグゼンプラーは話者ごとに連続して並ぶ（SpeakerIndex の行列と同じ並び）
+書き込みは一時ファイルから os.replace で差し替えるため、読み込み中のプロセスは古い版を使い続けられる
+
+    write_enrollment("models/ecapa.enroll", {"parent": vectors, ...}, sources={"parent": ["data/parent/a.wav", ...]})
+    enrollment = read_enrollment("models/ecapa.enroll")
+    enrollment.exemplars("parent")   # (n, D) の memmap ビュー
+"""
+
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from speaker_index import _normalize
+
+MAGIC = b"SMKENRL\x00"
+FORMAT_VERSION = 1
+_ALIGN = 64
+
+
+class Enrollment:
+    """読み込んだ登録ファイル（行列は読み取り専用の memmap）"""
+
+    def __init__(self, header, matrix, centroids):
+        self.header = header
+        self.matrix = matrix
+        self.centroids = centroids
+        self.speakers = [s["name"] for s in header["speakers"]]
+        self.counts = [s["count"] for s in header["speakers"]]
+        self._starts = {s["name"]: s["start"] for s in header["speakers"]}
+
+    @property
+    def revision(self):
+        return self.header["revision"]
+
+    def exemplars(self, speaker):
+        """話者のエグゼンプラー（memmap のビュー）"""
+        start = self._starts[speaker]
+        return self.matrix[start:start + self.counts[self.speakers.index(speaker)]]
+
+    def centroid(self, speaker):
+        return self.centroids[self.speakers.index(speaker)]
+
+    def sources(self):
+        """行ごとの元ファイル（API から登録した行は None）"""
+        return self.header.get("sources") or [None] * len(self.matrix)
+
+    def to_dict(self):
+        """{話者: (n, D) 行列}（models/ecapa.pkl と同じ形式）"""
+        return {speaker: self.exemplars(speaker) for speaker in self.speakers}
+
+
+def write_enrollment(path, exemplars, sources=None, revision=None, encoder=None):
+    """
+    登録ファイルを書き出す
+
+    Args:
+        exemplars: {話者: (n, D) 行列}（正規化していなくてもよい）
+        sources: {話者: [元ファイル or None, ...]}（行と同じ順）
+        revision: 版数（None なら既存ファイルの版数 + 1）
+        encoder: embedding を計算したエンコーダーの指紋
+
+    Returns:
+        書き込んだ版数
+    """
+    speakers = [s for s, v in exemplars.items() if len(np.atleast_2d(v))]
+    blocks = [_normalize(exemplars[s]) for s in speakers]
+    dim = blocks[0].shape[1] if blocks else 0
+    if any(block.shape[1] != dim for block in blocks):
+        raise ValueError("embedding次元が話者によって異なります")
+    matrix = np.vstack(blocks) if blocks else np.zeros((0, dim), dtype=np.float32)
+    centroids = (_normalize(np.vstack([block.mean(axis=0) for block in blocks]))
+                 if blocks else np.zeros((0, dim), dtype=np.float32))
+
+    if revision is None:
+        revision = 1
+        if os.path.exists(path):
+            try:
+                revision = read_enrollment(path).revision + 1
+            except (OSError, ValueError):
+                pass
+
+    rows = []
+    meta = []
+    start = 0
+    for speaker, block in zip(speakers, blocks):
+        meta.append({"name": speaker, "start": start, "count": len(block)})
+        start += len(block)
+        speaker_sources = list((sources or {}).get(speaker) or [])
+        rows.extend(speaker_sources[:len(block)] + [None] * (len(block) - len(speaker_sources)))
+
+    header = {
+        "format": FORMAT_VERSION,
+        "revision": revision,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "encoder": encoder,
+        "dim": dim,
+        "rows": len(matrix),
+        "speakers": meta,
+        "sources": rows
+    }
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    prefix = len(MAGIC) + 8
+    data += b" " * (-(prefix + len(data)) % _ALIGN)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(data)))
+        f.write(data)
+        f.write(np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        f.write(np.ascontiguousarray(centroids, dtype="<f4").tobytes())
+    os.replace(tmp_path, path)
+    return revision
+
+
+def read_enrollment(path, mmap=True):
+    """
+    登録ファイルを読み込む
+
+    Args:
+        mmap: True なら行列をファイルのメモリマップとして返す（コピーしない）
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"話者登録ファイルではありません: {path}")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"未対応の登録ファイル形式です: {header.get('format')}")
+
+    offset = len(MAGIC) + 8 + header_len
+    rows, dim, n_speakers = header["rows"], header["dim"], len(header["speakers"])
+    shape = (rows + n_speakers, dim)
+    if rows + n_speakers == 0 or dim == 0:
+        data = np.zeros(shape, dtype=np.float32)
+    elif mmap:
+        data = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=shape)
+    else:
+        data = np.fromfile(path, dtype="<f4", count=shape[0] * shape[1], offset=offset).reshape(shape)
+    return Enrollment(header, data[:rows], data[rows:])
@@ -0,0 +1,61 @@
+# 本番モード（./start.sh prod）の gunicorn 設定
+#
+# - gthread ワーカー: 1プロセスあたり WEB_THREADS 本のスレッドでリクエストを並行処理（WebSocket も同じスレッドで扱う）
+# - CPU負荷の高いデコード・embedding推論は各ワーカーの推論プール（INFERENCE_WORKERS）で実行する
+# - 状態はワーカー間で共有するため SESSION_STORE=sqlite で動かす（start.sh で設定）
+# - PRELOAD_MODEL=1 ならマスターで ECAPA-TDNN・話者インデックス・GMM を読み込んでから fork し、
+#   ワーカー（と推論プールのプロセス）は重みのページをコピーオンライトで共有する
+
+import gc
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+
+# 応答が返らないワーカーを再起動するまでの秒数（推論プールのタイムアウトより長くする）
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# メモリの断片化・リークに備えて一定数のリクエストごとにワーカーを入れ替える（0 で無効）
+max_requests = int(os.environ.get("WORKER_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "INFO").lower()
+
+preload_model = os.environ.get("PRELOAD_MODEL", "0") == "1"
+
+
+def on_starting(server):
+    """ワーカーを fork する前にマスターでモデルを読み込む（app.py はスレッドを起動するためマスターでは読み込まない）"""
+    if workers > 1 and os.environ.get("TTS_CACHE_DISK", "1") != "1":
+        # メモリのみの TTS キャッシュはワーカー間で共有しないため、応答音声の配信が別のワーカーに届くと見つからない
+        server.log.warning("⚠️  TTS_CACHE_DISK=0 では応答音声を登録したワーカーからしか配信できません（TTS_CACHE_DISK=1 を推奨）")
+    if not preload_model:
+        return
+    import identify
+    import speaker_cascade
+    speaker_cascade.get_gmm_scorer()
+    try:
+        identify.preload_for_fork()
+    except Exception as e:
+        server.log.warning(f"⚠️  マスターでエンコーダーを読み込めません（各ワーカーで読み込みます）: {e}")
+    # 読み込んだオブジェクトを GC の対象から外し、GC が走っても共有ページに書き込まないようにする
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """マスターで読み込んだ後に話者登録ファイルが更新されていれば、ワーカーでは読み直す"""
+    if preload_model:
+        import identify
+        identify.refresh_index()
+
+
+def worker_exit(server, worker):
+    """ワーカー終了時に推論プールのプロセスも止める"""
+    import app
+    if app.inference_pool is not None:
+        app.inference_pool.shutdown()
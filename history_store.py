@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+会話ログの履歴データベース（SQLite）
+タイムスタンプ・話者・コマンド・態度にインデックスを張り、
+ページングや期間指定の検索、集計を高速に行う
+
+ログ書き込みスレッドから1バッチごとに追記されるため、
+JSONファイルを読み直さなくても常に最新の状態で検索できる
+
+既存のログから作り直す場合:
+    python3 history_store.py --rebuild
+"""
+
+import argparse
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+from log_writer import _to_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id TEXT,
+    timestamp TEXT NOT NULL,
+    speaker TEXT,
+    user_text TEXT,
+    command TEXT,
+    attitude TEXT,
+    response TEXT,
+    sync_rate INTEGER,
+    method TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp);
+CREATE INDEX IF NOT EXISTS idx_entries_speaker ON entries (speaker, timestamp);
+CREATE INDEX IF NOT EXISTS idx_entries_command ON entries (command, timestamp);
+CREATE INDEX IF NOT EXISTS idx_entries_attitude ON entries (attitude, timestamp);
+"""
+
+# 集計の時間単位 → ISO8601タイムスタンプの先頭何文字でまとめるか
+BUCKETS = {
+    "minute": 16,   # 2025-11-18T14:30
+    "hour": 13,     # 2025-11-18T14
+    "day": 10,      # 2025-11-18
+    "month": 7      # 2025-11
+}
+
+COLUMNS = ("request_id", "timestamp", "speaker", "user_text", "command",
+           "attitude", "response", "sync_rate", "method")
+
+
+class HistoryStore:
+    """会話ログのSQLiteストア"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # 複数のワーカーが同時に起動しても、WALへの切り替えとスキーマの作成は1プロセスずつ行う
+        with open(f"{db_path}.lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """スレッドごとに接続を1つ持つ（WALで読み書きを並行させる）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def insert_many(self, entries):
+        """ログエントリーをまとめて追加（1トランザクション）"""
+        rows = [
+            tuple(entry.get(col) for col in COLUMNS)
+            + (json.dumps(entry, ensure_ascii=False, default=_to_json),)
+            for entry in entries
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO entries ({', '.join(COLUMNS)}, data) "
+                f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                rows
+            )
+
+    @staticmethod
+    def _where(start=None, end=None, speaker=None, command=None, attitude=None):
+        clauses, params = [], []
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        for col, value in (("speaker", speaker), ("command", command), ("attitude", attitude)):
+            if value:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, limit=50, offset=0, **filters):
+        """
+        条件に合うエントリーを新しい順に取得
+
+        Returns:
+            (entries, total): entries はログエントリーのリスト、total は条件に合う全件数
+        """
+        where, params = self._where(**filters)
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM entries {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT data FROM entries {where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows], total
+
+    def sync_rate_series(self, bucket="hour", **filters):
+        """時間単位ごとのシンクロ率（平均・最小・最大）と件数"""
+        width = BUCKETS[bucket]
+        where, params = self._where(**filters)
+        rows = self._connect().execute(
+            f"SELECT substr(timestamp, 1, {width}) AS bucket, COUNT(*) AS count, "
+            f"AVG(sync_rate) AS avg, MIN(sync_rate) AS min, MAX(sync_rate) AS max "
+            f"FROM entries {where} GROUP BY bucket ORDER BY bucket",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def command_counts(self, **filters):
+        """話者ごとのコマンド件数"""
+        where, params = self._where(**filters)
+        rows = self._connect().execute(
+            f"SELECT speaker, command, COUNT(*) AS count FROM entries {where} "
+            f"GROUP BY speaker, command ORDER BY speaker, count DESC",
+            params
+        ).fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["speaker"], {})[row["command"] or "NONE"] = row["count"]
+        return counts
+
+    def attitude_counts(self, **filters):
+        """話者ごとの態度件数"""
+        where, params = self._where(**filters)
+        rows = self._connect().execute(
+            f"SELECT speaker, attitude, COUNT(*) AS count FROM entries {where} "
+            f"GROUP BY speaker, attitude ORDER BY speaker, count DESC",
+            params
+        ).fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["speaker"], {})[row["attitude"]] = row["count"]
+        return counts
+
+    def rebuild(self, log_dir):
+        """logs/ 以下の JSONL（および旧形式の *.json）から作り直す"""
+        entries = []
+        for path in sorted(glob.glob(os.path.join(log_dir, "*.jsonl"))):
+            with open(path, encoding="utf-8") as f:
+                entries.extend(json.loads(line) for line in f if line.strip())
+        for path in sorted(glob.glob(os.path.join(log_dir, "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                entries.append(json.load(f))
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+        self.insert_many(entries)
+        return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会話ログ履歴データベースの管理")
+    parser.add_argument("--db", default="logs/history.sqlite3")
+    parser.add_argument("--rebuild", action="store_true", help="logs/ のログから作り直す")
+    parser.add_argument("--log-dir", default="logs")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db)
+    if args.rebuild:
+        count = store.rebuild(args.log_dir)
+        print(f"✅ {count}件のログから履歴データベースを作り直しました: {args.db}")
+    entries, total = store.query(limit=5)
+    print(f"📚 登録件数: {total}")
+    for entry in entries:
+        print(f"   {entry['timestamp']} {entry.get('speaker')} {entry.get('command')} {entry.get('user_text')}")
@@ -3,50 +3,253 @@ import numpy as np
 import torch
 import librosa
 import os
+import logging
+import threading
 from speechbrain.inference import EncoderClassifier
+from embedding_batcher import EmbeddingBatcher, encode_padded
+from embedding_cache import EmbeddingCache
+from speaker_index import SpeakerIndex
+from enrollment_store import read_enrollment, write_enrollment
+from encoder_modes import optimize_encoder, encode
+from metrics import REGISTRY, span
+
+logger = logging.getLogger(__name__)
+
+# エンコーダーの推論モード ("fp32" / "jit")
+ECAPA_MODE = os.environ.get("ECAPA_MODE", "fp32")
+
+# マイクロバッチ設定（ECAPA_MAX_BATCH=1 でバッチ処理を無効化）
+ECAPA_MAX_BATCH = int(os.environ.get("ECAPA_MAX_BATCH", "8"))
+ECAPA_MAX_WAIT_MS = float(os.environ.get("ECAPA_MAX_WAIT_MS", "10"))
+
+# embeddingキャッシュ設定（EMBEDDING_CACHE_SIZE=0 でメモリキャッシュ無効）
+ECAPA_SAVEDIR = "pretrained_models/ecapa"
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "256"))
+EMBEDDING_CACHE_DIR = "pretrained_models/embedding_cache"
+EMBEDDING_CACHE_DISK = os.environ.get("EMBEDDING_CACHE_DISK", "0") == "1"
+
+# 話者登録ファイルと、話者ごとのスコア集約方法 ("max" / "mean")
+# ENROLLMENT_PATH（enroll.py が作るメモリマップ形式）があればそちらを優先して読む
+SPEAKER_MODEL_PATH = "models/ecapa.pkl"
+ENROLLMENT_PATH = os.environ.get("ENROLLMENT_PATH", "models/ecapa.enroll")
+SCORE_AGGREGATE = os.environ.get("SCORE_AGGREGATE", "max")
+
+# 段階的な識別: 発話の先頭 PROGRESSIVE_PREFIXES 秒で順に判定し、1位の確信度が PROGRESSIVE_MIN_CONFIDENCE 以上かつ
+# 2位とのコサイン類似度の差が PROGRESSIVE_MIN_MARGIN 以上になったら残りの音声は使わない
+# しきい値は compare_progressive.py で手元のデータの精度を確認してから有効にする（既定は常に全体）
+PROGRESSIVE_ENABLED = os.environ.get("PROGRESSIVE_ENABLED", "0") == "1"
+PROGRESSIVE_PREFIXES = tuple(
+    float(x) for x in os.environ.get("PROGRESSIVE_PREFIXES", "0.75,1.5").split(",") if x.strip()
+)
+# 話者が2人なら確信度 0.55 は差 約0.2 に当たる（softmax）。3人以上では3位以下も近いと確信度が足りず打ち切らない
+PROGRESSIVE_MIN_CONFIDENCE = float(os.environ.get("PROGRESSIVE_MIN_CONFIDENCE", "0.55"))
+PROGRESSIVE_MIN_MARGIN = float(os.environ.get("PROGRESSIVE_MIN_MARGIN", "0.2"))
+# 全体に対してこの割合を超える先頭は試さない（打ち切れても節約が小さく、打ち切れないと無駄になるため）
+PROGRESSIVE_MAX_FRACTION = 2 / 3
+
+PROGRESSIVE_EXITS = REGISTRY.counter(
+    "smartspeaker_progressive_exit_total", "段階的な識別で判定を確定させた長さ（秒 または full）", ("at",))
 
 # グローバル変数でモデルとECAPAエンコーダーをキャッシュ
 _models = None
+_index = None
+_sources = {}      # 話者 → エグゼンプラーごとの元ファイル（ENROLLMENT_PATH 用）
 _classifier = None
+_batcher = None
+_cache = None
+_index_stamp = None  # 話者インデックスを読み込んだ時点のファイルの (パス, 更新時刻)
+# 並行リクエストで二重ロードしないためのロック
+_load_lock = threading.Lock()
+
+def load_ecapa_classifier(mode=ECAPA_MODE):
+    """ECAPA-TDNNエンコーダーを新たにロードし、指定の推論モードに変換"""
+    logger.info(f"🔄 ECAPA-TDNNモデルをロード中... (モード: {mode})")
+    classifier = EncoderClassifier.from_hparams(
+        source="speechbrain/spkrec-ecapa-voxceleb",
+        savedir=ECAPA_SAVEDIR
+    )
+    classifier = optimize_encoder(classifier, mode)
+    logger.info("✅ ECAPA-TDNNモデルのロード完了")
+    return classifier
 
 def get_ecapa_classifier():
     """ECAPA-TDNNエンコーダーを遅延ロード"""
     global _classifier
-    if _classifier is None:
-        print("🔄 ECAPA-TDNNモデルをロード中...")
-        _classifier = EncoderClassifier.from_hparams(
-            source="speechbrain/spkrec-ecapa-voxceleb",
-            savedir="pretrained_models/ecapa"
-        )
-        print("✅ ECAPA-TDNNモデルのロード完了")
+    with _load_lock:
+        if _classifier is None:
+            _classifier = load_ecapa_classifier(ECAPA_MODE)
     return _classifier
 
+def get_batcher():
+    """encode_batch の前段に置くマイクロバッチキューを遅延生成"""
+    global _batcher
+    classifier = get_ecapa_classifier()
+    with _load_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher(
+                lambda signals, wav_lens: encode(classifier, signals, wav_lens),
+                max_batch_size=ECAPA_MAX_BATCH,
+                max_wait_ms=ECAPA_MAX_WAIT_MS
+            )
+            logger.info(f"✅ マイクロバッチ推論を有効化 (最大{ECAPA_MAX_BATCH}件 / {ECAPA_MAX_WAIT_MS}ms)")
+    return _batcher
+
+def get_embedding_cache():
+    """PCMハッシュをキーにしたembeddingキャッシュを遅延生成"""
+    global _cache
+    with _load_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                os.path.join(ECAPA_SAVEDIR, "embedding_model.ckpt"),
+                max_entries=EMBEDDING_CACHE_SIZE,
+                disk_dir=EMBEDDING_CACHE_DIR if EMBEDDING_CACHE_DISK else None,
+                model_tag=ECAPA_MODE
+            )
+    return _cache
+
+def get_cache_stats():
+    """embeddingキャッシュのヒット/ミス統計"""
+    return get_embedding_cache().stats()
+
+def _to_batch(signal):
+    """ndarray / tensor の波形を (1, samples) の float32 tensor に揃える"""
+    if isinstance(signal, torch.Tensor):
+        tensor = signal.detach().to(torch.float32)
+    else:
+        tensor = torch.from_numpy(np.ascontiguousarray(signal, dtype=np.float32))
+    if tensor.dim() == 1:
+        tensor = tensor.unsqueeze(0)
+    return tensor
+
+def get_embedding_from_signal(signal, cache=True):
+    """
+    16kHz・モノラルの波形（ndarray または tensor）から直接embeddingを取得
+    ファイルの読み書きは行わない
+    ECAPA_MAX_BATCH > 1 の場合はマイクロバッチキュー経由で推論する
+    同じPCMを以前に処理していればキャッシュから返し、モデルは実行しない
+    cache=False ならキャッシュを参照・追加しない（段階的な識別の先頭部分など、再利用されない波形）
+    """
+    if isinstance(signal, torch.Tensor):
+        signal = signal.detach().cpu().numpy()
+    with span("embedding"):
+        if cache:
+            embedding_cache = get_embedding_cache()
+            cache_key = embedding_cache.key_for(signal)
+            embedding_np = embedding_cache.get(cache_key)
+            if embedding_np is not None:
+                logger.debug(f"   - embeddingキャッシュにヒット ({cache_key[:8]})")
+                return embedding_np
+        
+        # ECAPA-TDNNでembeddingを取得
+        if ECAPA_MAX_BATCH > 1:
+            # 同時に届いた他のリクエストとまとめて推論
+            embedding_np = get_batcher().embed(signal)
+        else:
+            embedding = encode(get_ecapa_classifier(), _to_batch(signal))
+            embedding_np = embedding.squeeze().cpu().numpy()
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"   - Embedding形状: {embedding_np.shape}, "
+                         f"範囲: [{np.min(embedding_np):.3f}, {np.max(embedding_np):.3f}]")
+        
+        if cache:
+            embedding_cache.put(cache_key, embedding_np)
+        return embedding_np
+
+def get_embeddings_from_signals(signals, batch_size=None):
+    """
+    複数の波形のembeddingをまとめて取得（一括分類・オフライン評価用）
+    キャッシュにないものだけを長さ順に並べ、batch_size 件ずつパディングして推論する
+    （長さの近い発話同士をまとめるので、パディングの無駄が少ない）
+
+    Returns:
+        list[np.ndarray]: 入力と同じ順の embedding
+    """
+    batch_size = max(1, batch_size or ECAPA_MAX_BATCH)
+    signals = [s.detach().cpu().numpy() if isinstance(s, torch.Tensor) else s for s in signals]
+    cache = get_embedding_cache()
+    keys = [cache.key_for(s) for s in signals]
+    embeddings = [cache.get(key) for key in keys]
+    
+    missing = sorted((i for i, e in enumerate(embeddings) if e is None), key=lambda i: len(signals[i]))
+    if missing:
+        classifier = get_ecapa_classifier()
+        encode_fn = lambda batch, wav_lens: encode(classifier, batch, wav_lens)
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            for i, embedding in zip(chunk, encode_padded(encode_fn, [signals[i] for i in chunk])):
+                embeddings[i] = embedding
+                cache.put(keys[i], embedding)
+    return embeddings
+
+def warmup(seconds=1.0):
+    """
+    ダミー波形で1回推論し、初回推論のメモリ確保や最適化パスを先に済ませる
+    リクエストと同じ経路（マイクロバッチ有効時はキュー経由）で実行し、結果はキャッシュしない
+    """
+    signal = np.random.default_rng(0).standard_normal(int(16000 * seconds)).astype(np.float32) * 0.01
+    if ECAPA_MAX_BATCH > 1:
+        get_batcher().embed(signal)
+    else:
+        encode(get_ecapa_classifier(), _to_batch(signal))
+
+def preload_for_fork(seconds=1.0):
+    """
+    fork する前の親プロセス（gunicorn のマスター）でエンコーダーと話者インデックスを読み込む
+    子プロセスは重み・登録行列のページをコピーオンライトで共有する
+
+    - 子に引き継がれないスレッドを作らないよう、マイクロバッチのキューを使わずに直接ダミー推論する
+    - torch のスレッドプールを起動しないよう、ダミー推論は1スレッドで行う（fork 後のデッドロック対策）
+    - 重みの勾配を切っておき、推論中に重みのページへ書き込まないようにする
+    """
+    classifier = get_ecapa_classifier()
+    mods = getattr(classifier, "mods", None)
+    if isinstance(mods, torch.nn.Module):
+        mods.eval()
+        mods.requires_grad_(False)
+    if os.path.exists(ENROLLMENT_PATH) or os.path.exists(SPEAKER_MODEL_PATH):
+        load_index()
+
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    try:
+        signal = np.random.default_rng(0).standard_normal(int(16000 * seconds)).astype(np.float32) * 0.01
+        encode(classifier, _to_batch(signal))
+    finally:
+        torch.set_num_threads(threads)
+    logger.info("✅ fork 前にエンコーダーと話者インデックスを読み込みました")
+
+def _index_file_stamp():
+    path = ENROLLMENT_PATH if os.path.exists(ENROLLMENT_PATH) else SPEAKER_MODEL_PATH
+    return (path, os.stat(path).st_mtime_ns) if os.path.exists(path) else None
+
+def refresh_index():
+    """
+    読み込んだ後に登録ファイルが更新されていれば話者インデックスを捨てる（次の load_index で読み直す）
+    親プロセスで読み込んだインデックスを、後から fork したワーカーが古いまま使わないようにする
+    """
+    global _index, _models
+    with _load_lock:
+        if _index is not None and _index_file_stamp() != _index_stamp:
+            _index = None
+            _models = None
+            _sources.clear()
+            logger.info("🔄 話者登録ファイルが更新されたため、話者インデックスを読み直します")
+
 def get_embedding(wav_path, sr=16000):
     """
     音声ファイルからECAPA-TDNNのembeddingを取得
     test_ECAPA.pyと同じ方法
     """
-    print(f"🔍 embedding抽出開始: {wav_path}")
+    logger.debug(f"🔍 embedding抽出開始: {wav_path}")
     
     # 音声読み込み
     signal, actual_sr = librosa.load(wav_path, sr=sr)
-    print(f"   - 読み込み: サンプリングレート={actual_sr}Hz, サンプル数={len(signal)}")
-    print(f"   - 長さ: {len(signal)/actual_sr:.2f}秒")
-    print(f"   - RMSレベル: {np.sqrt(np.mean(signal**2)):.6f}")
-    
-    # float32に変換してtorch tensorに
-    signal = signal.astype(np.float32)
-    signal = torch.from_numpy(signal).unsqueeze(0)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"   - 読み込み: サンプリングレート={actual_sr}Hz, サンプル数={len(signal)}, "
+                     f"長さ: {len(signal)/actual_sr:.2f}秒, RMSレベル: {np.sqrt(np.mean(signal**2)):.6f}")
     
-    # ECAPA-TDNNでembeddingを取得
-    classifier = get_ecapa_classifier()
-    embedding = classifier.encode_batch(signal)
-    embedding_np = embedding.squeeze().cpu().numpy()
-    
-    print(f"   - Embedding形状: {embedding_np.shape}")
-    print(f"   - Embedding範囲: [{np.min(embedding_np):.3f}, {np.max(embedding_np):.3f}]")
-    
-    return embedding_np
+    return get_embedding_from_signal(signal)
 
 def cosine_similarity(vec1, vec2):
     """コサイン類似度を計算"""
@@ -55,60 +258,193 @@ def cosine_similarity(vec1, vec2):
 def load_models():
     """話者embeddingモデルを遅延ロード"""
     global _models
-    if _models is None:
-        model_path = "models/ecapa.pkl"
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"モデルファイルが見つかりません: {model_path}")
-        with open(model_path, "rb") as f:
-            _models = pickle.load(f)   # {"parent": embedding_array, "child": embedding_array}
-        print(f"✅ 話者モデルをロード: {list(_models.keys())}")
+    with _load_lock:
+        if _models is None:
+            model_path = SPEAKER_MODEL_PATH
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"モデルファイルが見つかりません: {model_path}")
+            with open(model_path, "rb") as f:
+                _models = pickle.load(f)   # {"parent": embedding_array, "child": embedding_array}
+            logger.info(f"✅ 話者モデルをロード: {list(_models.keys())}")
     return _models
 
+def load_index():
+    """
+    登録話者インデックスを遅延ロード
+    ENROLLMENT_PATH があれば行列をメモリマップのまま使い（コピーしない）、
+    なければ ecapa.pkl（値は1本のembedding、または (n, D) のエグゼンプラー行列）から作る
+    """
+    global _index, _index_stamp
+    if _index is None:
+        if os.path.exists(ENROLLMENT_PATH):
+            with _load_lock:
+                if _index is None:
+                    enrollment = read_enrollment(ENROLLMENT_PATH)
+                    _index = SpeakerIndex.from_matrix(enrollment.matrix, enrollment.speakers, enrollment.counts)
+                    _index_stamp = _index_file_stamp()
+                    sources = enrollment.sources()
+                    _sources.update({
+                        speaker: sources[start:start + count]
+                        for speaker, start, count in zip(
+                            enrollment.speakers, np.cumsum([0] + enrollment.counts[:-1]), enrollment.counts)
+                    })
+                    logger.info(f"✅ 話者登録ファイルをロード: {ENROLLMENT_PATH} "
+                                f"(版 {enrollment.revision}, {_index.speakers()})")
+            return _index
+        models = load_models()
+        with _load_lock:
+            if _index is None:
+                _index = SpeakerIndex.from_dict(models)
+                _index_stamp = _index_file_stamp()
+                logger.info(f"✅ 話者インデックスを構築: {_index.speakers()}")
+    return _index
+
+def save_index(path=SPEAKER_MODEL_PATH):
+    """
+    現在のインデックスを ecapa.pkl 形式で保存（ENROLLMENT_PATH も同じ内容に更新する）
+    エグゼンプラーが1本の話者は従来通り1次元ベクトルで書き出す
+    """
+    global _index_stamp
+    exemplars = load_index().to_dict()
+    models = {
+        speaker: vectors[0] if len(vectors) == 1 else vectors
+        for speaker, vectors in exemplars.items()
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(models, f)
+    os.replace(tmp_path, path)
+    if os.path.exists(ENROLLMENT_PATH):
+        write_enrollment(ENROLLMENT_PATH, exemplars, sources=_sources,
+                         encoder=get_embedding_cache().stats()["fingerprint"])
+    _index_stamp = _index_file_stamp()
+    logger.info(f"💾 話者モデルを保存: {path}")
+
+def enroll_speaker(speaker, embeddings, save=True):
+    """話者のembeddingを追加登録（再起動不要）"""
+    index = load_index()
+    before = index.speakers().get(speaker, 0)
+    index.add(speaker, embeddings)
+    # API から登録したエグゼンプラーには元ファイルがない
+    _sources[speaker] = list(_sources.get(speaker, [None] * before)) + [None] * (index.speakers()[speaker] - before)
+    logger.info(f"➕ 話者を登録: {speaker} ({index.speakers()[speaker]}件)")
+    if save:
+        save_index()
+    return index.speakers()
+
+def remove_speaker(speaker, save=True):
+    """話者を登録解除（再起動不要）"""
+    index = load_index()
+    index.remove(speaker)
+    _sources.pop(speaker, None)
+    logger.info(f"➖ 話者を削除: {speaker}")
+    if save:
+        save_index()
+    return index.speakers()
+
+def identify_signal(signal, embed=None):
+    """
+    16kHz・モノラルの波形（ndarray または tensor）から話者を識別
+    アップロード音声をメモリ上で処理する際のエントリポイント
+    embed: 波形 → embedding（既定は get_embedding_from_signal。推論プールで計算する場合に差し替える）
+    """
+    logger.debug(f"🎯 話者識別開始: {len(signal)/16000:.2f}秒の波形")
+    
+    # テスト音声のembeddingを取得
+    test_embedding = (embed or get_embedding_from_signal)(signal)
+    return _score_embedding(test_embedding)
+
+def identify_progressive(signal, prefixes=None, min_confidence=None, min_margin=None,
+                         embed=None, sr=16000):
+    """
+    発話の先頭から長さを伸ばしながら識別し、判定がはっきりした時点で打ち切る
+
+    prefixes 秒ごとの先頭（全体の PROGRESSIVE_MAX_FRACTION 以下のもの）→ 全体 の順に embedding を計算し、
+    1位の確信度が min_confidence 以上かつ2位とのコサイン類似度の差が min_margin 以上になったら終了する
+    （話者が2人なら確信度は差だけで決まるが、3人以上では1位と2位が離れていても他の話者に確率が分散する）
+
+    Args:
+        signal: 16kHz・モノラルの波形
+        embed: (波形, cache=bool) → embedding（既定は get_embedding_from_signal）
+               先頭部分は cache=False で呼ぶ（embeddingキャッシュを再利用されない波形で埋めない）
+
+    Returns:
+        (予測話者, 確信度dict, 判定に使った秒数)
+    """
+    prefixes = PROGRESSIVE_PREFIXES if prefixes is None else prefixes
+    min_confidence = PROGRESSIVE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_margin = PROGRESSIVE_MIN_MARGIN if min_margin is None else min_margin
+    embed = embed or get_embedding_from_signal
+    if isinstance(signal, torch.Tensor):
+        signal = signal.detach().cpu().numpy()
+
+    limit = len(signal) * PROGRESSIVE_MAX_FRACTION
+    lengths = sorted({int(p * sr) for p in prefixes if 0 < int(p * sr) <= limit})
+    for length in lengths + [len(signal)]:
+        best_speaker, probs, scores, _ = score_embedding(embed(signal[:length], cache=length == len(signal)))
+        ranked = sorted(scores.values(), reverse=True)
+        margin = ranked[0] - ranked[1] if len(ranked) > 1 else ranked[0]
+        if length == len(signal):
+            PROGRESSIVE_EXITS.inc(at="full")
+            break
+        if probs[best_speaker] >= min_confidence and margin >= min_margin:
+            PROGRESSIVE_EXITS.inc(at=f"{length / sr:g}")
+            break
+    
+    logger.debug(f"⏩ 段階的な識別: {best_speaker} ({length/sr:.2f}秒 / {len(signal)/sr:.2f}秒, "
+                 f"確信度 {probs[best_speaker]:.3f}, 差 {margin:.3f})")
+    return best_speaker, probs, length / sr
+
 def identify(wav_path):
     """
     音声ファイルから話者を識別
     test_ECAPA.pyと同じロジック
     """
-    print(f"\n{'='*60}")
-    print(f"🎯 話者識別開始: {wav_path}")
-    
-    # 登録済み話者embeddingをロード
-    models = load_models()
-    print(f"📚 登録話者: {list(models.keys())}")
+    logger.debug(f"🎯 話者識別開始: {wav_path}")
     
     # テスト音声のembeddingを取得
     test_embedding = get_embedding(wav_path)
+    return _score_embedding(test_embedding)
+
+def score_embedding(test_embedding):
+    """
+    embeddingを登録話者と比較（ログ出力なし）
+
+    Returns:
+        (予測話者, 確信度dict, 類似度dict, 上位エグゼンプラー)
+    """
+    with span("scoring"):
+        # 全エグゼンプラーとの類似度を1回の行列積で計算し、話者ごとに集約
+        scores, top = load_index().score(test_embedding, aggregate=SCORE_AGGREGATE)
+        
+        # 最も類似度が高い話者を選択
+        best_speaker = max(scores, key=scores.get)
+        
+        # softmaxで確信度に変換（float型に変換してJSON互換にする）
+        exp_scores = np.exp(list(scores.values()))
+        probs_array = exp_scores / np.sum(exp_scores)
+        probs = {k: float(v) for k, v in zip(scores.keys(), probs_array)}
+    return best_speaker, probs, scores, top
+
+def _score_embedding(test_embedding):
+    """embeddingを登録話者と比較し、(予測話者, 確信度dict) を返す"""
+    best_speaker, probs, scores, top = score_embedding(test_embedding)
     
-    # 各話者embeddingとの類似度を計算
-    scores = {}
-    print(f"\n📊 類似度計算:")
-    for speaker, model_embedding in models.items():
-        similarity = cosine_similarity(test_embedding, model_embedding)
-        scores[speaker] = similarity
-        print(f"   {speaker}: コサイン類似度 = {similarity:.6f}")
-    
-    # 最も類似度が高い話者を選択
-    best_speaker = max(scores, key=scores.get)
-    
-    # softmaxで確信度に変換
-    print(f"\n🔢 確信度計算 (softmax):")
-    exp_scores = np.exp(list(scores.values()))
-    probs_array = exp_scores / np.sum(exp_scores)
-    probs = dict(zip(scores.keys(), probs_array))
-    
-    # float型に変換（JSON互換性）
-    probs = {k: float(v) for k, v in probs.items()}
-    
-    print(f"   確信度: {probs}")
-    
-    print(f"\n✅ 識別結果:")
-    print(f"   予測: {best_speaker}")
-    print(f"   確信度: {probs[best_speaker]*100:.2f}%")
-    print(f"{'='*60}\n")
+    # 詳細はDEBUGレベルのときだけ組み立てる
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📚 登録話者: {load_index().speakers()}")
+        logger.debug(f"📊 類似度計算 ({SCORE_AGGREGATE}):")
+        for speaker, similarity in scores.items():
+            logger.debug(f"   {speaker}: コサイン類似度 = {similarity:.6f}")
+        logger.debug(f"   上位エグゼンプラー: {[(s, round(v, 4)) for s, v in top]}")
+        logger.debug(f"🔢 確信度 (softmax): {probs}")
+        logger.debug(f"✅ 識別結果: {best_speaker} ({probs[best_speaker]*100:.2f}%)")
     
     return best_speaker, probs
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG").upper(), format="%(message)s")
+    
     # テスト用: 未知の音声ファイルを指定
     test_files = [
         "data/test/child2_b01.wav",
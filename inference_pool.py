@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+CPU負荷の高い処理（音声デコード・embedding推論）を別プロセスで実行するプール
+
+- リクエストのスレッドは結果を待つだけで GIL を持たないため、重い発話があっても他のクライアントの処理は止まらない
+- 実行中 + 待ちの件数が max_pending に達していたら、キューに積まずにすぐ Overloaded を送出する（app.py は 503）
+- 段階ごとのタイムアウトを超えたら StageTimeout を送出する
+  実行中の処理は止められないため、そのまま終わらせて結果を捨てる（終わるまで枠は空かない）
+- fork はスレッドが1本だけのプロセスからしか行わない（他のスレッドが持っていたロックを子が引き継がないように）
+  app.py は fork するプールを他のスレッドを起動する前に start() する。ワーカーの異常終了後に作り直すときなど、
+  すでにスレッドがある場合は spawn に切り替えてワーカー側でエンコーダーを読み込む
+
+    pool = InferencePool(workers=2, max_pending=8)
+    signal, voiced, removed = pool.run("decode", decode_job, data, False, True, 2, 5.0, timeout=10)
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from metrics import REGISTRY, span
+
+logger = logging.getLogger(__name__)
+
+POOL_REJECTED = REGISTRY.counter(
+    "smartspeaker_pool_rejected_total", "推論プールが満杯で受け付けなかった件数", ("stage",))
+POOL_TIMEOUTS = REGISTRY.counter(
+    "smartspeaker_pool_timeouts_total", "推論プールの処理がタイムアウトした件数", ("stage",))
+
+
+class Overloaded(Exception):
+    """推論プールの実行中・待ちの件数が上限に達している"""
+
+
+class StageTimeout(Exception):
+    """処理段階がタイムアウトした"""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} が {timeout}秒以内に終わりませんでした")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def _exit_with_parent(parent):
+    """親プロセス（gunicorn のワーカー）が強制終了されたら、このプロセスも終了する"""
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(0)
+
+
+def _init_worker(threads, preload):
+    """
+    ワーカープロセスの初期化（プロセス数 × スレッド数がCPU数を超えないように絞る）
+    preload なら ECAPA-TDNN をロードしてダミー推論まで済ませる（失敗してもデコードには使えるようにする）
+    """
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), name="parent-watch", daemon=True).start()
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    if preload:
+        try:
+            import identify
+            identify.ECAPA_MAX_BATCH = 1
+            identify.get_ecapa_classifier()
+            identify.warmup()
+        except Exception as e:
+            logger.warning(f"⚠️  推論ワーカーでエンコーダーを準備できません: {e}")
+
+
+def _ping():
+    return os.getpid()
+
+
+def decode_job(data, pcm16, vad, aggressiveness, max_seconds):
+    """
+    音声バイト列をデコードしてVADをかける（ワーカー内で実行）
+
+    Returns:
+        (signal, voiced, vad_removed_sec)。VADなしの場合 voiced は signal を max_seconds で切り詰めたもの、
+        vad_removed_sec は None
+    """
+    from audio_io import cap_seconds, decode_audio, decode_pcm16, trim_silence, TARGET_SR
+    signal = decode_pcm16(data) if pcm16 else decode_audio(data, sr=TARGET_SR)
+    signal = np.array(signal, dtype=np.float32)
+    if not vad or not len(signal):
+        return signal, cap_seconds(signal, TARGET_SR, max_seconds), None
+    voiced, removed = trim_silence(signal, TARGET_SR, aggressiveness=aggressiveness, max_seconds=max_seconds)
+    return signal, voiced, removed
+
+
+def decode_items_job(items, vad, aggressiveness, max_seconds):
+    """一括分類の項目をまとめてデコード（ワーカー内で実行）"""
+    from batch_classify import decode_items
+    return decode_items(items, vad, aggressiveness, max_seconds)
+
+
+def embed_batch_job(signals):
+    """複数の波形の embedding をまとめて計算（ワーカー内で実行）"""
+    import identify
+    return identify.get_embeddings_from_signals(signals)
+
+
+def embed_job(signal, cache=True):
+    """ECAPA-TDNN の embedding を計算（ワーカー内で実行）"""
+    import identify
+    # ワーカー内では1件ずつ直接推論する（マイクロバッチの待ち時間は不要）
+    identify.ECAPA_MAX_BATCH = 1
+    return identify.get_embedding_from_signal(signal, cache=cache)
+
+
+class InferencePool:
+    """件数上限とタイムアウト付きのプロセスプール"""
+
+    def __init__(self, workers=2, max_pending=8, start_method="spawn", threads=None, preload=False):
+        """
+        Args:
+            workers: ワーカープロセス数
+            max_pending: 実行中 + 待ちの上限（workers 以上）
+            start_method: multiprocessing の開始方式（スレッドを持つプロセスから作るため既定は spawn。
+                          親でエンコーダーを読み込み済みなら fork で重みのページを共有する）
+            threads: ワーカーごとの torch のスレッド数（None で CPU数 / workers）
+            preload: ワーカーの起動時に ECAPA-TDNN をロードする
+        """
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.start_method = start_method
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.preload = preload
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.start_method == "fork" and threading.active_count() > 1:
+                    logger.warning("⚠️  スレッドを起動済みのプロセスからは fork しないため、推論プールを spawn で起動します")
+                    self.start_method = "spawn"
+                    self.preload = True
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self.threads, self.preload)
+                )
+                logger.info(f"✅ 推論プールを起動: {self.workers}プロセス "
+                            f"(上限 {self.max_pending}件, {self.threads}スレッド/プロセス)")
+            return self._executor
+
+    def start(self):
+        """全ワーカーを起動して初期化が終わるまで待つ（起動時のウォームアップ用）"""
+        executor = self._get_executor()
+        pids = {future.result() for future in [executor.submit(_ping) for _ in range(self.workers)]}
+        logger.info(f"✅ 推論ワーカーの準備完了: {len(pids)}プロセス")
+        return self
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, stage, fn, *args):
+        """空きがあれば投入して Future を返す（満杯なら Overloaded）"""
+        if not self._slots.acquire(blocking=False):
+            POOL_REJECTED.inc(stage=stage)
+            raise Overloaded(f"推論プールが混雑しています（{self.max_pending}件処理中）")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, stage, fn, *args, timeout=None):
+        """
+        fn(*args) をワーカーで実行して結果を待つ（stage の所要時間として記録）
+
+        Raises:
+            Overloaded: 空きがない
+            StageTimeout: timeout 秒以内に終わらなかった
+        """
+        with span(stage):
+            future = self.submit(stage, fn, *args)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                POOL_TIMEOUTS.inc(stage=stage)
+                raise StageTimeout(stage, timeout)
+            except BrokenProcessPool:
+                # ワーカーが異常終了した場合はプールを作り直す
+                logger.error("❌ 推論プールのワーカーが異常終了しました。プールを作り直します")
+                self._reset()
+                raise
+
+    def full(self):
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "start_method": self.start_method,
+                "started": self._executor is not None
+            }
+
+    def shutdown(self):
+        self._reset()
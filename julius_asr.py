@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+サーバー側の音声認識（Julius モジュールモード）
+
+Julius を1つの常駐プロセスとして起動しておき、リクエストごとに
+16kHz の波形を adinnet で送って認識結果を受け取る
+（発話ごとに音響モデルを読み込み直さない）
+プロセスが落ちていた場合は次の認識時に自動で再起動する
+
+Julius は1プロセスで1発話ずつしか認識できないため、認識は1本のスレッドで順番に行い、
+実行中 + 待ちの件数が JULIUS_QUEUE に達していたらキューに積まずに AsrBusy を送出する
+（呼び出し側はブラウザのテキストで応答を続ける）
+ポートは既定ではプロセスごとに空いているものを選ぶ（gunicorn のワーカーごとに Julius が1つ）
+
+    Julius  ←(adinnet: 長さ + PCM16)─  JuliusEngine.recognize()
+            ─(module: <RECOGOUT>...)→
+"""
+
+import atexit
+import logging
+import os
+import re
+import socket
+import struct
+import subprocess
+import threading
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import REGISTRY, span
+
+logger = logging.getLogger(__name__)
+
+# Julius の設定（JULIUS_ENABLED=1 でサーバー側の音声認識を有効化）
+JULIUS_ENABLED = os.environ.get("JULIUS_ENABLED", "0") == "1"
+JULIUS_CMD = os.environ.get("JULIUS_CMD", "julius")
+JULIUS_JCONF = os.environ.get("JULIUS_JCONF", "asr/grammar-mic.jconf")
+# 0 なら起動のたびに空いているポートを選ぶ（固定する場合は、同時に起動するプロセスごとに別の値にする）
+JULIUS_MODULE_PORT = int(os.environ.get("JULIUS_MODULE_PORT", "0"))
+JULIUS_ADIN_PORT = int(os.environ.get("JULIUS_ADIN_PORT", "0"))
+JULIUS_TIMEOUT = float(os.environ.get("JULIUS_TIMEOUT", "10"))
+# 認識の実行中 + 待ちの上限
+JULIUS_QUEUE = int(os.environ.get("JULIUS_QUEUE", "2"))
+
+ASR_REJECTED = REGISTRY.counter(
+    "smartspeaker_asr_rejected_total", "音声認識が混み合っていて受け付けなかった件数")
+
+_WHYPO_RE = re.compile(r'<WHYPO ([^>]*)/>')
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+_SCORE_RE = re.compile(r'<SHYPO RANK="1" SCORE="([-\d.]+)"')
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class AsrBusy(Exception):
+    """音声認識の実行中・待ちの件数が上限に達している"""
+
+
+def _free_port(host):
+    """空いているポート番号（閉じてから Julius が開くまでに取られた場合は起動に失敗し、次の認識時に選び直す）"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def parse_recogout(message):
+    """
+    <RECOGOUT> メッセージから第1候補を取り出す
+
+    Returns:
+        dict: {"text": 連結した単語, "words": [単語...], "confidence": [CM...], "score": スコア}
+    """
+    first = message.split("</SHYPO>", 1)[0]
+    words, confidence = [], []
+    for attrs in _WHYPO_RE.findall(first):
+        attrs = dict(_ATTR_RE.findall(attrs))
+        # 無音（silB / silE）は WORD が空
+        if attrs.get("WORD"):
+            words.append(attrs["WORD"])
+            confidence.append(float(attrs["CM"]) if "CM" in attrs else None)
+    score = _SCORE_RE.search(first)
+    return {
+        "text": "".join(words),
+        "words": words,
+        "confidence": confidence,
+        "score": float(score.group(1)) if score else None
+    }
+
+
+class JuliusEngine:
+    """
+    常駐させた Julius プロセスへの接続
+
+    - start() で julius -module -input adinnet を起動し、2つのポートに接続する
+      （ポートが 0 なら起動のたびに空いているポートを選ぶ）
+    - recognize() は1発話ずつ（ロックで直列化）送信し、結果を待つ
+    - submit() は件数上限付きで認識を1本のスレッドに積む。期限を過ぎた認識は始めずに捨てる
+    - 通信に失敗したらプロセスを再起動して1回だけやり直す
+      （呼び出し側の期限切れでは再起動せず、受け取らなかった結果は次の認識の前に読み捨てる）
+    """
+
+    def __init__(self, jconf=JULIUS_JCONF, cmd=JULIUS_CMD, host="127.0.0.1",
+                 module_port=JULIUS_MODULE_PORT, adin_port=JULIUS_ADIN_PORT,
+                 timeout=JULIUS_TIMEOUT, max_pending=JULIUS_QUEUE):
+        self.jconf = jconf
+        self.cmd = cmd
+        self.host = host
+        self.module_port = module_port
+        self.adin_port = adin_port
+        self.timeout = timeout
+        self.max_pending = max(1, max_pending)
+        self.restarts = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._started = False
+        self._proc = None
+        self._module = None
+        self._adin = None
+        self._messages = queue.Queue()
+        # 送った発話の認識結果をまだ受け取っていない（呼び出し側の期限切れなら次の認識の前に読み捨てる）
+        self._pending = False
+        self._lock = threading.RLock()
+
+    def _connect(self, port, deadline):
+        """Julius がポートを開くまで接続を試みる"""
+        while True:
+            if self._proc is not None and self._proc.poll() is not None:
+                raise RuntimeError(f"Julius が終了しました (終了コード {self._proc.returncode})")
+            try:
+                return socket.create_connection((self.host, port), timeout=self.timeout)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Julius に接続できません: {self.host}:{port}")
+                time.sleep(0.1)
+
+    def start(self):
+        """Julius を起動して接続（起動済みなら何もしない）"""
+        # 起動時の立ち上げと最初の認識が同時に起動しないよう recognize() と同じロックを取る
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self.is_alive():
+            return
+        self._shutdown()
+        if self._started:
+            self.restarts += 1
+            logger.warning("🔁 Julius を再起動します")
+        self._started = True
+        module_port = self.module_port or _free_port(self.host)
+        adin_port = self.adin_port or _free_port(self.host)
+        cmd = [
+            self.cmd, '-C', self.jconf,
+            '-input', 'adinnet', '-adport', str(adin_port), '-nocutsilence',
+            '-module', str(module_port)
+        ]
+        logger.info(f"🔄 Julius を起動中... ({' '.join(cmd)})")
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.timeout
+        # モジュール接続 → 音声入力(adinnet)接続 の順で待ち受けが始まる
+        self._module = self._connect(module_port, deadline)
+        self._module.settimeout(None)
+        self._messages = queue.Queue()
+        threading.Thread(target=self._read_messages, args=(self._module, self._messages),
+                         name="julius-module", daemon=True).start()
+        self._adin = self._connect(adin_port, deadline)
+        logger.info(f"✅ Julius 起動完了 (pid {self._proc.pid})")
+
+    def is_alive(self):
+        return (self._proc is not None and self._proc.poll() is None
+                and self._module is not None and self._adin is not None)
+
+    def _read_messages(self, sock, messages):
+        """モジュール出力を "." の行で区切ってキューに積む"""
+        buffer = b""
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                while b"\n.\n" in buffer:
+                    message, buffer = buffer.split(b"\n.\n", 1)
+                    messages.put(message.decode("utf-8", "replace"))
+        except OSError:
+            pass
+        messages.put(None)   # 切断
+
+    def _send_audio(self, signal):
+        """float32 波形を PCM16 にして adinnet で送り、終端（長さ0）を送る"""
+        pcm = (np.clip(np.asarray(signal, dtype=np.float32), -1.0, 1.0) * 32767).astype('<i2').tobytes()
+        chunk = 32000   # 1秒分
+        for offset in range(0, len(pcm), chunk):
+            data = pcm[offset:offset + chunk]
+            self._adin.sendall(struct.pack('<i', len(data)) + data)
+        self._adin.sendall(struct.pack('<i', 0))
+
+    def _wait_result(self, deadline):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Julius の認識結果がタイムアウトしました")
+            try:
+                message = self._messages.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if message is None:
+                raise ConnectionError("Julius との接続が切れました")
+            if "<RECOGOUT>" in message:
+                return parse_recogout(message)
+            if "<RECOGFAIL" in message or "<REJECTED" in message:
+                return {"text": "", "words": [], "confidence": [], "score": None}
+
+    def _result_deadline(self, deadline):
+        """Julius 自体の応答の期限（self.timeout）と呼び出し側の期限の早い方"""
+        result_deadline = time.monotonic() + self.timeout
+        return result_deadline if deadline is None else min(deadline, result_deadline)
+
+    def recognize(self, signal, deadline=None):
+        """
+        16kHz・モノラルの波形を認識
+
+        Args:
+            deadline: time.monotonic() の期限。前の認識の終わりを待つ間、または結果を待つ間に過ぎたら TimeoutError
+                （Julius は止めずに、届かなかった結果は次の認識の前に読み捨てる）
+
+        Returns:
+            dict: parse_recogout() の結果
+        """
+        if deadline is None:
+            self._lock.acquire()
+        elif not self._lock.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise TimeoutError("Julius の認識待ちがタイムアウトしました")
+        try:
+            with span("asr"):
+                for attempt in range(2):
+                    try:
+                        self.start()
+                        if self._pending:
+                            # 前の発話の結果が遅れて届くのを待って捨てる
+                            self._wait_result(self._result_deadline(deadline))
+                            self._pending = False
+                        # 前の発話の残りのメッセージは捨てる
+                        while not self._messages.empty():
+                            if self._messages.get_nowait() is None:
+                                raise ConnectionError("Julius との接続が切れました")
+                        self._send_audio(signal)
+                        self._pending = True
+                        result = self._wait_result(self._result_deadline(deadline))
+                        self._pending = False
+                        return result
+                    except (OSError, ConnectionError, RuntimeError, TimeoutError) as e:
+                        if (isinstance(e, TimeoutError) and self._pending and self.is_alive()
+                                and deadline is not None and time.monotonic() >= deadline):
+                            # 送った発話の結果を待つ間に呼び出し側の期限が来ただけで、Julius は動いている
+                            # （再起動もやり直しもしない）
+                            raise TimeoutError("Julius の認識結果を期限までに受け取れませんでした") from e
+                        logger.warning(f"⚠️  Julius エラー: {e}")
+                        self._shutdown()
+                        if attempt or (deadline is not None and time.monotonic() >= deadline):
+                            raise
+        finally:
+            self._lock.release()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr")
+            return self._executor
+
+    def start_background(self):
+        """最初の発話を待たせないよう、バックグラウンドで起動しておく"""
+        def start():
+            try:
+                self.start()
+            except Exception as e:
+                logger.warning(f"⚠️  Julius を起動できません（次の認識時に再試行します）: {e}")
+        self._get_executor().submit(start)
+
+    def submit(self, signal, timeout):
+        """
+        認識を順番待ちに積む
+
+        Args:
+            timeout: 呼び出し側が結果を待つ秒数（過ぎたら始まっていない認識は捨て、実行中の認識も打ち切る）
+
+        Returns:
+            Future: recognize() の結果
+
+        Raises:
+            AsrBusy: 実行中 + 待ちの件数が上限に達している
+        """
+        if not self._slots.acquire(blocking=False):
+            ASR_REJECTED.inc()
+            raise AsrBusy(f"音声認識の実行中・待ちが上限 ({self.max_pending}) に達しています")
+        try:
+            future = self._get_executor().submit(self.recognize, signal, time.monotonic() + timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _shutdown(self):
+        for sock in (self._adin, self._module):
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+        self._adin = self._module = None
+        self._pending = False
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._proc = None
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._shutdown()
+
+
+def get_asr():
+    """Julius エンジンを遅延生成（最初の認識時に起動）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = JuliusEngine()
+            atexit.register(_engine.close)
+    return _engine
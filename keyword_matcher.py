@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+複数キーワードの一括検索（Aho–Corasick法）
+登録したキーワードをオートマトンにまとめ、発話を1回走査するだけで
+含まれているキーワードをすべて見つける（キーワード数が増えても走査コストは発話の長さに比例）
+"""
+
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    キーワード → 値 の対応を登録し、文字列中に現れたキーワードの値を集める
+
+    使い方:
+        matcher = KeywordMatcher()
+        matcher.add("テレビ", "device:tv")
+        matcher.add("つけ", "verb:on")
+        matcher.build()
+        matcher.find("テレビをつけて")  # → {"device:tv", "verb:on"}
+    """
+
+    def __init__(self):
+        self._goto = [{}]      # 状態ごとの遷移（文字 → 次の状態）
+        self._fail = [0]       # 失敗時の遷移先
+        self._values = [set()]  # 状態で終わるキーワードの値
+        self._out = None        # 状態に到達した時点で見つかっている値（build() で計算）
+
+    def add(self, keyword, value):
+        """キーワードを登録（同じキーワードに複数の値を登録してもよい）"""
+        if not keyword:
+            raise ValueError("空のキーワードは登録できません")
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._values.append(set())
+            state = nxt
+        self._values[state].add(value)
+        self._out = None
+
+    def build(self):
+        """失敗遷移を幅優先で計算し、各状態の出力をまとめる"""
+        out = [set(values) for values in self._values]
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                out[nxt] |= out[self._fail[nxt]]
+                queue.append(nxt)
+        self._out = [frozenset(values) for values in out]
+        return self
+
+    def find(self, text):
+        """text に含まれるキーワードの値の集合"""
+        if self._out is None:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
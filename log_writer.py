@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+会話ログの非同期書き込みモジュール
+リクエスト処理スレッドはキューに積むだけで、バックグラウンドスレッドが
+まとめてJSON Lines形式のセグメントファイルに追記する
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+def _to_json(obj):
+    """json.dumps の default: numpy型をPython標準型に変換"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"JSONに変換できない型です: {type(obj).__name__}")
+
+
+class JsonlLogWriter:
+    """
+    ログエントリーを logs/conversation_YYYYMMDD_HHMMSS.jsonl に1行ずつ追記する
+
+    - write() はキューに積むだけで即座に戻る
+    - 最大 batch_size 件、または flush_interval 秒ごとにまとめて書き込み・flush
+    - セグメントが max_bytes を超えるか max_age 秒経過したら新しいファイルに切り替え
+    - on_batch を指定すると、書き込んだバッチをそのまま渡す（履歴DBへの追記など）
+    """
+
+    def __init__(self, log_dir, max_bytes=10 * 1024 * 1024, max_age=24 * 3600,
+                 batch_size=100, flush_interval=1.0, on_batch=None):
+        self.log_dir = log_dir
+        self.on_batch = on_batch
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue()
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="jsonl-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def current_path(self):
+        """書き込み中のセグメントファイル"""
+        return self._path
+
+    def write(self, entry):
+        """ログエントリーを書き込みキューに積む（ブロックしない）"""
+        if self._closed:
+            self.dropped += 1
+            return
+        self._queue.put(entry)
+
+    def close(self, timeout=5.0):
+        """キューに残ったエントリーを書き切ってから停止"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._rotate_if_needed()
+                continue
+            batch = []
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            # まとめて取り出せる分を取り出す
+            while len(batch) < self.batch_size and not stop:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+            if batch:
+                self._write_batch(batch)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, batch):
+        lines = []
+        entries = []
+        for entry in batch:
+            try:
+                lines.append(json.dumps(entry, ensure_ascii=False, default=_to_json))
+                entries.append(entry)
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"❌ ログ変換エラー: {e}")
+        if not lines:
+            return
+        with span("log_write"):
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(entries)
+                except Exception as e:
+                    logger.error(f"❌ ログ連携エラー: {e}")
+            try:
+                self._rotate_if_needed()
+                if self._file is None:
+                    self._open_segment()
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                self.written += len(lines)
+            except Exception as e:
+                self.dropped += len(lines)
+                logger.error(f"❌ ログ保存エラー: {e}")
+
+    def _open_segment(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.log_dir, f"conversation_{timestamp}.jsonl")
+        # 同じ秒にローテーションした場合（複数ワーカーが同時に開いた場合も）は連番を付ける
+        seq = 1
+        while True:
+            try:
+                self._file = open(path, "x", encoding="utf-8")
+                break
+            except FileExistsError:
+                path = os.path.join(self.log_dir, f"conversation_{timestamp}_{seq}.jsonl")
+                seq += 1
+        self._path = path
+        self._opened_at = time.monotonic()
+        logger.info(f"📝 ログセグメントを開始: {path}")
+
+    def _rotate_if_needed(self):
+        if self._file is None:
+            return
+        too_big = self._file.tell() >= self.max_bytes
+        too_old = time.monotonic() - self._opened_at >= self.max_age
+        if too_big or too_old:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+ワーカープロセスごとのメモリ使用量（固有メモリ）の確認ツール
+
+/proc/<pid>/smaps_rollup から次の値を読む（Linux のみ）
+- RSS: 物理メモリに載っているページの合計（他のプロセスと共有しているページも含む）
+- PSS: 共有ページを共有しているプロセス数で割って足した値（全プロセスの合計が実際の使用量）
+- USS: そのプロセスだけが使っているページ（ワーカーを1つ増やすと増えるメモリ）
+
+使い方:
+    python3 memory_report.py --pid <gunicornのマスターのPID>   # 起動中のサーバーのプロセスツリー
+    python3 memory_report.py --simulate 4                       # 親でモデルを読み込んでから fork する場合と、
+                                                                # 各ワーカーが読み込む場合の比較
+    python3 memory_report.py --simulate 2 --mode preload --check   # 各ワーカーがエンコーダーの重みを共有しているか確認
+                                                                   # （満たさなければ終了コード 1）
+
+--simulate は gunicorn.conf.py のフック（on_starting → fork → post_fork）を gunicorn と同じ順に呼ぶ
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import time
+
+import numpy as np
+
+MB = 1024 * 1024
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+
+class _Server:
+    """gunicorn.conf.py のフックに渡す Arbiter の代わり（log だけを使う）"""
+    log = logging.getLogger("gunicorn.error")
+
+
+def process_memory(pid="self"):
+    """
+    プロセスのメモリ使用量（バイト）
+
+    Returns:
+        dict: {"rss", "pss", "uss", "shared", "swap"}（/proc が読めない場合は None）
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "swap": fields.get("Swap", 0)
+    }
+
+
+def _parent_pid(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        # comm は空白や括弧を含みうるので最後の ")" より後ろを読む
+        return int(f.read().rsplit(")", 1)[1].split()[1])
+
+
+def _command(pid):
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\x00", b" ").decode(errors="replace").strip()
+
+
+def process_tree(root):
+    """
+    root とその子孫のプロセス
+
+    Returns:
+        list: [(pid, 深さ, コマンドライン)]（親 → 子の順）
+    """
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            children.setdefault(_parent_pid(name), []).append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue  # 列挙中に終了したプロセス
+
+    tree = []
+    stack = [(int(root), 0)]
+    while stack:
+        pid, depth = stack.pop()
+        try:
+            tree.append((pid, depth, _command(pid)))
+        except OSError:
+            continue
+        stack.extend((child, depth + 1) for child in sorted(children.get(pid, []), reverse=True))
+    return tree
+
+
+def print_table(rows):
+    """rows: [(名前, process_memory の結果)]"""
+    print(f"\n{'プロセス':<48} {'RSS MB':>9} {'PSS MB':>9} {'USS MB':>9} {'共有 MB':>9}")
+    for name, mem in rows:
+        if mem is None:
+            print(f"{name[:48]:<48} {'-':>9} {'-':>9} {'-':>9} {'-':>9}")
+            continue
+        print(f"{name[:48]:<48} {mem['rss']/MB:>9.1f} {mem['pss']/MB:>9.1f} "
+              f"{mem['uss']/MB:>9.1f} {mem['shared']/MB:>9.1f}")
+
+
+def report(root):
+    """起動中のプロセスツリーのメモリ使用量を表示"""
+    rows = [(f"{'  ' * depth}{pid} {command}", process_memory(pid)) for pid, depth, command in process_tree(root)]
+    print_table(rows)
+    measured = [mem for _, mem in rows if mem is not None]
+    workers = [mem for (name, mem) in rows[1:] if mem is not None]
+    print(f"\n{'='*60}")
+    print(f"📊 {len(rows)}プロセス: PSS 合計 {sum(m['pss'] for m in measured)/MB:.1f}MB "
+          f"(RSS 合計 {sum(m['rss'] for m in measured)/MB:.1f}MB)")
+    if workers:
+        print(f"   子プロセスの USS: 平均 {np.mean([m['uss'] for m in workers])/MB:.1f}MB / "
+              f"最大 {max(m['uss'] for m in workers)/MB:.1f}MB")
+    print(f"{'='*60}")
+
+
+def _worker(ready, release, seconds, repeat):
+    """fork した子プロセス: エンコーダーと話者インデックスを用意して推論し、親が計測し終わるまで待つ"""
+    import torch
+    import identify
+    from encoder_modes import encode
+    torch.set_num_threads(1)
+    classifier = identify.get_ecapa_classifier()
+    if os.path.exists(identify.ENROLLMENT_PATH) or os.path.exists(identify.SPEAKER_MODEL_PATH):
+        identify.load_index()
+    signal = np.random.default_rng(os.getpid()).standard_normal(int(16000 * seconds)).astype(np.float32) * 0.01
+    for _ in range(repeat):
+        embedding = encode(classifier, identify._to_batch(signal)).squeeze().cpu().numpy()
+        if identify._index is not None:
+            identify.score_embedding(embedding)
+    os.write(ready, b"1")
+    os.read(release, 1)
+
+
+def load_gunicorn_config(preload):
+    """gunicorn.conf.py を PRELOAD_MODEL を指定して読み込む（gunicorn がなくてもフックを呼べる）"""
+    os.environ["PRELOAD_MODEL"] = "1" if preload else "0"
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", GUNICORN_CONF)
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    return conf
+
+
+def model_bytes():
+    """このプロセスで読み込み済みのエンコーダーの重み・バッファの合計バイト数（未読み込みなら 0）"""
+    import torch
+    import identify
+    mods = getattr(identify._classifier, "mods", None)
+    if not isinstance(mods, torch.nn.Module):
+        return 0
+    return sum(t.numel() * t.element_size() for t in list(mods.parameters()) + list(mods.buffers()))
+
+
+def simulate(workers, preload, seconds=3.0, repeat=3):
+    """
+    workers 個の子プロセスを fork して推論させ、子プロセスごとのメモリ使用量を計測
+
+    Args:
+        preload: True なら親でエンコーダー・話者インデックスを読み込んでから fork する
+                 （gunicorn.conf.py の PRELOAD_MODEL=1 と同じ）
+
+    Returns:
+        (親の使用量, [子の使用量], 所要時間)
+    """
+    conf = load_gunicorn_config(preload)
+    start = time.perf_counter()
+    conf.on_starting(_Server())
+
+    ready_r, ready_w = os.pipe()
+    release_r, release_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(ready_r)
+                os.close(release_w)
+                conf.post_fork(_Server(), None)
+                _worker(ready_w, release_r, seconds, repeat)
+            except BaseException:
+                logging.exception("❌ 子プロセスでエラー")
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    os.close(ready_w)
+    os.close(release_r)
+
+    try:
+        for _ in pids:
+            if not os.read(ready_r, 1):
+                raise RuntimeError("子プロセスが推論前に終了しました")
+        elapsed = time.perf_counter() - start
+        parent = process_memory()
+        children = [process_memory(pid) for pid in pids]
+    finally:
+        os.close(release_w)
+        os.close(ready_r)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    return parent, children, elapsed
+
+
+def _summarize(label, parent, children, elapsed):
+    print_table([(f"{label}: 親 {os.getpid()}", parent)] +
+                [(f"{label}: ワーカー{i + 1}", mem) for i, mem in enumerate(children)])
+    total = parent["pss"] + sum(m["pss"] for m in children)
+    uss = np.mean([m["uss"] for m in children])
+    print(f"   → ワーカーの USS 平均 {uss/MB:.1f}MB / PSS 合計 {total/MB:.1f}MB / "
+          f"全ワーカーの準備 {elapsed:.1f}秒")
+    return uss, total
+
+
+def check(children, weights):
+    """
+    親で読み込んだエンコーダーの重みを各ワーカーが共有しているか
+    （共有メモリが重み以上、固有メモリが重みより小さい）
+
+    Returns:
+        bool: 全ワーカーが満たしていれば True
+    """
+    ok = weights > 0
+    if not ok:
+        print("❌ 親でエンコーダーを読み込めていません")
+    for i, mem in enumerate(children):
+        passed = weights > 0 and mem["shared"] >= weights and mem["uss"] < weights
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} ワーカー{i + 1}: 共有 {mem['shared']/MB:.1f}MB / 固有 {mem['uss']/MB:.1f}MB "
+              f"(重み {weights/MB:.1f}MB)")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ワーカープロセスごとの固有メモリ（USS）の確認")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--pid", type=int, help="起動中のサーバー（gunicorn のマスター）のPID")
+    group.add_argument("--simulate", type=int, metavar="N", help="N 個のワーカーを fork して計測")
+    parser.add_argument("--seconds", type=float, default=3.0, help="--simulate で推論する音声の長さ（秒）")
+    parser.add_argument("--mode", choices=("both", "preload", "per-worker"), default="both",
+                        help="--simulate の読み込み方（both で両方を比較）")
+    parser.add_argument("--check", action="store_true",
+                        help="--simulate の preload で各ワーカーが重みを共有していなければ終了コード 1")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING").upper(), format="%(message)s")
+
+    if args.pid:
+        report(args.pid)
+        return 0
+
+    results = {}
+    # 各ワーカーが読み込む場合を先に計測する（親がまだモデルを持っていない状態で fork する）
+    if args.mode in ("both", "per-worker"):
+        results["per-worker"] = _summarize("各ワーカーで読み込み",
+                                           *simulate(args.simulate, preload=False, seconds=args.seconds))
+    if args.mode in ("both", "preload"):
+        parent, children, elapsed = simulate(args.simulate, preload=True, seconds=args.seconds)
+        results["preload"] = _summarize("親で読み込んで fork", parent, children, elapsed)
+        if args.check and not check(children, model_bytes()):
+            return 1
+
+    print(f"\n{'='*60}")
+    print(f"📊 ワーカー {args.simulate}個")
+    for label, (uss, total) in results.items():
+        print(f"   {label:<10}: ワーカー1つあたり USS {uss/MB:.1f}MB / PSS 合計 {total/MB:.1f}MB")
+    if len(results) == 2:
+        saved = results["per-worker"][1] - results["preload"][1]
+        print(f"   親で読み込むと合計 {saved/MB:.1f}MB 少ない "
+              f"（ワーカー1つあたり {(results['per-worker'][0] - results['preload'][0])/MB:.1f}MB）")
+    print(f"{'='*60}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
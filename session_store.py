@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+セッションごとのシステム状態（シンクロ率・話者・直近の会話ログ）
+
+端末・ブラウザごとのセッションIDで状態を分け、複数スレッドから同時に更新しても壊れないようにする
+- MemorySessionStore: 1プロセス内のみ（セッションIDのハッシュで分けたロックで並行に更新）
+- SqliteSessionStore: SQLiteファイルを共有し、複数のワーカープロセスから同じ状態を参照・更新できる
+
+会話ログはセッションごとに直近 log_size 件だけを保持するリングバッファ
+
+    store = create_session_store("sqlite", "logs/sessions.sqlite3")
+    state = store.update("kitchen", lambda s: s.update(sync_rate=s["sync_rate"] + 10))
+    store.append_log("kitchen", entry)
+"""
+
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+
+from log_writer import _to_json
+
+DEFAULT_SESSION = "default"
+
+# 状態の項目と初期値（conversation_log 以外）
+INITIAL_STATE = {
+    "sync_rate": 0,
+    "speaker": "UNKNOWN",
+    "status": "IDLE"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    sync_rate INTEGER NOT NULL,
+    speaker TEXT NOT NULL,
+    status TEXT NOT NULL,
+    log_seq INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_log (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+
+class MemorySessionStore:
+    """
+    プロセス内のセッション状態
+
+    セッションIDのハッシュで shards 個のロックに振り分けるため、
+    別々のセッションへの更新は互いに待たない
+    """
+
+    def __init__(self, shards=16, log_size=10):
+        self.log_size = log_size
+        self._shards = [(threading.Lock(), {}) for _ in range(max(1, shards))]
+
+    def _shard(self, session_id):
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def _state(self, sessions, session_id):
+        state = sessions.get(session_id)
+        if state is None:
+            state = sessions[session_id] = dict(INITIAL_STATE, conversation_log=deque(maxlen=self.log_size))
+        return state
+
+    @staticmethod
+    def _snapshot(session_id, state):
+        snapshot = {key: state[key] for key in INITIAL_STATE}
+        snapshot["session_id"] = session_id
+        snapshot["conversation_log"] = list(state["conversation_log"])
+        return snapshot
+
+    def get(self, session_id):
+        """セッションの状態（未使用のセッションは初期状態）"""
+        lock, sessions = self._shard(session_id)
+        with lock:
+            state = sessions.get(session_id)
+            if state is None:
+                return dict(INITIAL_STATE, session_id=session_id, conversation_log=[])
+            return self._snapshot(session_id, state)
+
+    def update(self, session_id, fn):
+        """
+        fn(state) で状態を書き換え、更新後の状態を返す（読み出しから書き込みまで他の更新は割り込まない）
+        state は INITIAL_STATE と同じ項目を持つ dict
+        """
+        lock, sessions = self._shard(session_id)
+        with lock:
+            state = self._state(sessions, session_id)
+            fields = {key: state[key] for key in INITIAL_STATE}
+            fn(fields)
+            state.update((key, fields[key]) for key in INITIAL_STATE)
+            return self._snapshot(session_id, state)
+
+    def append_log(self, session_id, entry):
+        """会話ログに追加（古いものから捨てる）"""
+        lock, sessions = self._shard(session_id)
+        with lock:
+            self._state(sessions, session_id)["conversation_log"].append(entry)
+
+    def reset(self, session_id):
+        """セッションを初期状態に戻す"""
+        lock, sessions = self._shard(session_id)
+        with lock:
+            sessions.pop(session_id, None)
+
+    def count(self):
+        """状態を持つセッションの数"""
+        total = 0
+        for lock, sessions in self._shards:
+            with lock:
+                total += len(sessions)
+        return total
+
+
+class SqliteSessionStore:
+    """
+    SQLiteファイルで共有するセッション状態
+
+    更新は BEGIN IMMEDIATE のトランザクションで行うため、
+    別プロセスからの同時更新も順番に適用される
+    """
+
+    def __init__(self, db_path, log_size=10):
+        self.db_path = db_path
+        self.log_size = log_size
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # 複数のワーカーが同時に起動しても、WALへの切り替えとスキーマの作成は1プロセスずつ行う
+        with open(f"{db_path}.lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """スレッドごとに接続を1つ持つ（トランザクションは自分で制御する）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _read(self, conn, session_id):
+        row = conn.execute(
+            "SELECT sync_rate, speaker, status FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        state = dict(row) if row is not None else dict(INITIAL_STATE)
+        state["session_id"] = session_id
+        state["conversation_log"] = [
+            json.loads(r["entry"]) for r in conn.execute(
+                "SELECT entry FROM session_log WHERE session_id = ? ORDER BY seq", (session_id,)
+            )
+        ]
+        return state
+
+    def get(self, session_id):
+        """セッションの状態（未使用のセッションは初期状態）"""
+        return self._read(self._connect(), session_id)
+
+    def update(self, session_id, fn):
+        """
+        fn(state) で状態を書き換え、更新後の状態を返す（読み出しから書き込みまで他の更新は割り込まない）
+        state は INITIAL_STATE と同じ項目を持つ dict
+        """
+        def apply(conn):
+            state = self._read(conn, session_id)
+            fields = {key: state[key] for key in INITIAL_STATE}
+            fn(fields)
+            conn.execute(
+                "INSERT INTO sessions (session_id, sync_rate, speaker, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET sync_rate = excluded.sync_rate, "
+                "speaker = excluded.speaker, status = excluded.status, updated_at = excluded.updated_at",
+                (session_id, fields["sync_rate"], fields["speaker"], fields["status"], time.time())
+            )
+            state.update(fields)
+            return state
+        return self._transaction(apply)
+
+    def append_log(self, session_id, entry):
+        """会話ログに追加（セッションごとに直近 log_size 件を残して古いものを消す）"""
+        data = json.dumps(entry, ensure_ascii=False, default=_to_json)
+
+        def apply(conn):
+            conn.execute(
+                "INSERT INTO sessions (session_id, sync_rate, speaker, status, log_seq, updated_at) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET log_seq = log_seq + 1, updated_at = excluded.updated_at",
+                (session_id, INITIAL_STATE["sync_rate"], INITIAL_STATE["speaker"],
+                 INITIAL_STATE["status"], time.time())
+            )
+            seq = conn.execute(
+                "SELECT log_seq FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.execute("INSERT INTO session_log (session_id, seq, entry) VALUES (?, ?, ?)",
+                         (session_id, seq, data))
+            conn.execute("DELETE FROM session_log WHERE session_id = ? AND seq <= ?",
+                         (session_id, seq - self.log_size))
+        self._transaction(apply)
+
+    def reset(self, session_id):
+        """セッションを初期状態に戻す"""
+        def apply(conn):
+            conn.execute("DELETE FROM session_log WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._transaction(apply)
+
+    def count(self):
+        """状態を持つセッションの数"""
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+SESSION_STORES = ("memory", "sqlite")
+
+
+def create_session_store(kind="memory", db_path=None, log_size=10):
+    """
+    設定からストアを作る
+
+    Args:
+        kind: "memory"（1プロセス）または "sqlite"（複数ワーカーで共有）
+        db_path: kind="sqlite" のときのデータベースファイル
+    """
+    if kind == "memory":
+        return MemorySessionStore(log_size=log_size)
+    if kind == "sqlite":
+        if not db_path:
+            raise ValueError("sqlite のセッションストアにはファイルのパスが必要です")
+        return SqliteSessionStore(db_path, log_size=log_size)
+    raise ValueError(f"未対応のセッションストアです: {kind}（{', '.join(SESSION_STORES)}）")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+段階的な話者識別（GMM → ECAPA-TDNN）
+
+1段目: MFCC（13次元）+ GMM（models/gmm.pkl）で全発話を判定する（CPUで数ミリ秒）
+2段目: 親/子の対数尤度の差（1フレームあたりの平均）が GMM_MARGIN に届かない、
+       判定が微妙な発話だけを ECAPA-TDNN に回す
+
+    label, probs, tier, margin = identify_cascade(signal, escalate=identify.identify_signal)
+"""
+
+import logging
+import os
+import pickle
+import threading
+import warnings
+
+import numpy as np
+
+from metrics import REGISTRY, span
+
+logger = logging.getLogger(__name__)
+
+# GMMの設定（CASCADE_ENABLED=0 で常に ECAPA-TDNN）
+CASCADE_ENABLED = os.environ.get("CASCADE_ENABLED", "1") == "1"
+GMM_MODEL_PATH = os.environ.get("GMM_MODEL_PATH", "models/gmm.pkl")
+# これ以上の差（nats/フレーム）があれば GMM の判定をそのまま採用する
+GMM_MARGIN = float(os.environ.get("GMM_MARGIN", "1.0"))
+N_MFCC = 13
+
+TIERS = ("GMM", "ECAPA-TDNN")
+
+TIER_TOTAL = REGISTRY.counter(
+    "smartspeaker_speaker_tier_total", "話者識別を確定させた段（GMM / ECAPA-TDNN）の件数", ("tier",))
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def mfcc_features(signal, sr=16000, n_mfcc=N_MFCC):
+    """波形から MFCC を計算（フレーム × 次元）"""
+    import librosa
+    signal = np.asarray(signal, dtype=np.float32)
+    return librosa.feature.mfcc(y=signal, sr=sr, n_mfcc=n_mfcc).T
+
+
+class GmmScorer:
+    """
+    話者ごとの GaussianMixture で MFCC の平均対数尤度を比べる
+
+    models/gmm.pkl は {"parent": GaussianMixture, "child": GaussianMixture}
+    """
+
+    def __init__(self, models):
+        if len(models) < 2:
+            raise ValueError("GMMの話者が2人以上必要です")
+        self.models = models
+
+    @classmethod
+    def load(cls, path=GMM_MODEL_PATH):
+        with warnings.catch_warnings():
+            # 学習時と scikit-learn のバージョンが違う場合の警告は出さない
+            warnings.simplefilter("ignore")
+            with open(path, "rb") as f:
+                models = pickle.load(f)
+        logger.info(f"✅ GMMモデルをロード: {list(models.keys())}")
+        return cls(models)
+
+    def score_features(self, features):
+        """
+        MFCC から話者を判定
+
+        Returns:
+            (予測話者, 確信度dict, 1位と2位の平均対数尤度の差, 平均対数尤度dict)
+        """
+        scores = {speaker: float(model.score(features)) for speaker, model in self.models.items()}
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        margin = scores[ranked[0]] - scores[ranked[1]]
+        values = np.array([scores[s] for s in scores])
+        exp_scores = np.exp(values - values.max())
+        probs = {s: float(p) for s, p in zip(scores, exp_scores / exp_scores.sum())}
+        return ranked[0], probs, margin, scores
+
+    def score(self, signal, sr=16000):
+        return self.score_features(mfcc_features(signal, sr))
+
+
+def get_gmm_scorer():
+    """GMMを遅延ロード（モデルファイルがない・読み込めない場合は None）"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            if not os.path.exists(GMM_MODEL_PATH):
+                _scorer = False
+            else:
+                try:
+                    _scorer = GmmScorer.load(GMM_MODEL_PATH)
+                except Exception as e:
+                    logger.warning(f"⚠️  GMMモデルを読み込めません: {e}")
+                    _scorer = False
+    return _scorer or None
+
+
+def identify_cascade(signal, escalate=None, margin=None):
+    """
+    GMM で判定し、差が margin 未満なら escalate(signal) の結果を使う
+
+    Args:
+        signal: 16kHz・モノラルの波形
+        escalate: 2段目 (signal) → (予測話者, 確信度dict)。escalate が None、None を返した場合、
+                  または例外を送出した場合は（ECAPA-TDNN の準備中・エラーなど）差が小さくても GMM の判定を使う
+                  （GMM がなければ例外をそのまま送出する）
+        margin: 採用に必要な平均対数尤度の差（既定 GMM_MARGIN）
+
+    Returns:
+        (予測話者, 確信度dict, 確定させた段, GMMの差)。GMM がない場合の差は None
+        どちらの段も使えない場合は (None, {}, None, None)
+    """
+    margin = GMM_MARGIN if margin is None else margin
+    scorer = get_gmm_scorer() if CASCADE_ENABLED else None
+    gmm_result = None
+    if scorer is not None:
+        with span("gmm"):
+            label, probs, gmm_margin, _ = scorer.score(signal)
+        logger.debug(f"🌲 GMM: {label} (差 {gmm_margin:.3f}, 確信度 {probs})")
+        gmm_result = (label, probs, "GMM", gmm_margin)
+        if gmm_margin >= margin:
+            TIER_TOTAL.inc(tier="GMM")
+            return gmm_result
+    
+    escalated = None
+    if escalate is not None:
+        try:
+            escalated = escalate(signal)
+        except Exception as e:
+            if gmm_result is None:
+                raise
+            logger.error(f"❌ ECAPA-TDNN の識別エラー（GMM の判定を使います）: {e}")
+    if escalated is not None:
+        TIER_TOTAL.inc(tier="ECAPA-TDNN")
+        return escalated[0], escalated[1], "ECAPA-TDNN", gmm_result[3] if gmm_result else None
+    if gmm_result is not None:
+        TIER_TOTAL.inc(tier="GMM")
+        return gmm_result
+    return None, {}, None, None
+
+
+def tier_stats():
+    """段ごとの件数と ECAPA-TDNN に回した割合（/api/status 用）"""
+    counts = {tier: TIER_TOTAL.value(tier=tier) for tier in TIERS}
+    total = sum(counts.values())
+    return {
+        "counts": counts,
+        "escalation_rate": counts["ECAPA-TDNN"] / total if total else 0.0,
+        "margin": GMM_MARGIN,
+        "enabled": CASCADE_ENABLED
+    }
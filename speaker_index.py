@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+話者登録インデックス
+話者ごとに複数のL2正規化済みembedding（エグゼンプラー）を1つの連続した
+float32行列に保持し、1回の行列ベクトル積でまとめてスコアリングする
+"""
+
+import threading
+
+import numpy as np
+
+# 登録話者ラベル → アプリ上の話者名
+SPEAKER_LABELS = {
+    "parent": "MOTHER",
+    "child": "CHILD"
+}
+
+
+def _normalize(vectors):
+    """行ごとにL2正規化した float32 行列を返す"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SpeakerIndex:
+    """
+    複数話者・複数エグゼンプラーの登録インデックス
+
+    行列は話者ごとに連続するよう並べてあり、話者単位の集約は
+    np.maximum.reduceat / np.add.reduceat で一括計算する
+    追加・削除は新しい行列を作って差し替えるため、スコアリング中でも安全
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._exemplars = {}   # speaker -> (n, D) 正規化済み行列
+        self._snapshot = (np.zeros((0, dim or 0), dtype=np.float32), [], np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def from_dict(cls, models):
+        """
+        {話者: embedding} または {話者: (n, D) 行列} の辞書から作成
+        （models/ecapa.pkl の形式）
+        """
+        index = cls()
+        for speaker, vectors in models.items():
+            index.add(speaker, vectors)
+        return index
+
+    @classmethod
+    def from_matrix(cls, matrix, speakers, counts):
+        """
+        話者ごとに連続して並んだ正規化済み行列から作成（models/ecapa.enroll の形式）
+        行列はコピーせずにそのまま使う（memmap なら複数プロセスでページを共有できる）
+        """
+        index = cls(dim=matrix.shape[1])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64) if len(counts) else \
+            np.zeros(0, dtype=np.int64)
+        index._exemplars = {
+            speaker: matrix[start:start + count] for speaker, start, count in zip(speakers, starts, counts)
+        }
+        index._snapshot = (matrix, list(speakers), starts)
+        return index
+
+    def to_dict(self):
+        """{話者: (n, D) 行列} の辞書に変換（保存用）"""
+        with self._lock:
+            return {speaker: vectors.copy() for speaker, vectors in self._exemplars.items()}
+
+    def add(self, speaker, vectors):
+        """話者のエグゼンプラーを追加（既存の話者なら追記）"""
+        vectors = _normalize(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding次元が一致しません: {vectors.shape[1]} != {self.dim}")
+            if speaker in self._exemplars:
+                vectors = np.vstack([self._exemplars[speaker], vectors])
+            self._exemplars[speaker] = vectors
+            self._rebuild()
+
+    def remove(self, speaker):
+        """話者を削除（登録されていなければ KeyError）"""
+        with self._lock:
+            del self._exemplars[speaker]
+            self._rebuild()
+
+    def speakers(self):
+        """{話者: エグゼンプラー数}"""
+        with self._lock:
+            return {speaker: len(vectors) for speaker, vectors in self._exemplars.items()}
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+    def _rebuild(self):
+        """話者ごとに連続した行列とグループ開始位置を作り直す（ロック内で呼ぶ）"""
+        speakers = list(self._exemplars.keys())
+        if speakers:
+            matrix = np.ascontiguousarray(np.vstack([self._exemplars[s] for s in speakers]))
+            counts = np.array([len(self._exemplars[s]) for s in speakers], dtype=np.int64)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        else:
+            matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            starts = np.zeros(0, dtype=np.int64)
+        self._snapshot = (matrix, speakers, starts)
+
+    def score(self, embedding, aggregate="max", top_k=3):
+        """
+        embeddingを全エグゼンプラーと比較
+
+        Args:
+            embedding: 照合するembedding (D,)
+            aggregate: 話者単位の集約方法 ("max" または "mean")
+            top_k: 類似度上位のエグゼンプラーを何件返すか
+
+        Returns:
+            (scores, top): scores は {話者: コサイン類似度}、
+                           top は [(話者, コサイン類似度), ...]
+        """
+        matrix, speakers, starts = self._snapshot
+        if not speakers:
+            raise ValueError("登録話者がいません")
+
+        query = _normalize(embedding)[0]
+        sims = matrix @ query
+
+        if aggregate == "max":
+            per_speaker = np.maximum.reduceat(sims, starts)
+        elif aggregate == "mean":
+            counts = np.diff(np.append(starts, len(sims)))
+            per_speaker = np.add.reduceat(sims, starts) / counts
+        else:
+            raise ValueError(f"未対応の集約方法: {aggregate}")
+        scores = dict(zip(speakers, per_speaker.tolist()))
+
+        top = []
+        if top_k:
+            k = min(top_k, len(sims))
+            idx = np.argpartition(-sims, k - 1)[:k]
+            idx = idx[np.argsort(-sims[idx])]
+            row_speaker = np.searchsorted(starts, idx, side="right") - 1
+            top = [(speakers[r], float(sims[i])) for i, r in zip(idx, row_speaker)]
+        return scores, top
@@ -1,6 +1,18 @@
 #!/bin/bash
 
 # お母さんスイッチ Web GUI 起動スクリプト
+#
+#   ./start.sh        開発サーバー（app.py、自動リロードあり）
+#   ./start.sh prod   本番モード（gunicorn の複数ワーカー + 推論プロセスプール）
+#
+# 本番モードの主な設定（環境変数で上書きできる）:
+#   WEB_WORKERS / WEB_THREADS     gunicorn のワーカー数・ワーカーごとのスレッド数（既定 2 / 8）
+#   INFERENCE_WORKERS             ワーカーごとのデコード・推論プロセス数（既定 2）
+#   INFERENCE_QUEUE               推論の実行中 + 待ちの上限。超えたら 503（既定 8）
+#   DECODE_TIMEOUT_SEC / EMBED_TIMEOUT_SEC / ASR_TIMEOUT_SEC   段階ごとのタイムアウト
+#   PRELOAD_MODEL                 1 ならマスターでモデルを読み込んでから fork し、ワーカー間で共有する（既定 1）
+
+MODE="${1:-dev}"
 
 echo "======================================"
 echo "  お母さんスイッチ システム起動"
@@ -24,6 +36,11 @@ if ! python3 -c "import flask" &> /dev/null; then
     pip3 install -r requirements.txt
 fi
 
+if [ "$MODE" = "prod" ] && ! python3 -c "import gunicorn" &> /dev/null; then
+    echo "📦 gunicornをインストールしています..."
+    pip3 install -r requirements.txt
+fi
+
 echo ""
 echo "🚀 サーバーを起動しています..."
 echo ""
@@ -33,5 +50,16 @@ echo ""
 echo "終了するには Ctrl+C を押してください"
 echo ""
 
-# Flaskサーバー起動
+if [ "$MODE" = "prod" ]; then
+    # ワーカー間で状態を共有し、CPU負荷の高い処理は推論プールで実行する
+    export SESSION_STORE="${SESSION_STORE:-sqlite}"
+    export INFERENCE_WORKERS="${INFERENCE_WORKERS:-2}"
+    export INFERENCE_QUEUE="${INFERENCE_QUEUE:-8}"
+    export PRELOAD_MODEL="${PRELOAD_MODEL:-1}"
+    echo "⚙️  本番モード: ワーカー ${WEB_WORKERS:-2} × スレッド ${WEB_THREADS:-8}、推論プロセス ${INFERENCE_WORKERS}/ワーカー"
+    echo ""
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
+
+# Flaskサーバー起動（開発用）
 python3 app.py
@@ -13,6 +13,33 @@ let startTime = Date.now();
 let syncRate = 0;
 let audioStream = null;
 
+// ストリーミングモード（?stream=1 で有効化）: 録音中のチャンクを WebSocket で逐次送信
+const STREAMING_MODE = new URLSearchParams(location.search).has('stream');
+let streamSocket = null;
+let pendingStreamChunks = [];
+
+// PCMモード（?pcm=1 で有効化）: AudioWorklet で 16kHz PCM16 を作って送信（サーバー側のデコード不要）
+const PCM_MODE = new URLSearchParams(location.search).has('pcm');
+const AUDIO_BLOB_TYPE = PCM_MODE ? 'audio/L16;rate=16000' : 'audio/webm';
+let pcmContext = null;
+let pcmNode = null;
+
+// サーバーで合成した応答音声（Ogg/Opus が再生できないブラウザでは WAV を要求）
+const RESPONSE_AUDIO_FORMAT = new Audio().canPlayType('audio/ogg; codecs=opus') ? 'opus' : 'wav';
+let responseAudio = null;
+
+// セッションID（?session=名前 で指定。なければブラウザごとに生成して保存）: シンクロ率と会話ログはセッションごと
+const SESSION_ID = new URLSearchParams(location.search).get('session') || loadSessionId();
+
+function loadSessionId() {
+    let id = localStorage.getItem('sessionId');
+    if (!id) {
+        id = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`);
+        localStorage.setItem('sessionId', id);
+    }
+    return id;
+}
+
 // ========== DOM要素 ==========
 const elements = {
     micButton: document.getElementById('mic-button'),
@@ -31,6 +58,12 @@ const elements = {
 // ========== 初期化 ==========
 document.addEventListener('DOMContentLoaded', () => {
     console.log('🚀 お母さんスイッチ システム起動');
+    if (STREAMING_MODE) {
+        console.log('📡 ストリーミングモードで動作します');
+    }
+    if (PCM_MODE) {
+        console.log('🎚️ PCM16モードで動作します');
+    }
     initEventListeners();
     updateUptime();
     setInterval(updateUptime, 1000);
@@ -275,29 +308,16 @@ async function startRecording() {
         
         audioChunks = [];
         
-        // サポートされているMIMEタイプを確認
-        const mimeType = MediaRecorder.isTypeSupported('audio/webm;codecs=opus') 
-            ? 'audio/webm;codecs=opus' 
-            : 'audio/webm';
-        
-        console.log(`🎤 使用するMIMEタイプ: ${mimeType}`);
-        
-        mediaRecorder = new MediaRecorder(audioStream, {
-            mimeType: mimeType,
-            audioBitsPerSecond: 128000  // 128kbps
-        });
-        
-        mediaRecorder.ondataavailable = (event) => {
-            if (event.data.size > 0) {
-                audioChunks.push(event.data);
-                console.log(`📦 チャンク受信: ${event.data.size} bytes`);
-            }
-        };
+        if (STREAMING_MODE) {
+            openStreamSocket();
+        }
         
-        // 100msごとにデータを取得（より細かく録音）
-        mediaRecorder.start(100);
+        if (PCM_MODE) {
+            await startPcmRecording();
+        } else {
+            startMediaRecorder();
+        }
         isRecording = true;
-        console.log('🔴 録音開始 (100ms間隔でチャンク収集)');
         
         // 録音インジケーターを追加
         const indicator = '<span class="recording-indicator ml-2"></span>';
@@ -311,29 +331,106 @@ async function startRecording() {
     }
 }
 
+function startMediaRecorder() {
+    // サポートされているMIMEタイプを確認
+    const mimeType = MediaRecorder.isTypeSupported('audio/webm;codecs=opus') 
+        ? 'audio/webm;codecs=opus' 
+        : 'audio/webm';
+    
+    console.log(`🎤 使用するMIMEタイプ: ${mimeType}`);
+    
+    mediaRecorder = new MediaRecorder(audioStream, {
+        mimeType: mimeType,
+        audioBitsPerSecond: 128000  // 128kbps
+    });
+    
+    mediaRecorder.ondataavailable = (event) => {
+        if (event.data.size > 0) {
+            audioChunks.push(event.data);
+            console.log(`📦 チャンク受信: ${event.data.size} bytes`);
+            if (STREAMING_MODE) {
+                sendStreamChunk(event.data);
+            }
+        }
+    };
+    
+    // 100msごとにデータを取得（より細かく録音）
+    mediaRecorder.start(100);
+    console.log('🔴 録音開始 (100ms間隔でチャンク収集)');
+}
+
+// ========== PCM16録音 (AudioWorklet) ==========
+async function startPcmRecording() {
+    pcmContext = new AudioContext({ sampleRate: 16000 });
+    await pcmContext.audioWorklet.addModule('/static/js/pcm-worklet.js');
+    const source = pcmContext.createMediaStreamSource(audioStream);
+    pcmNode = new AudioWorkletNode(pcmContext, 'pcm16-writer');
+    
+    pcmNode.port.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer && event.data.byteLength > 0) {
+            audioChunks.push(event.data);
+            if (STREAMING_MODE) {
+                sendStreamChunk(event.data);
+            }
+        }
+    };
+    
+    source.connect(pcmNode);
+    console.log(`🔴 PCM16録音開始 (${pcmContext.sampleRate}Hz → 16000Hz)`);
+}
+
+function stopPcmRecording(onStopped) {
+    // 途中までのバッファを受け取ってから停止する
+    const node = pcmNode;
+    const context = pcmContext;
+    pcmNode = null;
+    pcmContext = null;
+    
+    const handleChunk = node.port.onmessage;
+    node.port.onmessage = (event) => {
+        if (event.data === 'flushed') {
+            node.disconnect();
+            context.close();
+            onStopped();
+        } else {
+            handleChunk(event);
+        }
+    };
+    node.port.postMessage('flush');
+}
+
 // ========== 録音停止 ==========
 function stopRecording(recognizedText) {
-    if (!isRecording || !mediaRecorder) {
+    if (!isRecording || (!mediaRecorder && !pcmNode)) {
         console.warn('⚠️  録音停止: 録音中ではありません');
         return;
     }
     
     console.log(`🛑 録音停止開始 (チャンク数: ${audioChunks.length})`);
     
-    mediaRecorder.onstop = () => {
+    const onStopped = () => {
         console.log(`⏹️ 録音停止完了 (チャンク数: ${audioChunks.length})`);
-        const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
+        const audioBlob = new Blob(audioChunks, { type: AUDIO_BLOB_TYPE });
         console.log(`🎵 音声Blob作成: ${audioBlob.size} bytes`);
         
         if (audioBlob.size === 0) {
             console.error('❌ 音声データが空です！');
         }
         
-        processVoiceCommand(recognizedText, audioBlob);
+        if (STREAMING_MODE) {
+            finishStream(recognizedText);
+        } else {
+            processVoiceCommand(recognizedText, audioBlob);
+        }
         isRecording = false;
     };
     
-    mediaRecorder.stop();
+    if (PCM_MODE) {
+        stopPcmRecording(onStopped);
+    } else {
+        mediaRecorder.onstop = onStopped;
+        mediaRecorder.stop();
+    }
 }
 
 // ========== 音声コマンド処理 ==========
@@ -344,7 +441,8 @@ async function processVoiceCommand(text, audioBlob) {
     try {
         const formData = new FormData();
         formData.append('text', text);
-        formData.append('audio', audioBlob, 'input.webm');
+        formData.append('session_id', SESSION_ID);
+        formData.append('audio', audioBlob, PCM_MODE ? 'input.pcm' : 'input.webm');
         
         console.log('📤 送信データ:', {
             text: text,
@@ -368,28 +466,7 @@ async function processVoiceCommand(text, audioBlob) {
         const data = await response.json();
         console.log('📥 受信データ:', data);
         
-        updateSpeaker(data.speaker);
-        updateSyncRate(data.sync_rate);
-        addLogEntry(text, data.speaker, data.response, data.timestamp, true, data.confidence, data.method, data.command, data.attitude);
-        
-        if ('speechSynthesis' in window) {
-            const utterance = new SpeechSynthesisUtterance(data.response);
-            utterance.lang = 'ja-JP';
-            utterance.rate = 1.0;
-            utterance.pitch = 1.0;
-            
-            utterance.onstart = () => {
-                elements.systemStatus.textContent = 'SPEAKING';
-                elements.systemStatus.style.color = '#a855f7';
-            };
-            
-            utterance.onend = () => {
-                elements.systemStatus.textContent = 'LISTENING';
-                elements.systemStatus.style.color = '#3b82f6';
-            };
-            
-            speechSynthesis.speak(utterance);
-        }
+        handleCommandResult(text, data);
         
     } catch (error) {
         console.error('❌ API呼び出しエラー:', error);
@@ -397,6 +474,120 @@ async function processVoiceCommand(text, audioBlob) {
     }
 }
 
+// ========== 処理結果の表示・読み上げ ==========
+function handleCommandResult(text, data) {
+    updateSpeaker(data.speaker);
+    updateSyncRate(data.sync_rate);
+    addLogEntry(text, data.speaker, data.response, data.timestamp, true, data.confidence, data.method, data.command, data.attitude);
+    
+    if (data.response_audio_url) {
+        playResponseAudio(data);
+    } else {
+        speakWithBrowser(data.response);
+    }
+}
+
+function setSpeaking(speaking) {
+    elements.systemStatus.textContent = speaking ? 'SPEAKING' : 'LISTENING';
+    elements.systemStatus.style.color = speaking ? '#a855f7' : '#3b82f6';
+}
+
+// サーバーで合成した応答音声を再生（JSONを受け取った時点で取得を開始）
+function playResponseAudio(data) {
+    if (responseAudio) {
+        responseAudio.pause();
+    }
+    const audio = new Audio(`${data.response_audio_url}?format=${RESPONSE_AUDIO_FORMAT}`);
+    audio.preload = 'auto';
+    responseAudio = audio;
+    
+    // 取得・再生に失敗したらブラウザの音声合成で読み上げる（1回だけ）
+    let fellBack = false;
+    const fallback = (error) => {
+        if (fellBack || responseAudio !== audio) return;
+        fellBack = true;
+        console.warn('⚠️  応答音声を再生できません。ブラウザの音声合成を使います:', error);
+        speakWithBrowser(data.response);
+    };
+    
+    audio.onplay = () => setSpeaking(true);
+    audio.onended = () => setSpeaking(false);
+    audio.onerror = () => fallback(audio.error);
+    audio.play().catch(fallback);
+}
+
+function speakWithBrowser(text) {
+    if ('speechSynthesis' in window) {
+        const utterance = new SpeechSynthesisUtterance(text);
+        utterance.lang = 'ja-JP';
+        utterance.rate = 1.0;
+        utterance.pitch = 1.0;
+        
+        utterance.onstart = () => setSpeaking(true);
+        utterance.onend = () => setSpeaking(false);
+        
+        speechSynthesis.speak(utterance);
+    }
+}
+
+// ========== ストリーミング送信 ==========
+function openStreamSocket() {
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    pendingStreamChunks = [];
+    const socket = new WebSocket(`${protocol}//${location.host}/ws/command`);
+    socket.binaryType = 'arraybuffer';
+    streamSocket = socket;
+    
+    socket.onopen = () => {
+        console.log('📡 ストリーミング接続完了');
+        socket.send(JSON.stringify({ type: 'start', format: PCM_MODE ? 'pcm16' : 'webm', session_id: SESSION_ID }));
+        // 接続前に録音されたチャンクを送信
+        pendingStreamChunks.forEach((chunk) => socket.send(chunk));
+        pendingStreamChunks = [];
+    };
+    
+    socket.onerror = (error) => {
+        console.error('❌ ストリーミング接続エラー:', error);
+    };
+}
+
+function sendStreamChunk(chunk) {
+    if (streamSocket && streamSocket.readyState === WebSocket.OPEN) {
+        streamSocket.send(chunk);
+    } else {
+        pendingStreamChunks.push(chunk);
+    }
+}
+
+function finishStream(text) {
+    const socket = streamSocket;
+    streamSocket = null;
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+        // 接続できなかった場合は通常のアップロードにフォールバック
+        console.warn('⚠️  ストリーミング未接続のため通常送信します');
+        if (socket) {
+            socket.close();
+        }
+        processVoiceCommand(text, new Blob(audioChunks, { type: AUDIO_BLOB_TYPE }));
+        return;
+    }
+    
+    elements.systemStatus.textContent = 'PROCESSING';
+    elements.systemStatus.style.color = '#eab308';
+    
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        console.log('📥 受信データ (stream):', data);
+        socket.close();
+        if (data.error) {
+            elements.voiceInput.innerHTML = '<span class="text-red-400">サーバーエラーが発生しました</span>';
+            return;
+        }
+        handleCommandResult(text, data);
+    };
+    socket.send(JSON.stringify({ type: 'end', text: text }));
+}
+
 // ========== リスニング開始/停止 ==========
 async function toggleListening() {
     if (!recognition) {
@@ -421,9 +612,15 @@ async function toggleListening() {
     } else {
         // リスニング停止
         recognition.stop();
-        if (isRecording && mediaRecorder) {
+        if (isRecording && PCM_MODE && pcmNode) {
+            stopPcmRecording(() => { isRecording = false; });
+        } else if (isRecording && mediaRecorder) {
             mediaRecorder.stop();
         }
+        if (streamSocket) {
+            streamSocket.close();
+            streamSocket = null;
+        }
         isListening = false;
         
         elements.micButton.classList.remove('active');
@@ -440,7 +637,11 @@ async function toggleListening() {
 async function resetSystem() {
     if (confirm('システムをリセットしますか？')) {
         try {
-            await fetch('/api/reset', { method: 'POST' });
+            await fetch('/api/reset', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ session_id: SESSION_ID })
+            });
             updateSyncRate(0);
             updateSpeaker('UNKNOWN');
             elements.conversationLog.innerHTML = '<div class="text-gray-600 text-sm text-center py-8">No conversation history yet.</div>';
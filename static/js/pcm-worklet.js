@@ -0,0 +1,56 @@
+/**
+ * お母さんスイッチ - PCM16 録音用 AudioWorklet
+ * マイク入力を 16kHz・モノラル・16bit PCM に変換し、約100msごとにメインスレッドへ送る
+ * （サーバー側でのWebM/Opusデコードを不要にする）
+ */
+
+const TARGET_RATE = 16000;
+const CHUNK_SAMPLES = TARGET_RATE / 10;
+
+class Pcm16Writer extends AudioWorkletProcessor {
+    constructor() {
+        super();
+        // AudioContext が 16kHz で作れなかった場合は線形補間でリサンプリング
+        this.step = sampleRate / TARGET_RATE;
+        this.position = 0;
+        this.buffer = new Int16Array(CHUNK_SAMPLES);
+        this.length = 0;
+        // 録音停止時に 'flush' を受け取ったら、途中までのバッファも送る
+        this.port.onmessage = (event) => {
+            if (event.data === 'flush') {
+                const rest = this.buffer.slice(0, this.length);
+                this.port.postMessage(rest.buffer, [rest.buffer]);
+                this.length = 0;
+                this.port.postMessage('flushed');
+            }
+        };
+    }
+
+    process(inputs) {
+        const input = inputs[0];
+        if (!input || input.length === 0) {
+            return true;
+        }
+        const channel = input[0];
+
+        while (this.position < channel.length) {
+            const index = Math.floor(this.position);
+            const frac = this.position - index;
+            const next = index + 1 < channel.length ? channel[index + 1] : channel[index];
+            const sample = channel[index] + (next - channel[index]) * frac;
+            const clipped = Math.max(-1, Math.min(1, sample));
+            this.buffer[this.length++] = clipped < 0 ? clipped * 0x8000 : clipped * 0x7fff;
+
+            if (this.length === CHUNK_SAMPLES) {
+                this.port.postMessage(this.buffer.buffer, [this.buffer.buffer]);
+                this.buffer = new Int16Array(CHUNK_SAMPLES);
+                this.length = 0;
+            }
+            this.position += this.step;
+        }
+        this.position -= channel.length;
+        return true;
+    }
+}
+
+registerProcessor('pcm16-writer', Pcm16Writer);
@@ -0,0 +1,40 @@
+"""
+テスト共通の設定
+
+- リポジトリ直下のモジュール（app.py など）を import できるようにする
+- app は一時ディレクトリで読み込み（logs/・uploads/ をリポジトリに作らない）、
+  事前合成・Julius・推論プールなどの外部プロセスは使わない設定にする
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """一時ディレクトリで読み込んだ app モジュール"""
+    workdir = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    env = {
+        "TTS_PRERENDER": "0", "TTS_PLAYBACK": "0", "JULIUS_ENABLED": "0", "VAD_ENABLED": "0",
+        "INFERENCE_WORKERS": "0", "SESSION_STORE": "memory", "WARMUP_WAIT_SEC": "0",
+    }
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
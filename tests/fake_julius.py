@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+テスト用の Julius の代役（-module と -input adinnet の受け答えだけを真似る）
+
+- 受け取った PCM のバイト数を SCORE に入れた <RECOGOUT> を返す（SCORE="-バイト数"）
+- 空の発話には <RECOGFAIL/> を返す
+- 2秒（64000バイト）以上の発話は 1秒遅れて返す（呼び出し側の期限切れの確認用）
+- <RECOGOUT> は2回に分けて送る（"." の行での区切りの確認用）
+"""
+import socket
+import struct
+import sys
+import time
+
+SLOW_BYTES = 64000
+SLOW_DELAY = 1.0
+
+
+def listen(port):
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", port))
+    server.listen(1)
+    return server
+
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+
+
+def recogout(total):
+    return (f'<RECOGOUT>\n  <SHYPO RANK="1" SCORE="-{total}" GRAM="0">\n'
+            '    <WHYPO WORD="" CLASSID="0" PHONE="silB" CM="1.000"/>\n'
+            '    <WHYPO WORD="電気" CLASSID="1" PHONE="d e N k i" CM="0.900"/>\n'
+            '    <WHYPO WORD="つけて" CLASSID="2" PHONE="ts u k e t e" CM="0.800"/>\n'
+            '    <WHYPO WORD="" CLASSID="0" PHONE="silE" CM="1.000"/>\n'
+            '  </SHYPO>\n</RECOGOUT>\n.\n').encode("utf-8")
+
+
+def main(argv):
+    module_port = int(argv[argv.index("-module") + 1])
+    adin_port = int(argv[argv.index("-adport") + 1])
+    module, _ = listen(module_port).accept()
+    module.sendall(b"<STARTPROC/>\n.\n")
+    adin, _ = listen(adin_port).accept()
+    while True:
+        total = 0
+        while True:
+            size = struct.unpack("<i", recv_exact(adin, 4))[0]
+            if size == 0:
+                break
+            total += len(recv_exact(adin, size))
+        if total >= SLOW_BYTES:
+            time.sleep(SLOW_DELAY)
+        if total == 0:
+            module.sendall(b'<RECOGFAIL/>\n.\n')
+            continue
+        message = recogout(total)
+        module.sendall(b'<INPUT STATUS="STARTREC" TIME="0"/>\n.\n' + message[:40])
+        time.sleep(0.05)
+        module.sendall(message[40:])
+
+
+if __name__ == "__main__":
+    main(sys.argv)
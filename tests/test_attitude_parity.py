@@ -0,0 +1,120 @@
+"""
+ルール表 + Aho–Corasick による判定が、置き換え前の逐次的な部分文字列検索と同じ結果になることの確認
+
+置き換え前の classify_command / judge_attitude と話者キーワード判定（app.py）をそのまま残し、
+ルール表の語・その断片・無関係な語を乱数で組み合わせた発話で比較する
+"""
+
+import random
+
+import pytest
+
+from attitude_analyzer import analyze_utterance, classify_command, judge_attitude
+
+
+# ==============================
+# 置き換え前の実装
+# ==============================
+
+def baseline_command(joined):
+    if "テレビ" in joined:
+        if "つけ" in joined:
+            return "TV_ON"
+        if "けし" in joined or "消し" in joined:
+            return "TV_OFF"
+    if "電気" in joined:
+        if "つけ" in joined:
+            return "LIGHT_ON"
+        if "けし" in joined or "消し" in joined:
+            return "LIGHT_OFF"
+    if "おやつ" in joined:
+        if "ちょうだい" in joined or "ください" in joined:
+            return "GET_SNACK"
+        return "SNACK"
+    if "アラーム" in joined:
+        if "かけ" in joined:
+            return "ALARM_ON"
+        if "けし" in joined or "とめ" in joined:
+            return "ALARM_OFF"
+    if "音楽" in joined:
+        if "かけ" in joined:
+            return "MUSIC_ON"
+        if "けし" in joined or "とめ" in joined:
+            return "MUSIC_OFF"
+    if "音量" in joined:
+        if "上げ" in joined:
+            return "VOLUME_UP"
+        if "下げ" in joined:
+            return "VOLUME_DOWN"
+    if "カーテン" in joined:
+        if "開け" in joined:
+            return "CURTAIN_OPEN"
+        if "閉め" in joined:
+            return "CURTAIN_CLOSE"
+    if "うるさい" in joined or "うるせ" in joined or "黙れ" in joined or "黙っ" in joined:
+        return "INSULT"
+    if "ありがとう" in joined:
+        return "GRATITUDE"
+    if "終了" in joined:
+        return "EXIT"
+    return None
+
+
+def baseline_attitude(joined):
+    polite = ["ください", "お願い", "ちょうだい", "つけて", "してください", "いただけ", "開けて", "閉めて", "上げて", "下げて"]
+    rude = ["つけろ", "くれ", "しろ", "やれ", "けせ", "開けろ", "閉めろ", "上げろ", "下げろ"]
+    insult = ["うるさい", "うるせ", "黙れ", "黙っ"]
+    gratitude = ["ありがとう"]
+    for words, attitude in ((polite, "polite"), (rude, "rude"), (insult, "insult"), (gratitude, "gratitude")):
+        if any(word in joined for word in words):
+            return attitude
+    return "neutral"
+
+
+def baseline_speaker(joined):
+    mother_keywords = ['片付け', '掃除', '宿題', 'やりなさい', 'ダメ', '早く']
+    return "MOTHER" if any(keyword in joined for keyword in mother_keywords) else None
+
+
+# ==============================
+# 乱数の発話
+# ==============================
+
+KEYWORDS = [
+    "テレビ", "電気", "おやつ", "アラーム", "音楽", "音量", "カーテン", "つけ", "けし", "消し", "ちょうだい",
+    "ください", "かけ", "とめ", "上げ", "下げ", "開け", "閉め", "うるさい", "うるせ", "黙れ", "黙っ", "ありがとう",
+    "終了", "お願い", "つけて", "してください", "いただけ", "開けて", "閉めて", "上げて", "下げて", "つけろ", "くれ",
+    "しろ", "やれ", "けせ", "開けろ", "閉めろ", "上げろ", "下げろ", "片付け", "掃除", "宿題", "やりなさい", "ダメ", "早く",
+]
+DISTRACTORS = ["を", "て", "ろ", "の", "ね", "よ", "お", "し", "け", "さい", "だい", "テレ", "ビ", "うる", "黙",
+               "今日は", "ちょっと", "いい天気", "ママ", "ゲーム", "あと5分", "、", "！", " "]
+
+
+def random_utterance(rng):
+    tokens = [rng.choice(KEYWORDS if rng.random() < 0.4 else DISTRACTORS) for _ in range(rng.randint(0, 8))]
+    # 語の途中で切った断片も混ぜ、語の境界をまたぐ一致を作る
+    if tokens and rng.random() < 0.3:
+        i = rng.randrange(len(tokens))
+        tokens[i] = tokens[i][:rng.randint(1, max(1, len(tokens[i])))]
+    return tokens
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_baseline_on_random_corpus(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        tokens = random_utterance(rng)
+        joined = "".join(tokens)
+        expected = {"command": baseline_command(joined), "attitude": baseline_attitude(joined),
+                    "speaker": baseline_speaker(joined)}
+        assert analyze_utterance(joined) == expected, joined
+        assert analyze_utterance(tokens) == expected, tokens
+        assert classify_command(joined) == expected["command"], joined
+        assert judge_attitude(tokens) == expected["attitude"], tokens
+
+
+@pytest.mark.parametrize("text", ["", "テレビつけて", "テレビ消してくれ", "おやつ", "音量下げろ",
+                                  "うるさいありがとう", "早く宿題やりなさい", "カーテン開けてお願い"])
+def test_matches_baseline_on_examples(text):
+    assert analyze_utterance(text) == {"command": baseline_command(text), "attitude": baseline_attitude(text),
+                                       "speaker": baseline_speaker(text)}
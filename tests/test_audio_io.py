@@ -0,0 +1,40 @@
+"""話者識別に渡す波形が、VADの結果によらず MAX_VOICED_SEC で切り詰められることの確認"""
+
+import numpy as np
+
+from audio_io import AudioStreamSession, trim_silence, TARGET_SR
+from inference_pool import decode_job
+
+
+def _silence(seconds):
+    return np.zeros(int(TARGET_SR * seconds), dtype=np.float32)
+
+
+def test_trim_silence_caps_when_no_voiced_frame():
+    trimmed, removed = trim_silence(_silence(20), TARGET_SR, max_seconds=5.0)
+    assert len(trimmed) == 5 * TARGET_SR
+    assert removed == 15.0
+
+
+def test_stream_session_caps_without_vad():
+    session = AudioStreamSession(TARGET_SR, vad=False, audio_format="pcm16")
+    session.feed((_silence(20) * 32767).astype("<i2").tobytes())
+    signal, voiced, removed = session.finish(max_seconds=5.0)
+    assert len(signal) == 20 * TARGET_SR
+    assert len(voiced) == 5 * TARGET_SR
+    assert removed is None
+
+
+def test_stream_session_caps_when_no_voiced_frame():
+    session = AudioStreamSession(TARGET_SR, vad=True, audio_format="pcm16")
+    session.feed((_silence(20) * 32767).astype("<i2").tobytes())
+    _, voiced, _ = session.finish(max_seconds=5.0)
+    assert len(voiced) == 5 * TARGET_SR
+
+
+def test_decode_job_caps_without_vad():
+    data = (_silence(20) * 32767).astype("<i2").tobytes()
+    signal, voiced, removed = decode_job(data, True, False, 2, 5.0)
+    assert len(signal) == 20 * TARGET_SR
+    assert len(voiced) == 5 * TARGET_SR
+    assert removed is None
@@ -0,0 +1,67 @@
+"""/api/classify/batch の JSON 入力がサーバー上のファイルを読まないことと、推論プールが満杯のときの応答の確認"""
+
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+
+from inference_pool import Overloaded
+
+
+def _post(app_module, items):
+    return app_module.app.test_client().post("/api/classify/batch", json={"items": items})
+
+
+def test_json_items_ignore_server_paths(app_module, tmp_path):
+    secret = tmp_path / "secret.wav"
+    secret.write_bytes(b"RIFF")
+    response = _post(app_module, [
+        {"text": "テレビつけて", "wav": str(secret)},
+        {"text": "電気けして", "wav": "/nonexistent", "audio": "/etc/hostname"},
+    ])
+    assert response.status_code == 200
+    for result in response.get_json()["results"]:
+        assert result["error"] is None
+        assert result["wav"] is None
+        assert result["method"] == "keyword"
+
+
+def test_json_items_accept_inline_audio(app_module, monkeypatch):
+    pcm = (np.sin(np.arange(8000) / 16000 * 2 * np.pi * 220) * 0.3 * 32767).astype("<i2").tobytes()
+    seen = []
+
+    def fake_decode(items, vad=True, aggressiveness=2, max_seconds=5.0):
+        seen.extend(items)
+        return [(None, None) for _ in items]
+
+    monkeypatch.setattr("batch_classify.decode_items", fake_decode)
+    response = _post(app_module, [{"text": "テレビつけて", "audio_base64": base64.b64encode(pcm).decode(),
+                                   "content_type": "audio/L16"}])
+    assert response.status_code == 200
+    assert seen == [{"audio": pcm, "wav": None, "filename": None, "content_type": "audio/L16"}]
+
+
+def test_json_items_reject_bad_base64(app_module):
+    response = _post(app_module, [{"text": "x", "audio_base64": "not base64!"}])
+    assert response.status_code == 400
+
+
+class FullPool:
+    """デコードはこのプロセスで実行し、embedding の段で満杯を返す"""
+
+    def run(self, stage, fn, *args, timeout=None):
+        if stage == "embedding":
+            raise Overloaded("推論プールが混雑しています")
+        return [(np.ones(16000, dtype=np.float32), None) for _ in args[0]]
+
+
+def test_returns_503_when_pool_is_full_at_embedding(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "inference_pool", FullPool())
+    monkeypatch.setattr("batch_classify.get_gmm_scorer", lambda: None)
+    monkeypatch.setattr("batch_classify._load_speaker_id", lambda: SimpleNamespace(SPEAKER_MODEL_PATH=__file__))
+    pcm = (np.ones(16000) * 1000).astype("<i2").tobytes()
+    response = _post(app_module, [{"text": "テレビつけて", "audio_base64": base64.b64encode(pcm).decode(),
+                                   "content_type": "audio/L16"}])
+    # 発話ごとの「話者識別失敗」にせず、全体を 503 にして再試行させる
+    assert response.status_code == 503
+    assert response.headers.get("Retry-After")
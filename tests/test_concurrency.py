@@ -0,0 +1,57 @@
+"""
+/api/command を並行に呼んでも、各応答が自分の音声の結果になることの確認
+
+話者識別はフェイクに差し替え、音声の振幅をそのまま母親の確信度として返す。
+全リクエストが同時に話者識別の中にいないと進めない Barrier を置くため、
+処理が直列化されていればタイムアウトして失敗する
+"""
+
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+N_REQUESTS = 12
+
+
+def _pcm16(amplitude, seconds=0.5, sr=16000):
+    t = np.arange(int(sr * seconds)) / sr
+    return (np.sin(2 * np.pi * 220 * t) * amplitude * 32767).astype("<i2").tobytes()
+
+
+def test_parallel_uploads_get_their_own_results(app_module, monkeypatch):
+    barrier = threading.Barrier(N_REQUESTS, timeout=30)
+
+    def fake_cascade(signal, escalate=None, margin=None):
+        parent = round(float(np.max(np.abs(signal))), 2)
+        barrier.wait()
+        time.sleep(random.uniform(0, 0.02))
+        label = "parent" if parent >= 0.5 else "child"
+        return label, {"parent": parent, "child": round(1 - parent, 2)}, "GMM", 0.0
+
+    monkeypatch.setattr(app_module, "identify_cascade", fake_cascade)
+
+    def post(i):
+        amplitude = (i + 1) / (N_REQUESTS + 1)
+        response = app_module.app.test_client().post(
+            "/api/command",
+            data={"text": f"テレビをつけて {i}", "session_id": f"concurrency-{i}",
+                  "audio": (io.BytesIO(_pcm16(amplitude)), "a.pcm", "audio/L16")},
+            content_type="multipart/form-data")
+        return i, round(amplitude, 2), response
+
+    with ThreadPoolExecutor(max_workers=N_REQUESTS) as executor:
+        results = list(executor.map(post, range(N_REQUESTS)))
+
+    for i, amplitude, response in results:
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["session_id"] == f"concurrency-{i}"
+        assert body["user_text"] == f"テレビをつけて {i}"
+        assert body["method"] == "GMM"
+        assert body["confidence"]["parent"] == amplitude
+        assert body["speaker"] == ("MOTHER" if amplitude >= 0.5 else "CHILD")
+        assert body["sync_rate"] == int(amplitude * 100)
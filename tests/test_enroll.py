@@ -0,0 +1,49 @@
+"""
+話者登録（enroll.py）の差分登録で、別のエンコーダーの embedding を混ぜないことと出力先の確認
+"""
+import sys
+
+import numpy as np
+
+import enroll
+from enrollment_store import read_enrollment, write_enrollment
+
+
+def fake_embed(recordings, todo, **kwargs):
+    return {rel: np.ones(4, dtype=np.float32) for rel in todo}
+
+
+def setup_data(tmp_path, monkeypatch, encoder):
+    (tmp_path / "data" / "parent").mkdir(parents=True)
+    (tmp_path / "data" / "parent" / "a.wav").write_bytes(b"RIFF")
+    monkeypatch.setattr(enroll, "checkpoint_fingerprint", lambda path, mode: encoder)
+    monkeypatch.setattr(enroll, "embed_recordings", fake_embed)
+
+
+def test_api_exemplars_from_other_encoder_are_dropped(tmp_path, monkeypatch):
+    paths = {"enrollment_path": str(tmp_path / "x.enroll"), "model_path": str(tmp_path / "x.pkl"),
+             "manifest_path": str(tmp_path / "x.manifest.json")}
+    # API から登録した行（元ファイルなし）
+    write_enrollment(paths["enrollment_path"], {"child": np.full((2, 4), 0.5, dtype=np.float32)},
+                     sources={"child": [None, None]}, encoder="old")
+
+    setup_data(tmp_path, monkeypatch, "old")
+    result = enroll.enroll(str(tmp_path / "data"), **paths)
+    assert result["speakers"] == {"parent": 1, "child": 2} and result["stale"] == 0
+
+    # エンコーダーが変わると、API 登録の行は計算し直せないので残さない
+    monkeypatch.setattr(enroll, "checkpoint_fingerprint", lambda path, mode: "new")
+    result = enroll.enroll(str(tmp_path / "data"), **paths)
+    assert result["speakers"] == {"parent": 1} and result["stale"] == 2
+    enrollment = read_enrollment(paths["enrollment_path"])
+    assert enrollment.speakers == ["parent"] and enrollment.header["encoder"] == "new"
+
+
+def test_out_writes_model_and_manifest_next_to_enrollment(tmp_path, monkeypatch):
+    setup_data(tmp_path, monkeypatch, "new")
+    out = tmp_path / "out" / "x.enroll"
+    monkeypatch.setattr(sys, "argv", ["enroll.py", "--data", str(tmp_path / "data"), "--workers", "1",
+                                      "--out", str(out)])
+    enroll.main()
+    assert sorted(p.name for p in out.parent.iterdir()) == ["x.enroll", "x.manifest.json", "x.pkl"]
+    assert enroll.output_paths("models/ecapa.enroll") == (enroll.SPEAKER_MODEL_PATH, enroll.MANIFEST_PATH)
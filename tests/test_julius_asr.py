@@ -0,0 +1,134 @@
+"""
+Julius の認識キュー（件数上限・期限）と、代役の Julius（fake_julius.py）との受け答えの確認
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import julius_asr
+
+
+def test_submit_rejects_when_queue_is_full_and_frees_slots():
+    engine = julius_asr.JuliusEngine(max_pending=2)
+    release = threading.Event()
+    engine.recognize = lambda signal, deadline=None: release.wait(10) and {"text": "はい"}
+    try:
+        futures = [engine.submit(np.zeros(160, np.float32), timeout=10) for _ in range(2)]
+        with pytest.raises(julius_asr.AsrBusy):
+            engine.submit(np.zeros(160, np.float32), timeout=10)
+        release.set()
+        assert [f.result(10)["text"] for f in futures] == ["はい", "はい"]
+        # 終わった分の枠は空く
+        assert engine.submit(np.zeros(160, np.float32), timeout=10).result(10)["text"] == "はい"
+    finally:
+        release.set()
+        engine.close()
+
+
+def test_cancelled_job_frees_its_slot():
+    engine = julius_asr.JuliusEngine(max_pending=2)
+    release = threading.Event()
+    engine.recognize = lambda signal, deadline=None: release.wait(10) and {"text": ""}
+    try:
+        running = engine.submit(np.zeros(160, np.float32), timeout=10)
+        waiting = engine.submit(np.zeros(160, np.float32), timeout=10)
+        # 呼び出し側がタイムアウトして待ちをやめたら、始まっていない認識は捨てられる
+        assert waiting.cancel()
+        engine.submit(np.zeros(160, np.float32), timeout=10)
+        release.set()
+        running.result(10)
+    finally:
+        release.set()
+        engine.close()
+
+
+def test_recognize_gives_up_when_deadline_passes_while_waiting():
+    engine = julius_asr.JuliusEngine()
+    started = []
+    engine.start = lambda: started.append(True)
+    errors = []
+
+    def waiter():
+        try:
+            engine.recognize(np.zeros(160, np.float32), deadline=time.monotonic() + 0.2)
+        except TimeoutError as e:
+            errors.append(e)
+
+    # 前の認識がロックを持ったままの間に期限が来たら、認識を始めずに諦める
+    with engine._lock:
+        begin = time.monotonic()
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(5)
+    assert len(errors) == 1
+    assert time.monotonic() - begin < 2
+    assert started == []
+
+
+def test_ports_are_chosen_when_not_fixed(monkeypatch):
+    commands = []
+
+    def fake_popen(cmd, **kwargs):
+        commands.append(cmd)
+        raise OSError("起動しない")
+
+    monkeypatch.setattr(julius_asr.subprocess, "Popen", fake_popen)
+    engine = julius_asr.JuliusEngine(module_port=0, adin_port=0)
+    with pytest.raises(OSError):
+        engine.start()
+    fixed = julius_asr.JuliusEngine(module_port=10500, adin_port=5530)
+    with pytest.raises(OSError):
+        fixed.start()
+
+    auto, pinned = commands
+    assert int(auto[auto.index('-module') + 1]) > 0
+    assert int(auto[auto.index('-adport') + 1]) > 0
+    assert pinned[pinned.index('-module') + 1] == "10500"
+    assert pinned[pinned.index('-adport') + 1] == "5530"
+
+
+FAKE_JULIUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_julius.py")
+
+
+@pytest.fixture
+def engine():
+    engine = julius_asr.JuliusEngine(jconf="unused.jconf", cmd=FAKE_JULIUS, timeout=5)
+    yield engine
+    engine.close()
+
+
+def seconds(value):
+    return np.full(int(16000 * value), 0.1, dtype=np.float32)
+
+
+def test_recognize_parses_result_from_julius(engine):
+    result = engine.recognize(seconds(1.5))
+    assert result == {"text": "電気つけて", "words": ["電気", "つけて"], "confidence": [0.9, 0.8],
+                      "score": -48000.0}
+    # 空の発話は RECOGFAIL（結果なし）
+    assert engine.recognize(np.zeros(0, dtype=np.float32))["text"] == ""
+    assert engine.restarts == 0
+
+
+def test_recognize_restarts_julius_after_it_dies(engine):
+    engine.recognize(seconds(0.5))
+    engine._proc.kill()
+    engine._proc.wait(5)
+    assert engine.recognize(seconds(0.5))["score"] == -16000.0
+    assert engine.restarts == 1
+
+
+def test_deadline_does_not_restart_julius_and_late_result_is_discarded(engine):
+    engine.start()
+    pid = engine._proc.pid
+    with pytest.raises(TimeoutError):
+        engine.recognize(seconds(2.0), deadline=time.monotonic() + 0.3)
+    # 期限切れは Julius の故障ではない
+    assert engine._proc.pid == pid and engine.is_alive()
+    assert engine.restarts == 0
+    # 遅れて届いた前の発話の結果（-64000）を次の発話の結果として返さない
+    assert engine.recognize(seconds(0.5), deadline=time.monotonic() + 5)["score"] == -16000.0
+    assert engine.restarts == 0
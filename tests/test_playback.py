@@ -0,0 +1,138 @@
+"""
+再生サービス（PlaybackService）の順番・先読み合成・バージインの確認（音声デバイス・Open JTalk は使わない）
+"""
+import threading
+import time
+
+import pytest
+
+import tts
+
+
+class GateSink(tts.NullSink):
+    """再生中の文を gate が開く（または stop() される）まで止めておく NullSink"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.playing = threading.Event()
+
+    def play(self, stream, wav):
+        super().play(stream, wav)
+        self.playing.set()
+        while not (self.gate.is_set() or stream.is_set()):
+            stream.wait(0.01)
+
+    def texts(self):
+        return [wav.decode("utf-8") for wav in self.played]
+
+
+class StubSynth:
+    """text -> text のバイト列。blocked に入れた文は release されるまで合成が終わらない"""
+
+    def __init__(self, blocked=(), failing=()):
+        self.blocked = {text: threading.Event() for text in blocked}
+        self.failing = set(failing)
+        self.started = {}
+
+    def __call__(self, text):
+        self.started[text] = time.monotonic()
+        if text in self.blocked:
+            assert self.blocked[text].wait(10)
+        if text in self.failing:
+            raise RuntimeError("合成に失敗しました")
+        return text.encode("utf-8")
+
+    def release(self, text):
+        self.blocked[text].set()
+
+
+@pytest.fixture
+def sink():
+    return GateSink()
+
+
+def make_player(synth, sink):
+    return tts.PlaybackService(synth, sink=sink, workers=2)
+
+
+def test_speak_returns_before_synthesis_finishes(sink, monkeypatch):
+    synth = StubSynth(blocked=["おはよう"])
+    player = make_player(synth, sink)
+    monkeypatch.setattr(tts, "get_player", lambda: player)
+    sink.gate.set()
+    try:
+        begin = time.monotonic()
+        handle = tts.speak("おはよう")
+        assert time.monotonic() - begin < 0.5
+        assert not handle.done
+        synth.release("おはよう")
+        assert handle.wait(5) and handle.state == "done"
+    finally:
+        player.close()
+
+
+def test_playback_keeps_submission_order(sink):
+    # 1文目の合成が2文目より後に終わっても、再生は積んだ順
+    synth = StubSynth(blocked=["一つ目"])
+    player = make_player(synth, sink)
+    sink.gate.set()
+    try:
+        first, second = player.say("一つ目"), player.say("二つ目")
+        time.sleep(0.1)
+        assert sink.played == []
+        synth.release("一つ目")
+        assert first.wait(5) and second.wait(5)
+        assert sink.texts() == ["一つ目", "二つ目"]
+    finally:
+        player.close()
+
+
+def test_next_sentence_is_synthesized_while_current_plays(sink):
+    synth = StubSynth()
+    player = make_player(synth, sink)
+    try:
+        first = player.say("一つ目")
+        assert sink.playing.wait(5)
+        second = player.say("二つ目")
+        deadline = time.monotonic() + 5
+        while "二つ目" not in synth.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # 1文目の再生中に2文目の合成が済んでいる
+        assert "二つ目" in synth.started
+        assert first.state == "playing" and not second.done
+        sink.gate.set()
+        assert second.wait(5) and sink.texts() == ["一つ目", "二つ目"]
+    finally:
+        player.close()
+
+
+def test_interrupt_cancels_playing_and_queued_sentences(sink):
+    synth = StubSynth()
+    player = make_player(synth, sink)
+    try:
+        playing = player.say("一つ目")
+        assert sink.playing.wait(5)
+        queued = [player.say("二つ目"), player.say("三つ目")]
+        barge_in = player.say("はい、なんでしょう", interrupt=True)
+        sink.gate.set()
+        assert barge_in.wait(5) and barge_in.state == "done"
+        assert playing.state == "cancelled"
+        assert [handle.state for handle in queued] == ["cancelled", "cancelled"]
+        assert sink.texts() == ["一つ目", "はい、なんでしょう"]
+        assert player.pending() == 0
+    finally:
+        player.close()
+
+
+def test_synthesis_failure_does_not_stall_queue(sink):
+    synth = StubSynth(failing=["壊れた文"])
+    player = make_player(synth, sink)
+    sink.gate.set()
+    try:
+        broken, following = player.say("壊れた文"), player.say("次の文")
+        assert following.wait(5) and following.state == "done"
+        assert broken.state == "failed" and "合成に失敗" in broken.error
+        assert sink.texts() == ["次の文"]
+    finally:
+        player.close()
@@ -0,0 +1,58 @@
+"""
+本番の設定（gunicorn.conf.py・PRELOAD_MODEL=1）でワーカー2つを fork し、
+各ワーカーがマスターで読み込んだエンコーダーの重みを共有していることの確認
+
+gunicorn の代わりに memory_report.py --simulate が gunicorn.conf.py のフックを同じ順に呼ぶ
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 重み（pretrained_models/ecapa）がない環境では、同じ構造の乱数初期化モデルで代用する
+DRIVER = """
+import os
+import sys
+
+import torch
+import identify
+import memory_report
+from encoder_modes import optimize_encoder
+
+
+class RandomEcapa:
+    def __init__(self):
+        from speechbrain.lobes.features import Fbank
+        from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
+        from speechbrain.processing.features import InputNormalization
+        torch.manual_seed(0)
+        self.mods = torch.nn.ModuleDict({
+            "compute_features": Fbank(n_mels=80),
+            "mean_var_norm": InputNormalization(norm_type="sentence", std_norm=False),
+            "embedding_model": ECAPA_TDNN(80, channels=[1024, 1024, 1024, 1024, 3072], lin_neurons=192),
+        }).eval()
+
+    @torch.no_grad()
+    def encode_batch(self, wavs, wav_lens=None):
+        if wav_lens is None:
+            wav_lens = torch.ones(wavs.shape[0])
+        feats = self.mods.mean_var_norm(self.mods.compute_features(wavs), wav_lens)
+        return self.mods.embedding_model(feats, wav_lens)
+
+
+if not os.path.exists(os.path.join(identify.ECAPA_SAVEDIR, "embedding_model.ckpt")):
+    identify.load_ecapa_classifier = lambda mode=identify.ECAPA_MODE: optimize_encoder(RandomEcapa(), mode)
+sys.exit(memory_report.main(["--simulate", "2", "--mode", "preload", "--check", "--seconds", "2"]))
+"""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="/proc/<pid>/smaps_rollup が必要（Linux）")
+def test_preloaded_workers_share_encoder_weights():
+    env = dict(os.environ, PYTHONPATH=ROOT, LOG_LEVEL="WARNING")
+    result = subprocess.run([sys.executable, "-c", DRIVER], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.count("✅ ワーカー") == 2
@@ -0,0 +1,77 @@
+"""
+段階的な識別（identify_progressive）の打ち切り条件と embeddingキャッシュの扱いの確認
+"""
+import numpy as np
+import torch
+
+import identify
+
+
+def fake_scores(margins, others=("child",)):
+    """embedding（= 長さ）ごとに parent と他の話者（others）の類似度の差を返す score_embedding"""
+    def score_embedding(embedding):
+        margin = margins[int(embedding)]
+        scores = {"parent": 0.5 + margin, **{speaker: 0.5 for speaker in others}}
+        exp = np.exp(list(scores.values()))
+        probs = dict(zip(scores, exp / exp.sum()))
+        return "parent", probs, scores, None
+    return score_embedding
+
+
+def test_exits_on_margin_and_caches_only_full_signal(monkeypatch):
+    signal = np.zeros(48000, dtype=np.float32)
+    monkeypatch.setattr(identify, "score_embedding", fake_scores({12000: 0.05, 24000: 0.3, 48000: 0.3}))
+    calls = []
+
+    def embed(part, cache=True):
+        calls.append((len(part), cache))
+        return len(part)
+
+    label, _, used = identify.identify_progressive(signal, prefixes=(0.75, 1.5), min_margin=0.2, embed=embed)
+    assert (label, used) == ("parent", 1.5)
+    assert calls == [(12000, False), (24000, False)]
+
+    calls.clear()
+    monkeypatch.setattr(identify, "score_embedding", fake_scores({12000: 0.05, 24000: 0.1, 48000: 0.1}))
+    assert identify.identify_progressive(signal, prefixes=(0.75, 1.5), min_margin=0.2, embed=embed)[2] == 3.0
+    assert calls == [(12000, False), (24000, False), (48000, True)]
+
+
+def test_three_speakers_need_confidence_as_well_as_margin(monkeypatch):
+    signal = np.zeros(48000, dtype=np.float32)
+    embed = lambda part, cache=True: len(part)
+    # 2位・3位が同点だと、差 0.3 でも1位の確信度は 1 / (1 + 2e^-0.3) ≒ 0.43
+    monkeypatch.setattr(identify, "score_embedding",
+                        fake_scores({12000: 0.3, 24000: 1.0, 48000: 1.0}, others=("child", "grandma")))
+    label, probs, used = identify.identify_progressive(signal, prefixes=(0.75, 1.5), min_confidence=0.55,
+                                                       min_margin=0.2, embed=embed)
+    assert (label, used) == ("parent", 1.5)
+    assert probs["parent"] > 0.55
+
+
+class FakeCache:
+    def __init__(self):
+        self.stored = {}
+
+    def key_for(self, signal):
+        return str(len(signal))
+
+    def get(self, key):
+        return self.stored.get(key)
+
+    def put(self, key, embedding):
+        self.stored[key] = embedding
+
+
+def test_uncached_embedding_is_not_stored(monkeypatch):
+    cache = FakeCache()
+    monkeypatch.setattr(identify, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(identify, "ECAPA_MAX_BATCH", 1)
+    monkeypatch.setattr(identify, "get_ecapa_classifier", lambda: None)
+    monkeypatch.setattr(identify, "encode", lambda classifier, batch: torch.ones(1, 1, 4))
+
+    identify.get_embedding_from_signal(np.zeros(8000, dtype=np.float32), cache=False)
+    assert cache.stored == {}
+    identify.get_embedding_from_signal(np.zeros(16000, dtype=np.float32))
+    assert list(cache.stored) == ["16000"]
+
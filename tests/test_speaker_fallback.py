@@ -0,0 +1,51 @@
+"""
+ECAPA-TDNN が使えないときに GMM・キーワード判定へフォールバックすることの確認
+"""
+from types import SimpleNamespace
+
+from warmup import Warmup
+
+
+def test_degraded_warmup_does_not_retry_encoder(app_module, monkeypatch):
+    calls = []
+
+    def load_encoder():
+        calls.append("encoder")
+        raise RuntimeError("モデルをダウンロードできません")
+
+    warmup = Warmup([("import", lambda: None), ("encoder", load_encoder)]).run()
+    assert warmup.state == "degraded"
+    identify = SimpleNamespace(SPEAKER_MODEL_PATH=__file__, PROGRESSIVE_ENABLED=False,
+                               identify_signal=lambda signal, embed=None: load_encoder())
+    monkeypatch.setattr(app_module, "warmup", warmup)
+    monkeypatch.setattr(app_module, "speaker_id", identify)
+
+    assert app_module.get_speaker_id() is None
+    # GMM で判定しきれない発話でも ECAPA-TDNN を読み込み直さない
+    assert app_module.escalate_to_ecapa([0.0] * 16000) is None
+    assert calls == ["encoder"]
+
+
+def test_ready_warmup_returns_identify(app_module, monkeypatch):
+    warmup = Warmup([("import", lambda: None)]).run()
+    monkeypatch.setattr(app_module, "warmup", warmup)
+    monkeypatch.setattr(app_module, "speaker_id", object())
+    assert app_module.get_speaker_id() is app_module.speaker_id
+
+
+class FakeScorer:
+    def score(self, signal):
+        return "parent", {"parent": 0.55, "child": 0.45}, 0.1, None
+
+
+def test_cascade_keeps_gmm_result_when_ecapa_fails(monkeypatch):
+    import speaker_cascade
+    monkeypatch.setattr(speaker_cascade, "CASCADE_ENABLED", True)
+    monkeypatch.setattr(speaker_cascade, "get_gmm_scorer", lambda: FakeScorer())
+
+    def escalate(signal):
+        raise RuntimeError("推論ワーカーが落ちました")
+
+    label, probs, tier, margin = speaker_cascade.identify_cascade([0.0] * 16000, escalate=escalate, margin=1.0)
+    assert (label, tier, margin) == ("parent", "GMM", 0.1)
+    assert probs == {"parent": 0.55, "child": 0.45}
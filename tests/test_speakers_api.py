@@ -0,0 +1,84 @@
+"""
+POST /api/speakers/<speaker> が推論プールでデコード・embedding を行うことの確認
+"""
+import io
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from inference_pool import InferencePool, Overloaded
+
+
+class FakePool:
+    """段ごとの呼び出しを記録し、デコードはこのプロセスで実行して embedding は固定値を返す"""
+
+    def __init__(self, overloaded=False):
+        self.calls = []
+        self.overloaded = overloaded
+
+    def run(self, stage, fn, *args, timeout=None):
+        if self.overloaded:
+            raise Overloaded("推論プールが混雑しています")
+        self.calls.append((stage, fn.__name__, threading.current_thread().name))
+        if stage == "embedding":
+            return [np.full(4, len(signal), dtype=np.float32) for signal in args[0]]
+        return fn(*args)
+
+
+def pcm(seconds):
+    return (np.ones(int(16000 * seconds), dtype=np.int16) * 1000).tobytes()
+
+
+def fake_identify(enrolled):
+    def get_embeddings_from_signals(signals):
+        raise AssertionError("推論プールがあるときはリクエストのスレッドで embedding を計算しない")
+
+    def enroll_speaker(speaker, embeddings):
+        enrolled.append((speaker, embeddings))
+        return {speaker: len(embeddings)}
+
+    return SimpleNamespace(get_embeddings_from_signals=get_embeddings_from_signals,
+                           enroll_speaker=enroll_speaker)
+
+
+def test_enrollment_runs_in_inference_pool(app_module, monkeypatch):
+    enrolled = []
+    pool = FakePool()
+    monkeypatch.setattr(app_module, "inference_pool", pool)
+    monkeypatch.setattr(app_module, "get_speaker_id", lambda timeout=None: fake_identify(enrolled))
+
+    client = app_module.app.test_client()
+    response = client.post('/api/speakers/parent', data={
+        "audio": [(io.BytesIO(pcm(1.0)), "a.pcm"), (io.BytesIO(pcm(2.0)), "b.pcm")]
+    }, content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    assert [(stage, name) for stage, name, _ in pool.calls] == [
+        ("decode", "decode_items_job"), ("embedding", "embed_batch_job")]
+    speaker, embeddings = enrolled[0]
+    # 登録用の音声は長さの上限で切り詰めない
+    assert speaker == "parent" and embeddings[:, 0].tolist() == [16000, 32000]
+
+
+def test_enrollment_returns_503_when_pool_is_full(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "inference_pool", FakePool(overloaded=True))
+    monkeypatch.setattr(app_module, "get_speaker_id", lambda timeout=None: fake_identify([]))
+    response = app_module.app.test_client().post('/api/speakers/parent', data={
+        "audio": [(io.BytesIO(pcm(1.0)), "a.pcm")]
+    }, content_type="multipart/form-data")
+    assert response.status_code == 503
+
+
+def test_pool_does_not_fork_from_threaded_process():
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, daemon=True)
+    thread.start()
+    pool = InferencePool(workers=1, start_method="fork", preload=False)
+    try:
+        pool._get_executor()
+        assert pool.stats()["start_method"] == "spawn"
+        assert pool.preload
+    finally:
+        stop.set()
+        pool.shutdown()
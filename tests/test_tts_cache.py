@@ -0,0 +1,116 @@
+"""
+TTSのディスクキャッシュを複数のプロセスで共有したときに、エントリーが失われたり壊れたりしないことの確認
+"""
+import multiprocessing
+import threading
+
+import tts
+
+
+def fake_synthesize(text, voice=None):
+    return f"RIFF:{text}".encode("utf-8") * 50
+
+
+def _store_texts(cache_dir, prefix, count, start):
+    cache = tts.TtsCache(cache_dir=cache_dir, synthesize_fn=fake_synthesize)
+    start.wait()
+    for i in range(count):
+        cache.get_or_synthesize(f"{prefix}-{i}")
+
+
+def test_processes_sharing_cache_dir_keep_all_entries(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    start = ctx.Barrier(3)
+    workers = [ctx.Process(target=_store_texts, args=(str(tmp_path), prefix, 40, start))
+               for prefix in ("a", "b", "c")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    # 再起動後のプロセスから全プロセスの追加分が正しい内容で読める
+    cache = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    assert cache.stats()["entries"] == 120
+    for prefix in ("a", "b", "c"):
+        for i in range(40):
+            text = f"{prefix}-{i}"
+            assert bytes(cache.get(text)) == fake_synthesize(text)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_refresh_picks_up_entries_from_other_instance(tmp_path):
+    first = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    second = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    first.get_or_synthesize("こんにちは")
+
+    calls = []
+    second.synthesize_fn = lambda text, voice=None: calls.append(text) or fake_synthesize(text)
+    assert bytes(second.get_or_synthesize("こんにちは")) == fake_synthesize("こんにちは")
+    assert calls == []
+
+    # 後から書いた側がもう一方の追加分を消さない
+    second.get_or_synthesize("おはよう")
+    first.get_or_synthesize("こんばんは")
+    reloaded = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    assert reloaded.stats()["entries"] == 3
+
+
+def test_prerender_runs_in_one_process_only(tmp_path):
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_synthesize(text, voice=None):
+        entered.set()
+        release.wait(10)
+        return fake_synthesize(text)
+
+    first = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=slow_synthesize)
+    second = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(first.prerender(["はい", "いいえ"])))
+    thread.start()
+    assert entered.wait(10)
+    # flock はファイルを開き直すごとに別のロックなので、同じプロセス内でも他のプロセスと同様に弾かれる
+    assert second.prerender(["はい", "いいえ"]) == 0
+    release.set()
+    thread.join(10)
+    assert result == [2]
+    second.refresh()
+    assert "はい" in second and "いいえ" in second
+
+
+def test_text_for_finds_key_registered_by_other_worker(tmp_path):
+    worker_a = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    calls = []
+    worker_b = tts.TtsCache(cache_dir=str(tmp_path),
+                            synthesize_fn=lambda text, voice=None: calls.append(text) or fake_synthesize(text))
+
+    # ワーカーA が事前合成・登録したキーへのリクエストがワーカーB に届く
+    worker_a.prerender(["承知しました。"])
+    key = worker_a.register("承知しました。")
+    assert worker_b.text_for(key) == "承知しました。"
+    assert bytes(worker_b.get_encoded("承知しました。", "wav")) == fake_synthesize("承知しました。")
+    assert calls == []
+    assert worker_b.text_for("0" * 32) is None
+
+
+def test_index_entries_are_published_after_remap(tmp_path, monkeypatch):
+    """get() はロックなしで読むため、インデックスに載った時点で mmap がそのエントリーを含んでいること"""
+    writer = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    reader = tts.TtsCache(cache_dir=str(tmp_path), synthesize_fn=fake_synthesize)
+    violations = []
+    original = tts.TtsCache._remap
+
+    def checked_remap(self):
+        # mmap し直す直前のインデックスは、すべて今の mmap に収まっていなければならない
+        size = len(self._mmap) if self._mmap is not None else 0
+        violations.extend(k for k, (offset, length, _) in self._index.items() if offset + length > size)
+        original(self)
+
+    monkeypatch.setattr(tts.TtsCache, "_remap", checked_remap)
+    for i in range(5):
+        writer.get_or_synthesize(f"文{i}")
+        reader.refresh()
+    assert violations == []
+    assert bytes(reader.get("文4")) == fake_synthesize("文4")
@@ -0,0 +1,39 @@
+"""
+/ws/command のセッションIDの扱いの確認（HTTP の API と同じく不正なIDはエラー）
+"""
+import json
+
+
+class FakeWebSocket:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    def receive(self):
+        return self.messages.pop(0)
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_invalid_query_session_id_is_rejected(app_module):
+    ws = FakeWebSocket([json.dumps({"type": "end", "text": "電気つけて"})])
+    with app_module.app.test_request_context('/ws/command?session_id=bad%20id!'):
+        app_module.ws_command(ws)
+    assert ws.sent == [{"error": "session_id が不正です"}]
+    # 既定のセッションで処理していない
+    assert len(ws.messages) == 1
+
+
+def test_invalid_start_session_id_is_rejected(app_module):
+    ws = FakeWebSocket([json.dumps({"type": "start", "format": "pcm16", "session_id": "../x"})])
+    with app_module.app.test_request_context('/ws/command'):
+        app_module.ws_command(ws)
+    assert ws.sent == [{"error": "session_id が不正です"}]
+
+
+def test_query_session_id_is_used(app_module):
+    ws = FakeWebSocket([json.dumps({"type": "end", "text": "電気つけて"})])
+    with app_module.app.test_request_context('/ws/command?session_id=kitchen-1'):
+        app_module.ws_command(ws)
+    assert ws.sent[0]["session_id"] == "kitchen-1"
@@ -1,30 +1,596 @@
 # tts.py
-import subprocess
+"""
+Open JTalk 音声合成
+応答文はほぼ決まった組み合わせなので、合成したWAVをキャッシュしておき、
+2回目以降は open_jtalk を起動せずにそのまま再生する
+
+speak() は再生キューに積むだけですぐに戻る（合成はワーカープール、再生は1本のスレッドで順番に行う）
+
+応答の語彙をまとめて事前合成する場合:
+    python3 tts.py --prerender
+"""
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import io
+import itertools
+import json
+import logging
+import mmap
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
 import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Open JTalkの設定（パスは環境に合わせて確認してください）
+DIC_PATH = os.environ.get("OPEN_JTALK_DIC", "/var/lib/mecab/dic/open-jtalk/naist-jdic")
+VOICE_PATH = os.environ.get("OPEN_JTALK_VOICE", "/usr/share/hts-voice/mei/mei_normal.htsvoice")
+SPEED = float(os.environ.get("OPEN_JTALK_SPEED", "1.0"))
+
+# 合成済みWAVの保存先（TTS_CACHE_DISK=0 でメモリのみ）
+TTS_CACHE_DIR = "pretrained_models/tts_cache"
+TTS_CACHE_DISK = os.environ.get("TTS_CACHE_DISK", "1") == "1"
+
+# 再生中の文と並行して次の文を合成するワーカー数
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "2"))
+
+# ブラウザ配信用のエンコード形式 → (soundfile の format, subtype, Content-Type)
+AUDIO_FORMATS = {
+    "wav": (None, None, "audio/wav"),
+    "opus": ("OGG", "OPUS", "audio/ogg; codecs=opus")
+}
+
+_cache = None
+_player = None
+_cache_lock = threading.Lock()
+
+
+def voice_params():
+    """合成に使う声のパラメータ（キャッシュのキーにも含める）"""
+    return {"dic": DIC_PATH, "voice": VOICE_PATH, "speed": SPEED}
+
+
+def is_available():
+    """open_jtalk が使えるかどうか"""
+    return shutil.which("open_jtalk") is not None
+
+
+def synthesize(text, voice=None):
+    """
+    open_jtalk でテキストを合成し、WAVのバイト列を返す
+    出力は呼び出しごとの一時ファイルに書くので、並行して呼んでも衝突しない
+    """
+    voice = voice or voice_params()
+    fd, path = tempfile.mkstemp(prefix="tts_", suffix=".wav")
+    os.close(fd)
+    try:
+        cmd = [
+            'open_jtalk',
+            '-x', voice["dic"],
+            '-m', voice["voice"],
+            '-r', str(voice["speed"]),
+            '-ow', path
+        ]
+        p = subprocess.run(cmd, input=text.encode('utf-8'), stderr=subprocess.PIPE)
+        if p.returncode != 0:
+            raise RuntimeError(f"open_jtalk 合成失敗: {p.stderr.decode('utf-8', 'replace').strip()}")
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def encode_audio(wav, fmt):
+    """合成したWAVを配信用の形式に変換（opus は 48kHz の Ogg/Opus）"""
+    sf_format, subtype, _ = AUDIO_FORMATS[fmt]
+    if sf_format is None:
+        return bytes(wav)
+    import soundfile as sf
+    signal, sr = sf.read(io.BytesIO(bytes(wav)), dtype='float32')
+    if sr not in (8000, 12000, 16000, 24000, 48000):
+        import librosa
+        signal, sr = librosa.resample(signal, orig_sr=sr, target_sr=48000), 48000
+    out = io.BytesIO()
+    sf.write(out, signal, sr, format=sf_format, subtype=subtype)
+    return out.getvalue()
+
+
+class TtsCache:
+    """
+    合成済みWAVのキャッシュ（キー = テキスト + 声のパラメータ）
+
+    cache_dir を指定すると、WAVを1つのデータファイルに追記して mmap で参照する
+    （再起動後も合成し直さずに使える。インデックスは JSON で保存）
+    cache_dir が None の場合はメモリ上にだけ保持する（プロセス間で共有しないため、複数ワーカーでは
+    /api/tts/<キー> が別のワーカーに届くと見つからない）
+
+    同じ cache_dir を複数のプロセス（gunicorn のワーカーなど）で共有できる
+    追記とインデックスの書き換えはロックファイル（flock）で排他し、
+    書き換え時はディスク上のインデックスに自分の追加分をマージする
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, voice=None, synthesize_fn=synthesize):
+        self.voice = voice or voice_params()
+        self.synthesize_fn = synthesize_fn
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}      # key -> [offset, length, text]（ディスク）
+        self._memory = {}     # key -> bytes（メモリのみの場合）
+        self._texts = {}      # key -> text（register() で配信用に登録した文）
+        self._encoded = {}    # (key, 形式) -> 変換済みの音声
+        self._mmap = None
+        self._prefetcher = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._data_path = os.path.join(cache_dir, "tts_cache.bin")
+            self._index_path = os.path.join(cache_dir, "tts_cache.json")
+            self._lock_path = os.path.join(cache_dir, "tts_cache.lock")
+            self._load()
+
+    def key_for(self, text):
+        """テキストと声のパラメータからキーを作る"""
+        payload = json.dumps([text, self.voice], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive=True):
+        """他のプロセスとの排他（exclusive=False なら読み込み用の共有ロック）"""
+        with open(self._lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_index(self):
+        """
+        ディスク上のインデックス（ロックを持った状態で呼ぶ）
+        書き込み途中で終了した場合など、データファイルに収まらないエントリーは捨てる
+        """
+        if not os.path.exists(self._index_path) or not os.path.exists(self._data_path):
+            return {}
+        try:
+            with open(self._index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️  TTSキャッシュのインデックスを読み込めません: {e}")
+            return {}
+        size = os.path.getsize(self._data_path)
+        return {k: v for k, v in index.items() if v[0] + v[1] <= size}
+
+    def _load(self):
+        """保存済みのインデックスを読み込み、データファイルを mmap する"""
+        with self._file_lock(exclusive=False):
+            self._publish(self._read_index())
+        if self._index:
+            logger.info(f"✅ TTSキャッシュを読み込み: {len(self._index)}件")
+
+    def refresh(self):
+        """他のプロセスが追加したエントリーを取り込む（メモリのみの場合は何もしない）"""
+        if not self.cache_dir:
+            return
+        with self._lock, self._file_lock(exclusive=False):
+            index = self._read_index()
+            if index.keys() - self._index.keys():
+                self._publish(index)
+
+    def _publish(self, index):
+        """
+        データファイルを mmap し直してから、新しいエントリーをインデックスに加える
+        （get() はロックを取らずに読むため、古い小さい mmap から新しいエントリーを切り出さないようにする）
+        """
+        self._remap()
+        merged = dict(self._index)
+        merged.update(index)
+        self._index = merged
+
+    def _remap(self):
+        if not os.path.exists(self._data_path) or os.path.getsize(self._data_path) == 0:
+            return
+        with open(self._data_path, 'rb') as f:
+            # 古い mmap は参照中の memoryview がなくなった時点で解放される
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _store(self, rendered):
+        """合成結果 [(key, text, wav), ...] を追加"""
+        if not self.cache_dir:
+            for key, _, wav in rendered:
+                self._memory[key] = bytes(wav)
+            return
+        with self._file_lock():
+            # 他のプロセスが追加した分を先に取り込み、まだないものだけを末尾に追記する
+            index = dict(self._index)
+            index.update(self._read_index())
+            with open(self._data_path, 'ab') as f:
+                offset = os.fstat(f.fileno()).st_size
+                for key, text, wav in rendered:
+                    if key in index:
+                        continue
+                    f.write(wav)
+                    index[key] = [offset, len(wav), text]
+                    offset += len(wav)
+            tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+            self._publish(index)
+
+    def get(self, text):
+        """キャッシュ済みのWAV（memoryview / bytes）、なければ None"""
+        key = self.key_for(text)
+        if not self.cache_dir:
+            return self._memory.get(key)
+        # インデックスは mmap し直した後に入れ替わるので、インデックス → mmap の順に読めば範囲内に収まる
+        entry = self._index.get(key)
+        if entry is None or self._mmap is None:
+            return None
+        offset, length, _ = entry
+        return memoryview(self._mmap)[offset:offset + length]
+
+    def __contains__(self, text):
+        key = self.key_for(text)
+        return key in (self._index if self.cache_dir else self._memory)
+
+    def get_or_synthesize(self, text):
+        """キャッシュにあればそのまま返し、なければ（他のプロセスの追加分も確認してから）合成して追加"""
+        wav = self.get(text)
+        if wav is None and self.cache_dir:
+            self.refresh()
+            wav = self.get(text)
+        if wav is not None:
+            self.hits += 1
+            return wav
+        self.misses += 1
+        wav = self.synthesize_fn(text, self.voice)
+        with self._lock:
+            if text not in self:
+                self._store([(self.key_for(text), text, wav)])
+        return self.get(text)
+
+    def register(self, text):
+        """
+        配信用に文を登録してキーを返す（/api/tts/<キー> で取得できるようになる）
+        まだ合成されていなければバックグラウンドで合成・変換を始めておく
+        """
+        key = self.key_for(text)
+        self._texts[key] = text
+        if text not in self:
+            with self._lock:
+                if self._prefetcher is None:
+                    self._prefetcher = ThreadPoolExecutor(max_workers=max(1, TTS_WORKERS),
+                                                          thread_name_prefix="tts-prefetch")
+            # ブラウザはほぼ Ogg/Opus を要求するので、変換まで済ませておく
+            self._prefetcher.submit(self.get_encoded, text, "opus")
+        return key
+
+    def text_for(self, key):
+        """
+        キーに対応する文（未登録なら None）
+        他のプロセス（gunicorn の別のワーカー）が登録・合成した文は、ディスクのインデックスを読み直して探す
+        （メモリのみの場合は、登録したプロセスでしか見つからない）
+        """
+        text = self._texts.get(key)
+        if text is not None or not self.cache_dir:
+            return text
+        if key not in self._index:
+            self.refresh()
+        entry = self._index.get(key)
+        return entry[2] if entry is not None else None
+
+    def get_encoded(self, text, fmt="wav"):
+        """配信用の形式に変換した音声（変換結果もメモリにキャッシュ）"""
+        wav = self.get_or_synthesize(text)
+        if AUDIO_FORMATS[fmt][0] is None:
+            return wav
+        key = (self.key_for(text), fmt)
+        data = self._encoded.get(key)
+        if data is None:
+            data = self._encoded[key] = encode_audio(wav, fmt)
+        return data
+
+    def prerender(self, texts, workers=4):
+        """
+        未合成のテキストをまとめて合成（open_jtalk を並列に起動）
+        ディスクキャッシュを共有する他のプロセスが事前合成中なら何もしない（1プロセスだけが合成する）
 
-def speak(text):
-    print(f"System: {text}") # ログ確認用
+        Returns:
+            int: 新たに合成した件数
+        """
+        if not self.cache_dir:
+            return self._prerender(texts, workers)
+        with open(os.path.join(self.cache_dir, "prerender.lock"), 'a') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("🔊 応答音声の事前合成は他のプロセスが実行中です")
+                return 0
+            try:
+                self.refresh()
+                return self._prerender(texts, workers)
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
-    # Open JTalkの設定（パスは環境に合わせて確認してください）
-    dic_path = "/var/lib/mecab/dic/open-jtalk/naist-jdic"
-    voice_path = "/usr/share/hts-voice/mei/mei_normal.htsvoice"
-    output_file = "output.wav"
+    def _prerender(self, texts, workers):
+        missing = sorted({t for t in texts if t and t not in self})
+        if not missing:
+            return 0
+        start = time.perf_counter()
+        rendered = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {text: executor.submit(self.synthesize_fn, text, self.voice) for text in missing}
+            for text, future in futures.items():
+                try:
+                    rendered.append((self.key_for(text), text, future.result()))
+                except Exception as e:
+                    logger.error(f"❌ 事前合成エラー ({text}): {e}")
+        with self._lock:
+            self._store([r for r in rendered if r[1] not in self])
+        logger.info(f"🔊 応答音声を事前合成: {len(rendered)}件 ({time.perf_counter() - start:.1f}秒)")
+        return len(rendered)
 
-    # 音声生成
-    cmd = [
-        'open_jtalk',
-        '-x', dic_path,
-        '-m', voice_path,
-        '-ow', output_file
-    ]
+    def stats(self):
+        """キャッシュ件数とヒット/ミス統計"""
+        entries = len(self._index) if self.cache_dir else len(self._memory)
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "disk": bool(self.cache_dir)
+        }
 
-    p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
-    p.communicate(text.encode('utf-8'))
-    p.wait()
 
-    # 再生 (aplayを使用)
-    subprocess.run(['aplay', '-q', output_file])
+def get_tts_cache():
+    """TTSキャッシュを遅延生成"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TtsCache(TTS_CACHE_DIR if TTS_CACHE_DISK else None)
+    return _cache
+
+
+class AplaySink:
+    """aplay で再生する出力先（WAVは標準入力から渡す）"""
+
+    def open(self):
+        return subprocess.Popen(['aplay', '-q', '-'], stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def play(self, stream, wav):
+        """再生が終わるまで（または stop() されるまで）待つ"""
+        try:
+            stream.communicate(wav)
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def stop(self, stream):
+        stream.kill()
+
+
+class NullSink:
+    """
+    何も再生しない出力先（テスト・音声デバイスのない環境用）
+    realtime=True の場合はWAVの長さだけ待つ
+    """
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.played = []
+
+    def open(self):
+        return threading.Event()
+
+    def play(self, stream, wav):
+        self.played.append(bytes(wav))
+        if self.realtime:
+            with wave.open(io.BytesIO(bytes(wav))) as w:
+                stream.wait(w.getnframes() / w.getframerate())
+
+    def stop(self, stream):
+        stream.set()
+
+
+class PlaybackHandle:
+    """
+    再生キューに積んだ1文の状態
+    state: queued → synthesizing → playing → done / cancelled / failed
+    """
+
+    def __init__(self, player, text, handle_id):
+        self.id = handle_id
+        self.text = text
+        self.state = "queued"
+        self.error = None
+        self._player = player
+        self._future = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """再生終了（またはキャンセル）まで待つ"""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """再生待ちなら取り除き、再生中なら止める"""
+        self._player.cancel(self)
+
+    def _finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        self._done.set()
+
+
+class PlaybackService:
+    """
+    合成ワーカープール + 順番どおりの再生キュー
+
+    - say() は合成をワーカーに投げ、再生キューに積んでハンドルをすぐ返す
+    - 再生スレッドは1本で、キューの順に合成の完了を待って再生する
+      （再生中に次の文の合成が進むので、文と文の間が空かない）
+    - say(interrupt=True) / stop() で再生中の文と待ちの文をすべて取り消す（バージイン）
+    """
+
+    def __init__(self, synthesize_fn, sink=None, workers=TTS_WORKERS):
+        """
+        Args:
+            synthesize_fn: text -> WAVのバイト列（通常は TtsCache.get_or_synthesize）
+            sink: 出力先（AplaySink / NullSink）
+            workers: 合成を並行して行う最大数
+        """
+        self.synthesize_fn = synthesize_fn
+        self.sink = sink or AplaySink()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tts-synth")
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._current = None
+        self._stream = None
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="tts-playback", daemon=True)
+        self._thread.start()
+
+    def say(self, text, interrupt=False):
+        """文を再生キューに積み、ハンドルを返す（ブロックしない）"""
+        if interrupt:
+            self.stop()
+        handle = PlaybackHandle(self, text, next(self._ids))
+        handle._future = self._executor.submit(self._synthesize, handle)
+        with self._cond:
+            self._queue.append(handle)
+            self._cond.notify()
+        return handle
+
+    def _synthesize(self, handle):
+        with self._cond:
+            if handle.state == "cancelled":
+                return None
+            handle.state = "synthesizing"
+        return self.synthesize_fn(handle.text)
+
+    def cancel(self, handle):
+        """指定の文を取り消す"""
+        with self._cond:
+            if handle.done:
+                return
+            if handle is self._current:
+                handle.state = "cancelled"
+                if self._stream is not None:
+                    self.sink.stop(self._stream)
+                return
+            try:
+                self._queue.remove(handle)
+            except ValueError:
+                pass
+        handle._future.cancel()
+        handle._finish("cancelled")
+
+    def stop(self):
+        """再生中の文と再生待ちの文をすべて取り消す"""
+        with self._cond:
+            pending = list(self._queue)
+            current = self._current
+        for handle in pending + ([current] if current else []):
+            self.cancel(handle)
+
+    def pending(self):
+        """再生待ち（再生中を含む）の件数"""
+        with self._cond:
+            return len(self._queue) + (1 if self._current else 0)
+
+    def close(self):
+        """すべて取り消して停止"""
+        self.stop()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                handle = self._current = self._queue.popleft()
+            try:
+                wav = handle._future.result()
+            except Exception as e:
+                with self._cond:
+                    self._current = None
+                if not handle.done:
+                    logger.error(f"❌ 音声合成エラー ({handle.text}): {e}")
+                    handle._finish("failed", str(e))
+                continue
+
+            with self._cond:
+                if handle.state == "cancelled":
+                    self._current = None
+                    handle._finish("cancelled")
+                    continue
+                handle.state = "playing"
+                self._stream = self.sink.open()
+            try:
+                self.sink.play(self._stream, wav)
+                error = None
+            except Exception as e:
+                error = str(e)
+                logger.error(f"❌ 再生エラー ({handle.text}): {e}")
+            with self._cond:
+                self._stream = None
+                self._current = None
+                if handle.state == "cancelled":
+                    handle._finish("cancelled")
+                else:
+                    handle._finish("failed" if error else "done", error)
+
+
+def get_player():
+    """再生サービスを遅延生成（合成はTTSキャッシュ経由）"""
+    global _player
+    cache = get_tts_cache()
+    with _cache_lock:
+        if _player is None:
+            _player = PlaybackService(cache.get_or_synthesize)
+    return _player
+
+
+def speak(text, interrupt=False):
+    """
+    テキストを読み上げる（再生キューに積むだけで、すぐに戻る）
+
+    Returns:
+        PlaybackHandle: wait() で再生終了を待てる、cancel() で取り消せる
+    """
+    logger.debug(f"System: {text}") # ログ確認用
+    return get_player().say(text, interrupt=interrupt)
+
 
 if __name__ == "__main__":
-    speak("お母さんスイッチ、システム起動。")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Open JTalk 音声合成")
+    parser.add_argument("text", nargs="?", default="お母さんスイッチ、システム起動。")
+    parser.add_argument("--prerender", action="store_true", help="応答の語彙をまとめて事前合成する")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    if args.prerender:
+        from attitude_analyzer import response_vocabulary
+        cache = get_tts_cache()
+        cache.prerender(response_vocabulary(), workers=args.workers)
+        print(f"📦 TTSキャッシュ: {cache.stats()}")
+    else:
+        speak(args.text).wait()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+起動時のウォームアップ
+重いモジュールの読み込みやモデルのロードをバックグラウンドスレッドで順に実行し、
+各ステップの進み具合と所要時間を記録する（/api/health・/api/ready で参照）
+
+    warmup = Warmup([("import", import_fn), ("encoder", load_fn)])
+    warmup.start()
+    warmup.wait(5.0)  # 完了していれば True
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SkipStep(Exception):
+    """前提がそろっていないためステップを飛ばす（モデルファイルがない場合など）"""
+
+
+class Warmup:
+    """
+    準備処理のステップを順に実行する
+
+    - ステップの状態: pending → running → done / skipped / failed
+    - 全体の状態: pending → running → ready（全ステップ成功・スキップ）/ degraded（失敗あり）
+    - あるステップが失敗したら、残りのステップは実行しない（skipped）
+    """
+
+    def __init__(self, steps):
+        self._steps = [
+            {"name": name, "fn": fn, "state": "pending", "seconds": None, "error": None}
+            for name, fn in steps
+        ]
+        self._done = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self._seconds = None
+        self.state = "pending"
+
+    def start(self):
+        """バックグラウンドスレッドで実行を始める（2回目以降は何もしない）"""
+        if self._thread is None:
+            self._started_at = time.perf_counter()
+            self.state = "running"
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def run(self):
+        """呼び出したスレッドで実行して完了まで待つ"""
+        self._started_at = time.perf_counter()
+        self.state = "running"
+        self._run()
+        return self
+
+    def _run(self):
+        failed = False
+        for step in self._steps:
+            if failed:
+                step["state"] = "skipped"
+                continue
+            step["state"] = "running"
+            start = time.perf_counter()
+            try:
+                step["fn"]()
+                step["state"] = "done"
+            except SkipStep as e:
+                step["state"] = "skipped"
+                step["error"] = str(e) or None
+            except Exception as e:
+                step["state"] = "failed"
+                step["error"] = str(e)
+                failed = True
+                logger.error(f"❌ ウォームアップ失敗 ({step['name']}): {e}")
+            step["seconds"] = time.perf_counter() - start
+            if step["state"] == "done":
+                logger.info(f"✅ ウォームアップ: {step['name']} ({step['seconds']:.2f}秒)")
+        self._seconds = time.perf_counter() - self._started_at
+        self.state = "degraded" if failed else "ready"
+        logger.info(f"🚀 ウォームアップ完了: {self.state} ({self._seconds:.2f}秒)")
+        self._done.set()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """完了まで最大 timeout 秒待つ（完了していれば True）"""
+        return self._done.wait(timeout)
+
+    def status(self):
+        """全体と各ステップの状態（JSON互換）"""
+        if self._seconds is not None:
+            elapsed = self._seconds
+        elif self._started_at is not None:
+            elapsed = time.perf_counter() - self._started_at
+        else:
+            elapsed = 0.0
+        return {
+            "state": self.state,
+            "seconds": round(elapsed, 3),
+            "steps": [
+                {
+                    "name": step["name"],
+                    "state": step["state"],
+                    "seconds": None if step["seconds"] is None else round(step["seconds"], 3),
+                    "error": step["error"]
+                }
+                for step in self._steps
+            ]
+        }